@@ -16,6 +16,11 @@ import plotly.graph_objects as go
 import numpy as np
 from datetime import datetime
 
+from src.od_matrix import ODMatrix, N_ZONES
+from src.result_store import list_results, read_dataset, count_csv_rows
+from src.trip_cube import TripCube
+from src.zone_index import ZoneIndex
+
 # 设置页面配置
 st.set_page_config(
     page_title="NYC Taxi Dashboard",
@@ -28,33 +33,490 @@ st.set_page_config(
 st.title("🚕 NYC Taxi 高级分析仪表板")
 st.markdown("---")
 
-# 加载数据函数
-@st.cache_data(ttl=300)
-def load_all_data():
-    """加载所有数据文件"""
-    data_dir = Path("data/processed")
-    data_dict = {}
-    
-    if not data_dir.exists():
-        st.error(f"数据目录不存在: {data_dir}")
-        return {}
-    
-    csv_files = list(data_dir.glob("*.csv"))
-    
-    for csv_file in csv_files:
-        try:
-            df = pd.read_csv(csv_file)
-            data_dict[csv_file.stem] = df
-        except Exception as e:
-            st.warning(f"无法读取 {csv_file.name}: {e}")
+DATA_DIR = Path("data/processed")
+OD_MATRIX_NAME = "od_matrix.npz"
+
+# 星期名称（Spark dayofweek 约定：1=周日）
+DAY_NAMES = {1: '周日', 2: '周一', 3: '周二', 4: '周三',
+             5: '周四', 6: '周五', 7: '周六'}
+
+def _fingerprint(path):
+    """文件指纹（修改时间 + 大小）- 处理器写出新结果时才会变化"""
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+# 加载数据函数 - 缓存以文件路径和指纹为键：文件没变就一直命中缓存，
+# 处理器发布新结果后下一次运行立即重新读取（不再依赖固定TTL）
+@st.cache_resource(max_entries=64, show_spinner=False)
+def _read_dataset(path, fingerprint):
+    """读取单个数据集
     
-    return data_dict
+    返回的DataFrame在所有会话间共享，使用方不能原地修改（需要时先copy）。
+    """
+    return read_dataset(path)
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _read_od_matrix(path, fingerprint):
+    """读取完整OD矩阵（只读共享）"""
+    return ODMatrix.load(path)
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _read_trip_cube(path, fingerprint):
+    """读取筛选立方体并转换为列数组（只读共享）"""
+    return TripCube(read_dataset(path))
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _read_zone_index(path, fingerprint):
+    """读取区域表并构建区域查找索引（只读共享）"""
+    return ZoneIndex(read_dataset(path))
+
+def get_dataset(name):
+    """按需加载一个数据集（不存在或读取失败时返回None）"""
+    entry = catalog.get(name)
+    if entry is None:
+        return None
+    path = entry["path"]
+    try:
+        return _read_dataset(str(path), _fingerprint(path))
+    except Exception as e:
+        st.warning(f"无法读取 {path.name}: {e}")
+        return None
+
+def has_data(name):
+    """数据集存在且非空"""
+    df = get_dataset(name)
+    return df is not None and len(df) > 0
+
+def data_fingerprints():
+    """当前所有数据集（含OD矩阵）的指纹"""
+    fingerprints = {name: _fingerprint(entry["path"]) for name, entry in catalog.items()}
+    od_path = DATA_DIR / OD_MATRIX_NAME
+    if od_path.exists():
+        fingerprints[od_path.stem] = _fingerprint(od_path)
+    return fingerprints
+
+def dataset_rows(name):
+    """数据集行数 - 优先使用manifest中的记录，CSV只数行，不为统计行数读取数据"""
+    entry = catalog[name]
+    if entry["rows"] is not None:
+        return entry["rows"]
+    if entry["path"].suffix == ".csv":
+        return count_csv_rows(entry["path"])
+    return len(get_dataset(name))
+
+def load_od_matrix():
+    """加载完整OD矩阵（可选，不存在时返回None）"""
+    od_path = DATA_DIR / OD_MATRIX_NAME
+    if not od_path.exists():
+        return None
+    try:
+        return _read_od_matrix(str(od_path), _fingerprint(od_path))
+    except Exception as e:
+        st.warning(f"无法读取 {od_path.name}: {e}")
+        return None
+
+def load_trip_cube():
+    """加载筛选立方体（可选，不存在或读取失败时返回None）"""
+    entry = catalog.get('trip_cube')
+    if entry is None:
+        return None
+    try:
+        return _read_trip_cube(str(entry["path"]), _fingerprint(entry["path"]))
+    except Exception as e:
+        st.warning(f"无法读取 {entry['path'].name}: {e}")
+        return None
+
+def load_zone_index():
+    """加载区域查找索引（不存在或读取失败时返回None）"""
+    entry = catalog.get('taxi_zones_processed')
+    if entry is None:
+        return None
+    try:
+        return _read_zone_index(str(entry["path"]), _fingerprint(entry["path"]))
+    except Exception as e:
+        st.warning(f"无法读取 {entry['path'].name}: {e}")
+        return None
+
+def source_fingerprint(name):
+    """数据集（或 "od_matrix"）的指纹，用作图表缓存键；不存在时为None"""
+    if name in catalog:
+        return _fingerprint(catalog[name]["path"])
+    od_path = DATA_DIR / OD_MATRIX_NAME
+    if name == od_path.stem and od_path.exists():
+        return _fingerprint(od_path)
+    return None
+
+# 图表构建函数 - 以数据集指纹和参数为缓存键，控件交互引起的重跑直接复用
+# 已构建的图表（排序、截断和悬停文本只在数据变化时重新计算）。
+# 返回的图表在会话间共享，不能原地修改。
+@st.cache_resource(max_entries=4, show_spinner=False)
+def top_routes_figure(source, fingerprint):
+    """Top 15 热门路线柱状图 - source 为 "od_matrix" 或 "hot_routes" """
+    # 按行程数排序，取前15条（优先使用完整OD矩阵）
+    if source == "od_matrix":
+        top_routes = load_od_matrix().top_k(15)
+    else:
+        top_routes = get_dataset('hot_routes').sort_values('trip_count', ascending=False).head(15)
+    return routes_chart(top_routes)
+
+def routes_chart(top_routes):
+    """热门路线柱状图"""
+    x_labels = top_routes['PULocationID'].astype(str) + ' → ' + top_routes['DOLocationID'].astype(str)
+
+    fig = go.Figure(data=[
+        go.Bar(
+            x=x_labels.tolist(),
+            y=top_routes['trip_count'].tolist()
+        )
+    ])
+
+    fig.update_layout(
+        title='Top 15 热门路线',
+        xaxis_title='路线 (上车→下车)',
+        yaxis_title='行程数',
+        xaxis_tickangle=45,
+        height=500
+    )
+    return fig
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def hourly_figure(fingerprint):
+    """每小时行程折线图，同时返回高峰时段所在行"""
+    return hourly_chart(get_dataset('hourly_traffic'))
+
+def hourly_chart(hourly):
+    """每小时行程折线图和高峰时段所在行"""
+    fig = go.Figure(data=[
+        go.Scatter(
+            x=hourly['pickup_hour'].tolist(),
+            y=hourly['trip_count'].tolist(),
+            mode='lines+markers',
+            name='行程数'
+        )
+    ])
+
+    fig.update_layout(
+        title='每小时行程分布',
+        xaxis_title='小时',
+        yaxis_title='行程数',
+        xaxis=dict(tickmode='linear', dtick=1)
+    )
+
+    # 找到高峰时段
+    peak_hour = hourly.loc[hourly['trip_count'].idxmax()]
+    return fig, peak_hour
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def daily_figure(fingerprint):
+    """星期行程柱状图"""
+    return daily_chart(get_dataset('daily_traffic'))
+
+def daily_chart(daily):
+    """星期行程柱状图"""
+    # 映射星期名称
+    day_names = daily['pickup_dayofweek'].map(DAY_NAMES)
+
+    fig = go.Figure(data=[
+        go.Bar(
+            x=day_names.tolist(),
+            y=daily['trip_count'].tolist()
+        )
+    ])
+
+    fig.update_layout(
+        title='星期行程分布',
+        xaxis_title='星期',
+        yaxis_title='行程数'
+    )
+    return fig
+
+# 热点柱状图的列和标题
+HOTSPOT_CHARTS = {
+    'pickup_hotspots': ('PULocationID', 'pickup_count', '上车热点区域 TOP 10', '上车次数'),
+    'dropoff_hotspots': ('DOLocationID', 'dropoff_count', '下车热点区域 TOP 10', '下车次数'),
+}
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def hotspot_figure(name, fingerprint):
+    """上车/下车热点 TOP 10 柱状图"""
+    count_col = HOTSPOT_CHARTS[name][1]
+
+    # 按次数排序，取前10条
+    return hotspot_chart(name, get_dataset(name).sort_values(count_col, ascending=False).head(10))
+
+def hotspot_chart(name, top):
+    """热点柱状图"""
+    id_col, count_col, title, yaxis_title = HOTSPOT_CHARTS[name]
+
+    fig = go.Figure(data=[
+        go.Bar(
+            x=top[id_col].astype(str).tolist(),
+            y=top[count_col].tolist()
+        )
+    ])
+
+    fig.update_layout(
+        title=title,
+        xaxis_title='区域ID',
+        yaxis_title=yaxis_title
+    )
+    return fig
 
-# 显示加载状态
-with st.spinner("正在加载数据..."):
-    data = load_all_data()
+@st.cache_resource(max_entries=4, show_spinner=False)
+def borough_flow_figure(fingerprint):
+    """行政区间流向热力图 - 行政区由Spark预处理时标注，这里只做透视"""
+    flows = get_dataset('borough_flows')
+    matrix = flows.pivot_table(index='pickup_borough', columns='dropoff_borough',
+                               values='trip_count', aggfunc='sum', fill_value=0)
 
-if not data:
+    fig = go.Figure(data=[
+        go.Heatmap(
+            z=matrix.values,
+            x=matrix.columns.tolist(),
+            y=matrix.index.tolist(),
+            colorscale='Blues',
+            hovertemplate='%{y} → %{x}<br>行程数: %{z:,}<extra></extra>'
+        )
+    ])
+
+    fig.update_layout(
+        title='行政区间流向',
+        xaxis_title='下车行政区',
+        yaxis_title='上车行政区'
+    )
+    return fig
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def fare_histogram_figure(fingerprint):
+    """热门路线平均费用分布直方图"""
+    hot_routes = get_dataset('hot_routes')
+
+    fig = go.Figure(data=[
+        go.Histogram(
+            x=hot_routes['avg_fare'].tolist(),
+            nbinsx=20
+        )
+    ])
+
+    fig.update_layout(
+        title='费用分布直方图',
+        xaxis_title='平均费用 ($)',
+        yaxis_title='频次'
+    )
+    return fig
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def fare_bubble_figure(fingerprint):
+    """前50条热门路线的距离-费用气泡图，同时返回相关系数（没有数据时返回 (None, None)）"""
+    # 取前50条热门路线进行分析
+    scatter_data = get_dataset('hot_routes').sort_values('trip_count', ascending=False).head(50)
+    if len(scatter_data) == 0:
+        return None, None
+
+    # 计算气泡大小 - 这里改小了气泡的半径
+    # 原始：bubble_size = scatter_data['trip_count'] / scatter_data['trip_count'].max() * 40
+    # 改小：使用更小的乘数，比如15，并且调整sizeref使气泡更小
+
+    # 调整气泡大小的计算方法
+    bubble_size = scatter_data['trip_count'] / scatter_data['trip_count'].max() * 20  # 从40改小到20
+
+    fig = go.Figure(data=[
+        go.Scatter(
+            x=scatter_data['avg_distance'].tolist(),
+            y=scatter_data['avg_fare'].tolist(),
+            mode='markers',
+            marker=dict(
+                size=bubble_size.tolist(),
+                sizemode='diameter',  # 直径模式
+                sizeref=2.0,  # 增大sizeref会使气泡更小，从0.1增加到2.0
+                sizemin=1,  # 最小尺寸
+                color=scatter_data['trip_count'].tolist(),
+                colorscale='Viridis',
+                showscale=True,
+                colorbar=dict(title='行程数')
+            ),
+            text=[f"路线: {pu}→{do}<br>行程数: {count}<br>距离: {dist:.2f}<br>费用: ${fare:.2f}"
+                  for pu, do, count, dist, fare in zip(
+                      scatter_data['PULocationID'],
+                      scatter_data['DOLocationID'],
+                      scatter_data['trip_count'],
+                      scatter_data['avg_distance'],
+                      scatter_data['avg_fare']
+                  )],
+            hoverinfo='text'
+        )
+    ])
+
+    # 自动调整坐标轴范围，让点更分散
+    x_min = scatter_data['avg_distance'].min()
+    x_max = scatter_data['avg_distance'].max()
+    y_min = scatter_data['avg_fare'].min()
+    y_max = scatter_data['avg_fare'].max()
+
+    # 添加15%的边距
+    x_padding = (x_max - x_min) * 0.15
+    y_padding = (y_max - y_min) * 0.15
+
+    # 确保最小值不为负数（如果数据都是正数）
+    x_range = [max(0, x_min - x_padding), x_max + x_padding]
+    y_range = [max(0, y_min - y_padding), y_max + y_padding]
+
+    fig.update_layout(
+        title='距离 vs 费用关系 (气泡大小表示行程数)',
+        xaxis_title='平均距离',
+        yaxis_title='平均费用 ($)',
+        height=500,
+        xaxis=dict(range=x_range),
+        yaxis=dict(range=y_range)
+    )
+
+    # 计算相关系数
+    correlation = scatter_data['avg_distance'].corr(scatter_data['avg_fare'])
+    return fig, correlation
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def passenger_figure(fingerprint):
+    """乘客数量分布柱状图"""
+    passenger_stats = get_dataset('passenger_stats')
+
+    fig = go.Figure(data=[
+        go.Bar(
+            x=passenger_stats['passenger_count'].tolist(),
+            y=passenger_stats['trip_count'].tolist()
+        )
+    ])
+
+    fig.update_layout(
+        title='乘客数量分布',
+        xaxis_title='乘客数',
+        yaxis_title='行程数'
+    )
+    return fig
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def cluster_bar_figure(fingerprint):
+    """聚类行程分布柱状图"""
+    cluster_stats = get_dataset('cluster_stats')
+
+    fig = go.Figure(data=[
+        go.Bar(
+            x=cluster_stats['prediction'].astype(str).tolist(),
+            y=cluster_stats['trip_count'].tolist()
+        )
+    ])
+
+    fig.update_layout(
+        title='聚类行程分布',
+        xaxis_title='聚类编号',
+        yaxis_title='行程数'
+    )
+    return fig
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def cluster_scatter_figure(fingerprint):
+    """聚类特征散点图（每个聚类一条轨迹）"""
+    cluster_stats = get_dataset('cluster_stats')
+
+    # 修复聚类特征散点图颜色问题
+    fig = go.Figure()
+
+    # 为每个聚类创建单独的数据点
+    unique_clusters = cluster_stats['prediction'].unique()
+
+    # 使用不同的颜色和标记符号
+    colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b']
+    markers = ['circle', 'square', 'diamond', 'cross', 'x', 'triangle-up']
+
+    for i, cluster in enumerate(unique_clusters):
+        cluster_data = cluster_stats[cluster_stats['prediction'] == cluster]
+
+        # 计算气泡大小 - 减小气泡尺寸
+        bubble_size = cluster_data['trip_count'] / cluster_stats['trip_count'].max() * 25
+
+        fig.add_trace(go.Scatter(
+            x=cluster_data['avg_trip_distance'].tolist(),
+            y=cluster_data['avg_total_amount'].tolist(),
+            mode='markers',
+            name=f'聚类 {cluster}',
+            marker=dict(
+                size=bubble_size.tolist(),
+                sizemode='diameter',
+                sizeref=2.0,  # 增大sizeref使气泡更小
+                color=colors[i % len(colors)],  # 使用离散颜色
+                symbol=markers[i % len(markers)],  # 使用不同标记符号
+                line=dict(width=1, color='black')  # 添加边框
+            ),
+            text=[f"聚类: {pred}<br>行程数: {count}<br>距离: {dist:.2f}<br>费用: ${amt:.2f}"
+                  for pred, count, dist, amt in zip(
+                      cluster_data['prediction'],
+                      cluster_data['trip_count'],
+                      cluster_data['avg_trip_distance'],
+                      cluster_data['avg_total_amount']
+                  )],
+            hoverinfo='text'
+        ))
+
+    fig.update_layout(
+        title='聚类特征散点图',
+        xaxis_title='平均距离',
+        yaxis_title='平均总费用 ($)',
+        showlegend=True
+    )
+    return fig
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def hotspot_map_data(name, hotspot_fingerprint, zones_fingerprint):
+    """热点数据附加区域坐标，返回 st.map 使用的 (lat, lon, 次数, 区域ID) 表"""
+    id_col, count_col = HOTSPOT_CHARTS[name][:2]
+    hotspots = get_dataset(name)
+
+    # 按区域ID数组查索引，不与区域表 merge
+    locations = load_zone_index().lookup(hotspots[id_col].to_numpy())
+    hotspot_map = pd.DataFrame({
+        'lat': locations['latitude'].to_numpy(),
+        'lon': locations['longitude'].to_numpy(),
+        count_col: hotspots[count_col].to_numpy(),
+        id_col: hotspots[id_col].to_numpy(),
+    })
+
+    # 过滤掉没有位置信息的行
+    return hotspot_map.dropna(subset=['lat', 'lon']).reset_index(drop=True)
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def trip_cube_fare_max(fingerprint):
+    """路线平均费用的最大值（向上取整），费用筛选滑块的上界"""
+    return float(np.ceil(load_trip_cube().max_route_fare()))
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def filtered_cube(fingerprint, hours, weekdays, pickup_zones, fare_range):
+    """按筛选条件切片立方体，返回热门路线、热点、小时和星期分布
+
+    以立方体指纹和筛选条件为缓存键，切换视图或重复选择同一组条件时直接复用。
+    """
+    cube = load_trip_cube()
+    mask = cube.select(hours=hours, weekdays=weekdays, pickup_zones=pickup_zones, fare_range=fare_range)
+
+    results = {
+        "trip_count": cube.trip_count(mask),
+        "hot_routes": cube.od_matrix(mask).top_k(15),
+        "hourly_traffic": cube.rollup('pickup_hour', mask),
+        "daily_traffic": cube.rollup('pickup_dayofweek', mask),
+    }
+    # 下车区域只统计立方体里的热门路线，上车区域包含全部行程
+    for name in ('pickup_hotspots', 'dropoff_hotspots'):
+        id_col, count_col = HOTSPOT_CHARTS[name][:2]
+        rolled = cube.rollup(id_col, mask).sort_values('trip_count', ascending=False, kind='stable').head(10)
+        results[name] = rolled[[id_col, 'trip_count']].rename(columns={'trip_count': count_col}).reset_index(drop=True)
+    return results
+
+if not DATA_DIR.exists():
+    st.error(f"数据目录不存在: {DATA_DIR}")
+    st.stop()
+
+# 只列出数据集（读取manifest和文件名），各视图渲染时再加载自己需要的数据
+catalog = list_results(DATA_DIR)
+
+if not catalog:
     st.error("❌ 没有找到数据文件")
     st.stop()
 
@@ -65,203 +527,201 @@ st.subheader("📊 数据概览")
 col1, col2, col3, col4 = st.columns(4)
 
 with col1:
-    st.metric("数据文件数", len(data))
+    st.metric("数据文件数", len(catalog))
 
 with col2:
-    total_rows = sum(len(df) for df in data.values())
+    # 筛选立方体是查询索引而不是结果表，行数接近明细行程数，不计入
+    total_rows = sum(dataset_rows(name) for name in catalog if name != 'trip_cube')
     st.metric("总数据行数", f"{total_rows:,}")
 
 with col3:
-    if 'hot_routes' in data:
-        st.metric("热门路线数", f"{len(data['hot_routes']):,}")
+    if 'hot_routes' in catalog:
+        st.metric("热门路线数", f"{dataset_rows('hot_routes'):,}")
     else:
         st.metric("热门路线数", "0")
 
 with col4:
-    if 'hot_routes' in data:
-        total_trips = data['hot_routes']['trip_count'].sum()
+    if has_data('hot_routes'):
+        total_trips = get_dataset('hot_routes')['trip_count'].sum()
         st.metric("总行程数", f"{int(total_trips):,}")
     else:
         st.metric("总行程数", "0")
 
-# 创建标签页
-tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
+# 侧边栏
+st.sidebar.title("🔧 控制面板")
+st.sidebar.markdown("---")
+
+# 筛选条件 - 在处理器发布的立方体上做向量化切片，不重新处理明细数据；
+# 各项都是默认值（不筛选）时，视图继续使用预先计算好的结果
+cube_filters = None
+trip_cube = load_trip_cube()
+if trip_cube is not None:
+    st.sidebar.subheader("🎚️ 筛选条件")
+    
+    hour_range = st.sidebar.slider("上车时段", 0, 23, (0, 23), key="filter_hours")
+    day_names = st.sidebar.multiselect("星期", list(DAY_NAMES.values()), default=list(DAY_NAMES.values()),
+                                       key="filter_weekdays")
+    weekdays = [day for day, day_name in DAY_NAMES.items() if day_name in day_names]
+    
+    pickup_zones = None
+    zone_index = load_zone_index()
+    if zone_index is not None and zone_index.boroughs:
+        boroughs = sorted(zone_index.boroughs)
+        selected_boroughs = st.sidebar.multiselect("上车行政区", boroughs, default=boroughs,
+                                                   key="filter_boroughs")
+        if set(selected_boroughs) != set(boroughs):
+            pickup_zones = tuple(zone_index.ids_in_boroughs(selected_boroughs).tolist())
+    
+    fare_max = trip_cube_fare_max(source_fingerprint('trip_cube'))
+    fare_range = st.sidebar.slider("路线平均费用 ($)", 0.0, fare_max, (0.0, fare_max), step=1.0,
+                                   key="filter_fare")
+    
+    filters = (
+        None if hour_range == (0, 23) else tuple(range(hour_range[0], hour_range[1] + 1)),
+        None if set(weekdays) == set(DAY_NAMES) else tuple(sorted(weekdays)),
+        pickup_zones,
+        None if fare_range == (0.0, fare_max) else fare_range,
+    )
+    if any(condition is not None for condition in filters):
+        cube_filters = filters
+    st.sidebar.markdown("---")
+
+def filtered_results():
+    """当前筛选条件下的切片结果（未设置筛选时为None），并显示筛选后的行程数"""
+    if cube_filters is None:
+        return None
+    results = filtered_cube(source_fingerprint('trip_cube'), *cube_filters)
+    st.caption(f"🎚️ 已应用筛选: {results['trip_count']:,} / {trip_cube.total_trips:,} 次行程")
+    if results['trip_count'] == 0:
+        st.info("没有符合筛选条件的行程")
+    return results
+
+# 视图切换 - 只执行当前视图的代码，也只加载它需要的数据集
+# （st.tabs 每次运行都会执行所有标签页的内容）
+VIEWS = [
     "🔥 热门路线", "⏰ 时间分析", "📍 热点区域", 
     "💰 费用分析", "👥 乘客统计", "📊 聚类分析", "🗺️ 地图视图"
-])
+]
+view = st.radio("视图", VIEWS, horizontal=True, label_visibility="collapsed", key="view")
 
-with tab1:
+if view == VIEWS[0]:
     st.subheader("🔥 热门路线分析")
     
-    if 'hot_routes' in data and len(data['hot_routes']) > 0:
-        hot_routes = data['hot_routes'].copy()
-        
-        # 按行程数排序，取前15条
-        top_routes = hot_routes.sort_values('trip_count', ascending=False).head(15)
-        
-        x_labels = top_routes['PULocationID'].astype(str) + ' → ' + top_routes['DOLocationID'].astype(str)
-        
-        fig = go.Figure(data=[
-            go.Bar(
-                x=x_labels.tolist(),
-                y=top_routes['trip_count'].tolist()
-            )
-        ])
-        
-        fig.update_layout(
-            title='Top 15 热门路线',
-            xaxis_title='路线 (上车→下车)',
-            yaxis_title='行程数',
-            xaxis_tickangle=45,
-            height=500
-        )
-        
+    od_matrix = load_od_matrix()
+    selection = filtered_results()
+    
+    if selection is not None:
+        if len(selection['hot_routes']) > 0:
+            st.plotly_chart(routes_chart(selection['hot_routes']), use_container_width=True)
+    elif od_matrix is not None or has_data('hot_routes'):
+        source = "od_matrix" if od_matrix is not None else "hot_routes"
+        fig = top_routes_figure(source, source_fingerprint(source))
         st.plotly_chart(fig, use_container_width=True)
         
     else:
         st.info("热门路线数据未找到")
+    
+    # 任意路线查询（需要OD矩阵）
+    if od_matrix is not None:
+        st.subheader("🔎 路线查询")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            pu_id = int(st.number_input("上车区域ID", min_value=1, max_value=N_ZONES - 1, value=1, step=1))
+        with col2:
+            do_id = int(st.number_input("下车区域ID", min_value=1, max_value=N_ZONES - 1, value=1, step=1))
+        
+        route = od_matrix.pair(pu_id, do_id)
+        if route['trip_count'] > 0:
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("行程数", f"{int(route['trip_count']):,}")
+            col2.metric("平均费用", f"${route['avg_fare']:.2f}")
+            col3.metric("平均距离", f"{route['avg_distance']:.2f}")
+            col4.metric("平均时长(分钟)", f"{route['avg_duration']:.1f}")
+        else:
+            st.info(f"路线 {pu_id} → {do_id} 没有行程记录")
+        
+        st.write(f"从区域 {pu_id} 出发的热门目的地:")
+        st.dataframe(od_matrix.origin_row(pu_id).head(10), use_container_width=True)
 
-with tab2:
+if view == VIEWS[1]:
     st.subheader("⏰ 时间分析")
     
+    selection = filtered_results()
     col1, col2 = st.columns(2)
     
     with col1:
-        if 'hourly_traffic' in data and len(data['hourly_traffic']) > 0:
-            hourly = data['hourly_traffic'].copy()
-            
-            fig = go.Figure(data=[
-                go.Scatter(
-                    x=hourly['pickup_hour'].tolist(),
-                    y=hourly['trip_count'].tolist(),
-                    mode='lines+markers',
-                    name='行程数'
-                )
-            ])
-            
-            fig.update_layout(
-                title='每小时行程分布',
-                xaxis_title='小时',
-                yaxis_title='行程数',
-                xaxis=dict(tickmode='linear', dtick=1)
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
-            
-            # 找到高峰时段
-            if len(hourly) > 0:
-                peak_hour = hourly.loc[hourly['trip_count'].idxmax()]
+        if selection is not None:
+            if len(selection['hourly_traffic']) > 0:
+                fig, peak_hour = hourly_chart(selection['hourly_traffic'])
+                st.plotly_chart(fig, use_container_width=True)
                 st.info(f"**高峰时段**: {int(peak_hour['pickup_hour'])}:00，行程数: {int(peak_hour['trip_count']):,}")
-                
+        elif has_data('hourly_traffic'):
+            fig, peak_hour = hourly_figure(source_fingerprint('hourly_traffic'))
+            st.plotly_chart(fig, use_container_width=True)
+
+            # 高峰时段
+            st.info(f"**高峰时段**: {int(peak_hour['pickup_hour'])}:00，行程数: {int(peak_hour['trip_count']):,}")
+
         else:
             st.info("小时流量数据未找到")
-    
+
     with col2:
-        if 'daily_traffic' in data and len(data['daily_traffic']) > 0:
-            daily = data['daily_traffic'].copy()
-            
-            # 映射星期名称
-            days_map = {1: '周日', 2: '周一', 3: '周二', 4: '周三', 
-                      5: '周四', 6: '周五', 7: '周六'}
-            daily['day_name'] = daily['pickup_dayofweek'].map(days_map)
-            
-            fig = go.Figure(data=[
-                go.Bar(
-                    x=daily['day_name'].tolist(),
-                    y=daily['trip_count'].tolist()
-                )
-            ])
-            
-            fig.update_layout(
-                title='星期行程分布',
-                xaxis_title='星期',
-                yaxis_title='行程数'
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
-                
+        if selection is not None:
+            if len(selection['daily_traffic']) > 0:
+                st.plotly_chart(daily_chart(selection['daily_traffic']), use_container_width=True)
+        elif has_data('daily_traffic'):
+            st.plotly_chart(daily_figure(source_fingerprint('daily_traffic')), use_container_width=True)
+
         else:
             st.info("每日流量数据未找到")
 
-with tab3:
+if view == VIEWS[2]:
     st.subheader("📍 热点区域分析")
     
+    selection = filtered_results()
     col1, col2 = st.columns(2)
     
     with col1:
-        if 'pickup_hotspots' in data and len(data['pickup_hotspots']) > 0:
-            pickup_hotspots = data['pickup_hotspots'].copy()
-            
-            # 按上车次数排序，取前10条
-            top_pickup = pickup_hotspots.sort_values('pickup_count', ascending=False).head(10)
-            
-            fig = go.Figure(data=[
-                go.Bar(
-                    x=top_pickup['PULocationID'].astype(str).tolist(),
-                    y=top_pickup['pickup_count'].tolist()
-                )
-            ])
-            
-            fig.update_layout(
-                title='上车热点区域 TOP 10',
-                xaxis_title='区域ID',
-                yaxis_title='上车次数'
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
-                
+        if selection is not None:
+            if len(selection['pickup_hotspots']) > 0:
+                st.plotly_chart(hotspot_chart('pickup_hotspots', selection['pickup_hotspots']),
+                                use_container_width=True)
+        elif has_data('pickup_hotspots'):
+            st.plotly_chart(hotspot_figure('pickup_hotspots', source_fingerprint('pickup_hotspots')),
+                            use_container_width=True)
         else:
             st.info("上车热点数据未找到")
     
     with col2:
-        if 'dropoff_hotspots' in data and len(data['dropoff_hotspots']) > 0:
-            dropoff_hotspots = data['dropoff_hotspots'].copy()
-            
-            # 按下车次数排序，取前10条
-            top_dropoff = dropoff_hotspots.sort_values('dropoff_count', ascending=False).head(10)
-            
-            fig = go.Figure(data=[
-                go.Bar(
-                    x=top_dropoff['DOLocationID'].astype(str).tolist(),
-                    y=top_dropoff['dropoff_count'].tolist()
-                )
-            ])
-            
-            fig.update_layout(
-                title='下车热点区域 TOP 10',
-                xaxis_title='区域ID',
-                yaxis_title='下车次数'
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
-                
+        if selection is not None:
+            if len(selection['dropoff_hotspots']) > 0:
+                st.plotly_chart(hotspot_chart('dropoff_hotspots', selection['dropoff_hotspots']),
+                                use_container_width=True)
+        elif has_data('dropoff_hotspots'):
+            st.plotly_chart(hotspot_figure('dropoff_hotspots', source_fingerprint('dropoff_hotspots')),
+                            use_container_width=True)
         else:
             st.info("下车热点数据未找到")
+    
+    # 行政区统计（Spark处理器输出）
+    if has_data('borough_flows'):
+        st.plotly_chart(borough_flow_figure(source_fingerprint('borough_flows')), use_container_width=True)
+    if has_data('borough_stats'):
+        st.dataframe(get_dataset('borough_stats'), use_container_width=True)
 
-with tab4:
+if view == VIEWS[3]:
     st.subheader("💰 费用分析")
     
-    if 'hot_routes' in data and len(data['hot_routes']) > 0:
-        hot_routes = data['hot_routes'].copy()
+    if has_data('hot_routes'):
+        hot_routes = get_dataset('hot_routes')
+        fingerprint = source_fingerprint('hot_routes')
         
         col1, col2 = st.columns(2)
         
         with col1:
             # 费用分布直方图
-            fig = go.Figure(data=[
-                go.Histogram(
-                    x=hot_routes['avg_fare'].tolist(),
-                    nbinsx=20
-                )
-            ])
-            
-            fig.update_layout(
-                title='费用分布直方图',
-                xaxis_title='平均费用 ($)',
-                yaxis_title='频次'
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(fare_histogram_figure(fingerprint), use_container_width=True)
             
         with col2:
             # 费用统计
@@ -276,249 +736,83 @@ with tab4:
         # 距离-费用关系气泡图
         st.subheader("📏 距离 vs 费用关系")
         
-        # 取前50条热门路线进行分析
-        scatter_data = hot_routes.sort_values('trip_count', ascending=False).head(50)
-        
-        if len(scatter_data) > 0:
-            # 计算气泡大小 - 这里改小了气泡的半径
-            # 原始：bubble_size = scatter_data['trip_count'] / scatter_data['trip_count'].max() * 40
-            # 改小：使用更小的乘数，比如15，并且调整sizeref使气泡更小
-            
-            # 调整气泡大小的计算方法
-            bubble_size = scatter_data['trip_count'] / scatter_data['trip_count'].max() * 20  # 从40改小到20
-            
-            fig = go.Figure(data=[
-                go.Scatter(
-                    x=scatter_data['avg_distance'].tolist(),
-                    y=scatter_data['avg_fare'].tolist(),
-                    mode='markers',
-                    marker=dict(
-                        size=bubble_size.tolist(),
-                        sizemode='diameter',  # 直径模式
-                        sizeref=2.0,  # 增大sizeref会使气泡更小，从0.1增加到2.0
-                        sizemin=1,  # 最小尺寸
-                        color=scatter_data['trip_count'].tolist(),
-                        colorscale='Viridis',
-                        showscale=True,
-                        colorbar=dict(title='行程数')
-                    ),
-                    text=[f"路线: {pu}→{do}<br>行程数: {count}<br>距离: {dist:.2f}<br>费用: ${fare:.2f}" 
-                          for pu, do, count, dist, fare in zip(
-                              scatter_data['PULocationID'], 
-                              scatter_data['DOLocationID'],
-                              scatter_data['trip_count'],
-                              scatter_data['avg_distance'],
-                              scatter_data['avg_fare']
-                          )],
-                    hoverinfo='text'
-                )
-            ])
-            
-            # 自动调整坐标轴范围，让点更分散
-            x_min = scatter_data['avg_distance'].min()
-            x_max = scatter_data['avg_distance'].max()
-            y_min = scatter_data['avg_fare'].min()
-            y_max = scatter_data['avg_fare'].max()
-            
-            # 添加15%的边距
-            x_padding = (x_max - x_min) * 0.15
-            y_padding = (y_max - y_min) * 0.15
-            
-            # 确保最小值不为负数（如果数据都是正数）
-            x_range = [max(0, x_min - x_padding), x_max + x_padding]
-            y_range = [max(0, y_min - y_padding), y_max + y_padding]
-            
-            fig.update_layout(
-                title='距离 vs 费用关系 (气泡大小表示行程数)',
-                xaxis_title='平均距离',
-                yaxis_title='平均费用 ($)',
-                height=500,
-                xaxis=dict(range=x_range),
-                yaxis=dict(range=y_range)
-            )
-            
+        fig, correlation = fare_bubble_figure(fingerprint)
+        if fig is not None:
             st.plotly_chart(fig, use_container_width=True)
-            
-            # 计算相关系数
-            correlation = scatter_data['avg_distance'].corr(scatter_data['avg_fare'])
             st.metric("距离-费用相关系数", f"{correlation:.3f}")
             
     else:
         st.info("热门路线数据未找到")
 
-with tab5:
+if view == VIEWS[4]:
     st.subheader("👥 乘客统计")
     
-    if 'passenger_stats' in data and len(data['passenger_stats']) > 0:
-        passenger_stats = data['passenger_stats'].copy()
-        
+    if has_data('passenger_stats'):
         col1, col2 = st.columns(2)
         
         with col1:
-            fig = go.Figure(data=[
-                go.Bar(
-                    x=passenger_stats['passenger_count'].tolist(),
-                    y=passenger_stats['trip_count'].tolist()
-                )
-            ])
-            
-            fig.update_layout(
-                title='乘客数量分布',
-                xaxis_title='乘客数',
-                yaxis_title='行程数'
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(passenger_figure(source_fingerprint('passenger_stats')), use_container_width=True)
         
         with col2:
             st.write("乘客统计详情:")
-            st.dataframe(passenger_stats, use_container_width=True)
+            st.dataframe(get_dataset('passenger_stats'), use_container_width=True)
     else:
         st.info("乘客统计数据未找到")
 
-with tab6:
+if view == VIEWS[5]:
     st.subheader("📊 聚类分析")
     
-    if 'cluster_stats' in data and len(data['cluster_stats']) > 0:
-        cluster_stats = data['cluster_stats'].copy()
+    if has_data('cluster_stats'):
+        fingerprint = source_fingerprint('cluster_stats')
         
         col1, col2 = st.columns(2)
         
         with col1:
-            fig = go.Figure(data=[
-                go.Bar(
-                    x=cluster_stats['prediction'].astype(str).tolist(),
-                    y=cluster_stats['trip_count'].tolist()
-                )
-            ])
-            
-            fig.update_layout(
-                title='聚类行程分布',
-                xaxis_title='聚类编号',
-                yaxis_title='行程数'
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(cluster_bar_figure(fingerprint), use_container_width=True)
         
         with col2:
-            if len(cluster_stats) >= 2:
-                # 修复聚类特征散点图颜色问题
-                fig = go.Figure()
-                
-                # 为每个聚类创建单独的数据点
-                unique_clusters = cluster_stats['prediction'].unique()
-                
-                # 使用不同的颜色和标记符号
-                colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b']
-                markers = ['circle', 'square', 'diamond', 'cross', 'x', 'triangle-up']
-                
-                for i, cluster in enumerate(unique_clusters):
-                    cluster_data = cluster_stats[cluster_stats['prediction'] == cluster]
-                    
-                    # 计算气泡大小 - 减小气泡尺寸
-                    bubble_size = cluster_data['trip_count'] / cluster_stats['trip_count'].max() * 25
-                    
-                    fig.add_trace(go.Scatter(
-                        x=cluster_data['avg_trip_distance'].tolist(),
-                        y=cluster_data['avg_total_amount'].tolist(),
-                        mode='markers',
-                        name=f'聚类 {cluster}',
-                        marker=dict(
-                            size=bubble_size.tolist(),
-                            sizemode='diameter',
-                            sizeref=2.0,  # 增大sizeref使气泡更小
-                            color=colors[i % len(colors)],  # 使用离散颜色
-                            symbol=markers[i % len(markers)],  # 使用不同标记符号
-                            line=dict(width=1, color='black')  # 添加边框
-                        ),
-                        text=[f"聚类: {pred}<br>行程数: {count}<br>距离: {dist:.2f}<br>费用: ${amt:.2f}" 
-                              for pred, count, dist, amt in zip(
-                                  cluster_data['prediction'],
-                                  cluster_data['trip_count'],
-                                  cluster_data['avg_trip_distance'],
-                                  cluster_data['avg_total_amount']
-                              )],
-                        hoverinfo='text'
-                    ))
-                
-                fig.update_layout(
-                    title='聚类特征散点图',
-                    xaxis_title='平均距离',
-                    yaxis_title='平均总费用 ($)',
-                    showlegend=True
-                )
-                
-                st.plotly_chart(fig, use_container_width=True)
+            if len(get_dataset('cluster_stats')) >= 2:
+                st.plotly_chart(cluster_scatter_figure(fingerprint), use_container_width=True)
             else:
                 st.info("聚类数据点不足，无法显示散点图")
     else:
         st.info("聚类统计数据未找到")
 
-with tab7:
+if view == VIEWS[6]:
     st.subheader("🗺️ 地图视图")
     
     # 检查是否有位置数据
-    if 'taxi_zones_processed' in data and len(data['taxi_zones_processed']) > 0:
-        zones_df = data['taxi_zones_processed'].copy()
-        
+    zone_index = load_zone_index()
+    if zone_index is not None:
         # 创建地图选项
         map_option = st.selectbox("选择地图类型:", 
                                  ["区域位置分布", "上车热点地图", "下车热点地图"])
         
         if map_option == "区域位置分布":
             # 显示所有区域的位置
-            st.map(zones_df[['latitude', 'longitude']].rename(
-                columns={'latitude': 'lat', 'longitude': 'lon'}
-            ))
-            st.caption(f"显示 {len(zones_df)} 个出租车区域")
+            ids = zone_index.location_ids
+            st.map(pd.DataFrame({'lat': zone_index.latitude[ids], 'lon': zone_index.longitude[ids]}).dropna())
+            st.caption(f"显示 {len(zone_index)} 个出租车区域")
         
         elif map_option == "上车热点地图":
-            if 'pickup_hotspots' in data and len(data['pickup_hotspots']) > 0:
-                pickup_hotspots = data['pickup_hotspots'].copy()
-                # 合并位置信息
-                pickup_map = pickup_hotspots.merge(
-                    zones_df, 
-                    left_on='PULocationID', 
-                    right_on='location_id',
-                    how='left'
-                )
-                
-                # 过滤掉没有位置信息的行
-                pickup_map = pickup_map.dropna(subset=['latitude', 'longitude'])
-                
-                if len(pickup_map) > 0:
-                    # 创建地图数据
-                    map_data = pickup_map[['latitude', 'longitude', 'pickup_count', 'PULocationID']].rename(
-                        columns={'latitude': 'lat', 'longitude': 'lon'}
-                    )
+            if has_data('pickup_hotspots'):
+                map_data = hotspot_map_data('pickup_hotspots', source_fingerprint('pickup_hotspots'),
+                                            source_fingerprint('taxi_zones_processed'))
+                if len(map_data) > 0:
                     st.map(map_data)
-                    st.caption(f"显示 {len(pickup_map)} 个上车热点区域")
+                    st.caption(f"显示 {len(map_data)} 个上车热点区域")
                 else:
                     st.warning("无法找到上车热点的位置信息")
             else:
                 st.info("上车热点数据未找到")
         
         elif map_option == "下车热点地图":
-            if 'dropoff_hotspots' in data and len(data['dropoff_hotspots']) > 0:
-                dropoff_hotspots = data['dropoff_hotspots'].copy()
-                # 合并位置信息
-                dropoff_map = dropoff_hotspots.merge(
-                    zones_df, 
-                    left_on='DOLocationID', 
-                    right_on='location_id',
-                    how='left'
-                )
-                
-                # 过滤掉没有位置信息的行
-                dropoff_map = dropoff_map.dropna(subset=['latitude', 'longitude'])
-                
-                if len(dropoff_map) > 0:
-                    # 创建地图数据
-                    map_data = dropoff_map[['latitude', 'longitude', 'dropoff_count', 'DOLocationID']].rename(
-                        columns={'latitude': 'lat', 'longitude': 'lon'}
-                    )
+            if has_data('dropoff_hotspots'):
+                map_data = hotspot_map_data('dropoff_hotspots', source_fingerprint('dropoff_hotspots'),
+                                            source_fingerprint('taxi_zones_processed'))
+                if len(map_data) > 0:
                     st.map(map_data)
-                    st.caption(f"显示 {len(dropoff_map)} 个下车热点区域")
+                    st.caption(f"显示 {len(map_data)} 个下车热点区域")
                 else:
                     st.warning("无法找到下车热点的位置信息")
             else:
@@ -526,24 +820,28 @@ with tab7:
     else:
         st.info("位置数据未找到，无法显示地图")
 
-# 侧边栏
-st.sidebar.title("🔧 控制面板")
-st.sidebar.markdown("---")
-
 # 应用信息
 st.sidebar.subheader("ℹ️ 应用信息")
 st.sidebar.write(f"更新时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
 # 数据文件信息
 st.sidebar.subheader("📁 数据文件")
-for name in sorted(data.keys()):
-    st.sidebar.write(f"• {name}: {len(data[name])}行")
+for name in sorted(catalog):
+    st.sidebar.write(f"• {name}: {dataset_rows(name)}行")
 
-# 刷新按钮
+# 刷新按钮 - 缓存按文件指纹失效，本次运行已经只重新读取了变化的数据集，
+# 这里报告相对上次查看有哪些数据集更新，不清空其他缓存
 st.sidebar.markdown("---")
+current_fingerprints = data_fingerprints()
 if st.sidebar.button("🔄 刷新数据"):
-    st.cache_data.clear()
-    st.rerun()
+    previous_fingerprints = st.session_state.get("data_fingerprints", {})
+    changed = sorted(name for name, fingerprint in current_fingerprints.items()
+                     if previous_fingerprints.get(name) != fingerprint)
+    if changed:
+        st.sidebar.success(f"已重新加载: {', '.join(changed)}")
+    else:
+        st.sidebar.info("数据没有变化")
+st.session_state["data_fingerprints"] = current_fingerprints
 
 # 页脚
 st.markdown("---")
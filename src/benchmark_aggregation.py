@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+聚合引擎基准测试 - 对比 groupby 与融合(bincount)引擎的 analyze_data 耗时
+"""
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# 添加项目根目录到Python路径
+current_file = Path(__file__).resolve()
+project_root = current_file.parent.parent
+sys.path.append(str(project_root))
+
+from src.pandas_processor import PandasDataProcessor
+
+
+def _time_analyze(processor, df, repeats):
+    """多次运行 analyze_data，返回最短耗时和最后一次结果"""
+    best = float("inf")
+    results = None
+    for _ in range(repeats):
+        work = df.copy()
+        start = time.perf_counter()
+        results = processor.analyze_data(work)
+        best = min(best, time.perf_counter() - start)
+    return best, results
+
+
+def _check_same_results(expected, actual):
+    """确认两个引擎的输出一致（按分组键排序后比较）"""
+    for name, frame in expected.items():
+        keys = [c for c in frame.columns if c.endswith("ID") or c in ("pickup_hour", "passenger_count")]
+        left = frame.sort_values(keys).reset_index(drop=True)
+        right = actual[name].sort_values(keys).reset_index(drop=True)
+        pd.testing.assert_frame_equal(left, right, check_dtype=False)
+
+
+def run_benchmark(sizes=(100_000, 1_000_000), repeats=3):
+    """对每个数据规模运行两个引擎并打印对比表"""
+    rows = []
+    groupby_processor = PandasDataProcessor(engine="groupby")
+    fused_processor = PandasDataProcessor(engine="fused")
+
+    for n_rows in sizes:
+        df = groupby_processor.clean_data(groupby_processor._create_sample_data(n_rows), verbose=False)
+
+        groupby_time, groupby_results = _time_analyze(groupby_processor, df, repeats)
+        fused_time, fused_results = _time_analyze(fused_processor, df, repeats)
+        _check_same_results(groupby_results, fused_results)
+
+        rows.append({
+            "rows": n_rows,
+            "groupby_seconds": round(groupby_time, 4),
+            "fused_seconds": round(fused_time, 4),
+            "speedup": round(groupby_time / fused_time, 2) if fused_time > 0 else float("inf"),
+        })
+
+    report = pd.DataFrame(rows)
+    print("\n📊 聚合引擎对比 (最短耗时, 结果已校验一致):")
+    print(report.to_string(index=False))
+    return report
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="groupby vs 融合聚合引擎基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000], help="数据行数")
+    parser.add_argument("--repeats", type=int, default=3, help="每个引擎重复次数")
+
+    args = parser.parse_args()
+
+    run_benchmark(sizes=args.sizes, repeats=args.repeats)
+
+
+if __name__ == "__main__":
+    main()
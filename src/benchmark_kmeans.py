@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+聚类训练基准测试 - 对比抽样训练与全量训练 KMeans 的耗时和聚类中心偏移
+
+数据复用 benchmark_pipeline 生成的合成行程（data/benchmark），预处理结果持久化后
+分别用全量数据和 --fractions 中的每个比例分层抽样训练标准化 + KMeans，
+记录训练耗时、相对全量训练的加速比，以及聚类中心的最大相对偏移。
+"""
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# 添加项目根目录到Python路径
+current_file = Path(__file__).resolve()
+project_root = current_file.parent.parent
+sys.path.append(str(project_root))
+
+from src.benchmark_pipeline import prepare_dataset
+
+
+def _time_fit(processor, features_df, sample_fraction):
+    """训练一次，返回 (耗时, (scaler, kmeans))"""
+    start = time.perf_counter()
+    models = processor._fit_fare_clustering(features_df, sample_fraction)
+    return time.perf_counter() - start, models
+
+
+def run_benchmark(sizes=(1_000_000, 5_000_000), fractions=(0.01, 0.05, 0.2), seed=42):
+    """对每个数据规模比较全量训练和各抽样比例，打印对比表"""
+    from pyspark.ml.feature import VectorAssembler
+    from src.spark_advanced_processor import AdvancedNYCDataProcessor, FARE_FEATURES
+
+    processor = AdvancedNYCDataProcessor(app_name="NYCTaxiKMeansBenchmark")
+    assembler = VectorAssembler(inputCols=FARE_FEATURES, outputCol="features")
+    rows = []
+    try:
+        for n_rows in sizes:
+            data_path = prepare_dataset(n_rows, seed=seed)
+            df = processor.preprocess_data(processor._read_data_files([data_path]))
+            features_df = assembler.transform(df)
+
+            full_time, full_models = _time_fit(processor, features_df, None)
+            rows.append({"rows": n_rows, "sample_fraction": 1.0, "fit_seconds": round(full_time, 3),
+                         "speedup": 1.0, "max_centroid_shift": 0.0})
+
+            for fraction in fractions:
+                sample_time, sample_models = _time_fit(processor, features_df, fraction)
+                rows.append({
+                    "rows": n_rows,
+                    "sample_fraction": fraction,
+                    "fit_seconds": round(sample_time, 3),
+                    "speedup": round(full_time / sample_time, 2) if sample_time > 0 else float("inf"),
+                    "max_centroid_shift": round(processor.centroid_shift(sample_models, full_models), 4),
+                })
+            processor._unpersist_all()
+    finally:
+        processor.spark.stop()
+
+    report = pd.DataFrame(rows)
+    print("\n📊 KMeans 抽样训练 vs 全量训练:")
+    print(report.to_string(index=False))
+    return report
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="KMeans 抽样训练 vs 全量训练基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000_000, 5_000_000], help="数据行数")
+    parser.add_argument("--fractions", type=float, nargs="+", default=[0.01, 0.05, 0.2], help="抽样比例")
+    parser.add_argument("--seed", type=int, default=42, help="合成数据随机种子")
+
+    args = parser.parse_args()
+
+    run_benchmark(sizes=args.sizes, fractions=args.fractions, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
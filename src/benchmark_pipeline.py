@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+"""
+端到端流程基准测试 - 在不同数据规模下对比 pandas 与 Spark 各引擎
+
+为每个规模生成（并复用）确定性的合成行程数据，按 加载/清洗/分析/保存 阶段
+运行每个引擎，记录墙钟时间、峰值RSS（含Spark JVM等子进程）和每秒行数。
+每次运行追加到 output/benchmark/history.csv，并写出 latest.json；
+与历史最好成绩相比明显变慢的阶段会被标出，用于发现性能回退。
+
+注意 Spark 是惰性执行的：preprocess_data 的持久化 count 发生在"清洗"阶段，
+结果的实际计算大多发生在"保存"阶段，比较引擎时应以总耗时为准。
+"""
+import contextlib
+import io
+import json
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import pyarrow.dataset as ds
+
+# 添加项目根目录到Python路径
+current_file = Path(__file__).resolve()
+project_root = current_file.parent.parent
+sys.path.append(str(project_root))
+
+from src.synthetic_trips import write_trips
+from src.stage_metrics import PeakRSS
+
+DEFAULT_SIZES = (10_000, 1_000_000, 10_000_000)
+BENCHMARK_DIR = project_root / "output" / "benchmark"
+DATA_DIR = project_root / "data" / "benchmark"
+
+# 比历史最好成绩慢这么多（比例）且至少慢 REGRESSION_MIN_SECONDS 秒即视为回退
+REGRESSION_THRESHOLD = 0.2
+REGRESSION_MIN_SECONDS = 0.1
+
+HISTORY_COLUMNS = ["run_id", "timestamp", "engine", "rows", "stage", "seconds",
+                   "peak_rss_mb", "rows_per_sec", "rows_out", "error"]
+
+
+class _StageRecorder:
+    """按阶段计时并记录结果行"""
+
+    def __init__(self, engine, rows, verbose=False):
+        self.engine = engine
+        self.rows = rows
+        self.verbose = verbose
+        self.records = []
+
+    def run(self, stage, func, rows_out=None):
+        """执行一个阶段并记录，返回 func() 的结果
+
+        rows_out: 可选，由结果计算输出行数的函数
+        """
+        output = io.StringIO()
+        redirect = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(output)
+        with PeakRSS() as rss, redirect:
+            start = time.perf_counter()
+            result = func()
+            seconds = time.perf_counter() - start
+
+        self.records.append({
+            "engine": self.engine,
+            "rows": self.rows,
+            "stage": stage,
+            "seconds": round(seconds, 4),
+            "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+            "rows_per_sec": round(self.rows / seconds) if seconds > 0 else None,
+            "rows_out": rows_out(result) if rows_out is not None else None,
+            "error": None,
+        })
+        return result
+
+    def fail(self, error):
+        """记录引擎失败（后续阶段不再运行）"""
+        self.records.append({
+            "engine": self.engine, "rows": self.rows, "stage": "error",
+            "seconds": None, "peak_rss_mb": None, "rows_per_sec": None, "rows_out": None,
+            "error": f"{type(error).__name__}: {error}",
+        })
+
+
+def prepare_dataset(n_rows, seed=42):
+    """生成（或复用已存在的）n_rows 行合成数据，返回Parquet目录"""
+    path = DATA_DIR / f"trips_{n_rows}.parquet"
+    if path.exists():
+        try:
+            if ds.dataset(str(path), format="parquet").count_rows() == n_rows:
+                return path
+        except (OSError, ValueError):
+            pass  # 缓存损坏，重新生成
+    print(f"🎲 生成 {n_rows:,} 行基准数据 -> {path}")
+    return write_trips(path, n_rows, seed=seed)
+
+
+def _pandas_processor(engine, data_path, output_dir):
+    from src.pandas_processor import PandasDataProcessor
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor = PandasDataProcessor(engine=engine)
+    processor.data_files = [data_path]
+    processor.output_dir = output_dir
+    return processor
+
+
+def run_pandas(recorder, data_path, output_dir, engine="groupby"):
+    """内存模式：加载 -> 清洗 -> 分析 -> 保存
+
+    用 read_data_files 而不是 load_data：后者读取失败时会换成示例数据，
+    基准会把示例数据的耗时记在真实输入的行数下。这里失败就记录为错误。
+    """
+    processor = _pandas_processor(engine, data_path, output_dir)
+    # 读取时已下推过滤：load 按原始行数计，清洗统计从原始行数算起
+    df = recorder.run("load", processor.read_data_files, rows_out=lambda _: processor.raw_row_count)
+    df = recorder.run("clean", lambda: processor.clean_data(df, initial_count=processor.raw_row_count),
+                      rows_out=len)
+    results = recorder.run("analyze", lambda: processor.analyze_data(df))
+    recorder.run("save", lambda: processor.save_results(results))
+
+
+def run_pandas_chunked(recorder, data_path, output_dir, engine="fused"):
+    """分块模式：加载、清洗、分析在同一次流式扫描中完成"""
+    processor = _pandas_processor(engine, data_path, output_dir)
+    results = recorder.run("load+clean+analyze", lambda: processor.analyze_chunked(workers=1))
+    recorder.run("save", lambda: processor.save_results(results))
+
+
+def run_spark(recorder, data_path, output_dir):
+    """AdvancedNYCDataProcessor 基础分析流程（不含聚类）"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        from src.spark_advanced_processor import AdvancedNYCDataProcessor
+        processor = AdvancedNYCDataProcessor(app_name="NYCTaxiBenchmark")
+    processor.output_dir = output_dir
+    try:
+        df = recorder.run("load", lambda: processor._read_data_files([data_path]))
+        df = recorder.run("clean", lambda: processor.preprocess_data(df),
+                          rows_out=lambda _: processor.metrics.get("cleaned_rows"))
+        results = recorder.run("analyze", lambda: (processor.analyze_basic_metrics(df),
+                                                   processor.build_od_matrix(df)))
+        recorder.run("save", lambda: processor.save_results(results[0], None, results[1]))
+    finally:
+        processor._unpersist_all()
+        processor.spark.stop()
+
+
+def run_spark_simple(recorder, data_path, output_dir):
+    """spark_processor 中的函数式流程"""
+    from src import spark_processor
+
+    spark = spark_processor.create_spark_session("NYCTaxiBenchmarkSimple")
+    try:
+        df = recorder.run("load", lambda: spark_processor.load_data(spark, str(data_path)))
+        df = recorder.run("clean", lambda: spark_processor.clean_data(df))
+        results = recorder.run("analyze", lambda: spark_processor.analyze_hot_routes(df))
+        recorder.run("save", lambda: spark_processor.save_results(results, str(output_dir)))
+    finally:
+        spark.stop()
+
+
+ENGINES = {
+    "pandas": run_pandas,
+    "pandas-fused": lambda *args: run_pandas(*args, engine="fused"),
+    "pandas-chunked": run_pandas_chunked,
+    "spark": run_spark,
+    "spark-simple": run_spark_simple,
+}
+
+
+def _append_history(records, history_path):
+    """把本次记录追加到CSV历史，返回追加前的历史"""
+    previous = pd.read_csv(history_path) if history_path.exists() else pd.DataFrame(columns=HISTORY_COLUMNS)
+    pd.DataFrame(records, columns=HISTORY_COLUMNS).to_csv(
+        history_path, mode="a", header=not history_path.exists(), index=False)
+    return previous
+
+
+def _find_regressions(report, previous):
+    """与历史上同一 引擎/规模/阶段 的最短耗时比较，返回变慢超过阈值的行"""
+    ok = previous[previous["error"].isna()] if "error" in previous else previous
+    if ok.empty:
+        return report.iloc[0:0]
+    best = ok.groupby(["engine", "rows", "stage"])["seconds"].min().rename("best_seconds")
+    compared = report.join(best, on=["engine", "rows", "stage"]).dropna(subset=["seconds", "best_seconds"])
+    compared["slowdown"] = compared["seconds"] / compared["best_seconds"] - 1
+    slower = compared["seconds"] - compared["best_seconds"]
+    return compared[(compared["slowdown"] > REGRESSION_THRESHOLD) & (slower > REGRESSION_MIN_SECONDS)]
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, engines=tuple(ENGINES), seed=42, verbose=False):
+    """对每个数据规模运行选中的引擎，记录并打印结果，返回本次的记录表"""
+    BENCHMARK_DIR.mkdir(parents=True, exist_ok=True)
+    run_id = uuid.uuid4().hex[:8]
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    records = []
+
+    for n_rows in sizes:
+        data_path = prepare_dataset(n_rows, seed=seed)
+        for engine in engines:
+            print(f"⏱️  {engine}: {n_rows:,} 行")
+            recorder = _StageRecorder(engine, n_rows, verbose=verbose)
+            output_dir = BENCHMARK_DIR / "results" / engine
+            output_dir.mkdir(parents=True, exist_ok=True)
+            try:
+                ENGINES[engine](recorder, data_path, output_dir)
+            except Exception as e:
+                print(f"  ❌ {engine} 失败: {e}")
+                recorder.fail(e)
+            records.extend(recorder.records)
+
+    for record in records:
+        record.update(run_id=run_id, timestamp=timestamp)
+    report = pd.DataFrame(records, columns=HISTORY_COLUMNS)
+
+    previous = _append_history(records, BENCHMARK_DIR / "history.csv")
+    with open(BENCHMARK_DIR / "latest.json", "w") as f:
+        json.dump({"run_id": run_id, "timestamp": timestamp, "records": records}, f, indent=2, default=str)
+
+    print(f"\n📊 流程基准测试 (run {run_id}):")
+    print(report.drop(columns=["run_id", "timestamp"]).to_string(index=False))
+
+    totals = report.dropna(subset=["seconds"]).groupby(["rows", "engine"])["seconds"].sum().unstack()
+    print("\n⏱️  总耗时 (秒):")
+    print(totals.round(3).to_string())
+
+    regressions = _find_regressions(report, previous)
+    if len(regressions):
+        print(f"\n⚠️  比历史最好成绩慢 {REGRESSION_THRESHOLD:.0%} 以上:")
+        print(regressions[["engine", "rows", "stage", "seconds", "best_seconds", "slowdown"]]
+              .round(3).to_string(index=False))
+
+    print(f"\n📁 历史记录: {BENCHMARK_DIR / 'history.csv'}")
+    return report
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="pandas vs Spark 端到端流程基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="数据行数")
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES), default=list(ENGINES), help="参与对比的引擎")
+    parser.add_argument("--seed", type=int, default=42, help="合成数据随机种子")
+    parser.add_argument("--verbose", action="store_true", help="显示处理器自身的输出")
+
+    args = parser.parse_args()
+
+    run_benchmark(sizes=args.sizes, engines=args.engines, seed=args.seed, verbose=args.verbose)
+
+
+if __name__ == "__main__":
+    main()
@@ -20,31 +20,40 @@ def create_unified_output():
     for subdir in ["pandas", "spark_simple", "spark_advanced"]:
         source_dir = project_root / "output" / subdir
         if source_dir.exists():
-            csv_files = list(source_dir.glob("*.csv"))
-            if csv_files:
+            # Arrow结果文件（带manifest）和可选的CSV导出
+            result_files = list(source_dir.glob("*.feather")) + list(source_dir.glob("*.csv"))
+            if result_files:
+                dataset_count = len({f.stem for f in result_files})
                 found_data.append({
                     "dir": subdir,
-                    "csv_count": len(csv_files),
-                    "files": csv_files
+                    "dataset_count": dataset_count,
+                    "files": result_files
                 })
-                print(f"  ✓ 找到 {subdir}: {len(csv_files)} 个CSV文件")
+                print(f"  ✓ 找到 {subdir}: {dataset_count} 个数据集")
     
     if not found_data:
         print("❌ 未找到任何分析结果")
         return False
     
     # 选择数据最多的源
-    found_data.sort(key=lambda x: x["csv_count"], reverse=True)
+    found_data.sort(key=lambda x: x["dataset_count"], reverse=True)
     source_info = found_data[0]
     source_dir = project_root / "output" / source_info["dir"]
     
     print(f"📂 使用 {source_info['dir']} 作为数据源")
     
-    # 复制/重命名CSV文件到统一目录
-    for csv_file in source_info["files"]:
-        dest_file = unified_dir / csv_file.name
-        shutil.copy2(csv_file, dest_file)
-        print(f"  📄 复制: {csv_file.name}")
+    # 复制结果文件到统一目录
+    for result_file in source_info["files"]:
+        dest_file = unified_dir / result_file.name
+        shutil.copy2(result_file, dest_file)
+        print(f"  📄 复制: {result_file.name}")
+    
+    # 复制manifest和OD矩阵（如果有）
+    for extra_name in ["manifest.json", "od_matrix.npz"]:
+        extra_file = source_dir / extra_name
+        if extra_file.exists():
+            shutil.copy2(extra_file, unified_dir / extra_file.name)
+            print(f"  📄 复制: {extra_file.name}")
     
     # 创建统一的报告文件
     report_data = {
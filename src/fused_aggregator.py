@@ -0,0 +1,124 @@
+"""
+融合聚合引擎 - 一次编码、一次遍历算出所有维度表
+
+PULocationID/DOLocationID/小时/乘客数都是小范围非负整数，直接作为
+数组下标（路线用 PU * n + DO 组合成一个整数键），再用 np.bincount
+按权重累加计数、费用和、费用平方和、距离和，避免多次 groupby 哈希。
+输出与 trip_aggregates.partial_aggregate 相同格式的部分聚合，
+因此可以直接用 merge_partials / finalize_partials 合并和收尾。
+"""
+import numpy as np
+import pandas as pd
+
+from src.trip_aggregates import MEASURES, spark_dayofweek
+
+NS_PER_HOUR = 3_600_000_000_000
+NS_PER_DAY = 24 * NS_PER_HOUR
+# 1970-01-01 是周四，Spark约定（1=周日）下为5
+EPOCH_SPARK_DAYOFWEEK = 5
+
+
+def pickup_hours_and_days(series):
+    """上车小时和星期几（Spark约定 1=周日 … 7=周六），datetime64列按整数纳秒一次算出
+
+    返回 (小时, 星期, 有效掩码)：上车时间为NaT的行掩码为False，
+    其小时和星期没有意义，调用方应排除（与groupby引擎丢弃NaT分组一致）。
+    """
+    if not pd.api.types.is_datetime64_any_dtype(series):
+        series = pd.to_datetime(series)
+    valid = series.notna().to_numpy()
+    if getattr(series.dt, "tz", None) is not None:
+        hours = series.dt.hour.fillna(0).to_numpy(dtype="int64")
+        days = spark_dayofweek(series).fillna(1).to_numpy(dtype="int64")
+        return hours, days, valid
+    # NaT 视作 int64 最小值，不能当作真实时间参与计算
+    values = series.to_numpy(dtype="datetime64[ns]").view("int64")
+    hours = (values // NS_PER_HOUR) % 24
+    days = (values // NS_PER_DAY + EPOCH_SPARK_DAYOFWEEK - 1) % 7 + 1
+    return hours, days, valid
+
+
+def _bincount_measures(keys, size, fare, distance):
+    """对一组整数键累加所有可加统计量"""
+    counts = np.bincount(keys, minlength=size)
+    sums = {
+        "fare_sum": np.bincount(keys, weights=fare, minlength=size),
+        "fare_sq_sum": np.bincount(keys, weights=fare * fare, minlength=size),
+        "distance_sum": (np.bincount(keys, weights=distance, minlength=size)
+                         if distance is not None else np.full(size, np.nan)),
+    }
+    return counts, sums
+
+
+def _to_partial(counts, sums, make_index):
+    """把稠密累加数组转换为只含非空键的部分聚合表"""
+    positions = np.flatnonzero(counts)
+    part = pd.DataFrame({"trip_count": counts[positions]}, index=make_index(positions))
+    for name in MEASURES:
+        part[name] = sums[name][positions]
+    return part
+
+
+def _key_index(name):
+    """一维键的索引构造函数"""
+    return lambda positions: pd.Index(positions, name=name)
+
+
+def fused_partial_aggregate(df):
+    """单次遍历计算所有维度的部分聚合"""
+    if len(df) == 0:
+        return {}
+
+    pu = df["PULocationID"].to_numpy().astype("int64")
+    do = df["DOLocationID"].to_numpy().astype("int64")
+    fare = df["total_amount"].to_numpy(dtype="float64")
+    distance = df["trip_distance"].to_numpy(dtype="float64") if "trip_distance" in df.columns else None
+
+    n_zones = int(max(pu.max(), do.max())) + 1
+    partials = {}
+
+    # 路线：PU * n + DO
+    route_keys = pu * n_zones + do
+    counts, sums = _bincount_measures(route_keys, n_zones * n_zones, fare, distance)
+    partials["hot_routes"] = _to_partial(counts, sums, lambda positions: pd.MultiIndex.from_arrays(
+        np.divmod(positions, n_zones), names=["PULocationID", "DOLocationID"]))
+
+    # 上车区域 - 直接由路线数组按行求和，无需再次遍历原始数据
+    pickup_counts = counts.reshape(n_zones, n_zones).sum(axis=1)
+    pickup_sums = {name: sums[name].reshape(n_zones, n_zones).sum(axis=1) for name in MEASURES}
+    partials["pickup_hotspots"] = _to_partial(pickup_counts, pickup_sums, _key_index("PULocationID"))
+
+    if "tpep_pickup_datetime" in df.columns:
+        hours, days, valid = pickup_hours_and_days(df["tpep_pickup_datetime"])
+        timed_fare = fare[valid]
+        timed_distance = distance[valid] if distance is not None else None
+        hours, days = hours[valid], days[valid]
+        counts, sums = _bincount_measures(hours, 24, timed_fare, timed_distance)
+        partials["hourly_traffic"] = _to_partial(counts, sums, _key_index("pickup_hour"))
+
+        # 立方体：稠密键空间为 n² × 168，远大于实际出现的组合，
+        # 先用 np.unique 把键压缩成连续编号，再在压缩后的键上 bincount
+        cube_keys = (route_keys[valid] * 24 + hours) * 7 + (days - 1)
+        unique_keys, inverse = np.unique(cube_keys, return_inverse=True)
+        counts, sums = _bincount_measures(inverse, len(unique_keys), timed_fare, timed_distance)
+
+        def cube_index(positions):
+            rest, day = np.divmod(unique_keys[positions], 7)
+            route, hour = np.divmod(rest, 24)
+            return pd.MultiIndex.from_arrays(
+                [*np.divmod(route, n_zones), hour, day + 1],
+                names=["PULocationID", "DOLocationID", "pickup_hour", "pickup_dayofweek"])
+
+        partials["trip_cube"] = _to_partial(counts, sums, cube_index)
+
+    if "passenger_count" in df.columns:
+        passengers = df["passenger_count"].to_numpy(dtype="float64")
+        valid = ~np.isnan(passengers)
+        if valid.any():
+            keys = passengers[valid].astype("int64")
+            size = int(keys.max()) + 1
+            counts, sums = _bincount_measures(
+                keys, size, fare[valid], distance[valid] if distance is not None else None)
+            partials["passenger_stats"] = _to_partial(counts, sums, _key_index("passenger_count"))
+
+    return partials
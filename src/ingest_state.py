@@ -0,0 +1,104 @@
+"""
+增量导入状态 - 记录哪些源文件已经并入持久化的部分聚合
+
+状态目录中保存：
+- ingest_state.json：已导入文件的指纹（大小 + 修改时间）和累计行数
+- 处理器写入的可加部分聚合（pandas为各维度部分聚合 + OD矩阵，Spark为聚合立方体）
+
+每次运行只处理指纹不在记录中的新文件，把它们的可加统计量并入已有聚合。
+已导入的文件被修改或删除时，旧的贡献无法扣除，此时整体重建。
+新状态先写到临时目录，完整写好后再替换旧目录，中途失败不会留下
+“聚合已更新但记录未更新”的状态（否则下次会重复计入）。
+"""
+import json
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+STATE_NAME = "ingest_state.json"
+
+
+def file_fingerprint(path):
+    """文件指纹 {size, mtime_ns}；目录（如Spark写出的Parquet）按其中所有数据文件汇总"""
+    path = Path(path)
+    if path.is_dir():
+        files = [f for f in path.rglob("*")
+                 if f.is_file() and not f.name.startswith((".", "_"))]
+        stats = [f.stat() for f in files]
+        return {
+            "size": int(sum(s.st_size for s in stats)),
+            "mtime_ns": int(max((s.st_mtime_ns for s in stats), default=0)),
+            "files": len(files),
+        }
+    stat = path.stat()
+    return {"size": int(stat.st_size), "mtime_ns": int(stat.st_mtime_ns)}
+
+
+class IngestState:
+    def __init__(self, state_dir):
+        """加载状态目录中的导入记录（不存在时为空）"""
+        self.state_dir = Path(state_dir)
+        self.files = {}
+        self.totals = {}
+
+        state_path = self.state_dir / STATE_NAME
+        if state_path.exists():
+            with open(state_path) as f:
+                state = json.load(f)
+            self.files = state.get("files", {})
+            self.totals = state.get("totals", {})
+
+    @property
+    def is_empty(self):
+        return not self.files
+
+    @staticmethod
+    def _key(path):
+        return str(Path(path).resolve())
+
+    def plan(self, data_files):
+        """比较当前数据文件与记录，返回 (新文件列表, 已变化或已删除的文件列表)"""
+        current = {self._key(f): f for f in data_files}
+        new_files = [f for key, f in current.items() if key not in self.files]
+        stale_files = [
+            key for key, fingerprint in self.files.items()
+            if key not in current or file_fingerprint(current[key]) != fingerprint
+        ]
+        return new_files, stale_files
+
+    def reset(self):
+        """丢弃所有记录（下次提交时整体重建）"""
+        self.files = {}
+        self.totals = {}
+
+    def commit(self, new_files, write_aggregates, totals=None):
+        """记录新导入的文件并原子地替换状态目录
+
+        write_aggregates(directory) 负责把合并后的部分聚合写入给定的临时目录。
+        totals: 本次新增的计数（如清洗前/后行数），累加到已有总数上。
+        """
+        for f in new_files:
+            self.files[self._key(f)] = file_fingerprint(f)
+        for name, value in (totals or {}).items():
+            self.totals[name] = self.totals.get(name, 0) + value
+
+        tmp_dir = self.state_dir.with_name(self.state_dir.name + ".tmp")
+        old_dir = self.state_dir.with_name(self.state_dir.name + ".old")
+        for leftover in (tmp_dir, old_dir):
+            if leftover.exists():
+                shutil.rmtree(leftover)
+        tmp_dir.mkdir(parents=True)
+
+        write_aggregates(tmp_dir)
+        with open(tmp_dir / STATE_NAME, "w") as f:
+            json.dump({
+                "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "files": self.files,
+                "totals": self.totals,
+            }, f, indent=2, ensure_ascii=False)
+
+        if self.state_dir.exists():
+            self.state_dir.rename(old_dir)
+        tmp_dir.rename(self.state_dir)
+        if old_dir.exists():
+            shutil.rmtree(old_dir)
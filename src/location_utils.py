@@ -20,11 +20,15 @@ sys.path.insert(0, str(project_root))
 try:
     # 先尝试相对导入（当作为模块运行时）
     from .path_utils import get_data_path, get_project_root
+    from .zone_index import ZoneIndex
+    from .zone_geometry import load_zone_geometry
     print("[DEBUG] 使用相对导入成功")
 except ImportError:
     # 如果失败，使用绝对导入（当直接运行时）
     try:
         from src.path_utils import get_data_path, get_project_root
+        from src.zone_index import ZoneIndex
+        from src.zone_geometry import load_zone_geometry
         print("[DEBUG] 使用绝对导入成功")
     except ImportError as e:
         print(f"[DEBUG] 导入失败: {e}")
@@ -35,6 +39,10 @@ except ImportError:
         def get_data_path():
             return project_root / "data" / "raw"  # 根据你的结构
 
+# 模拟区域的名称格式（Zone_1, Zone_2, ...），据此识别模拟出的区域表
+SIMULATED_ZONE_NAME = "Zone_{}"
+SIMULATED_ZONE_PATTERN = r"Zone_\d+"
+
 class LocationDataManager:
     def __init__(self, data_path=None):
         """初始化位置数据管理器 - 只做初始化，不加载数据"""
@@ -44,13 +52,53 @@ class LocationDataManager:
         # 2. 设置项目根目录
         self.project_root = Path(get_project_root())
         
+        # 3. 区域查找索引和区域几何，首次使用时构建
+        self._zone_index = None
+        self._zone_geometry = None
+        
         # ✅ 正确：__init__只做初始化，没有数据处理逻辑，没有return语句
         print(f"[DEBUG] LocationDataManager初始化完成: data_dir={self.data_dir}, project_root={self.project_root}")
     
+    def get_zone_geometry(self):
+        """真实区域几何（质心、外包框、点所在区域查询），来自 raw/taxi_zones.zip
+        
+        解析结果缓存在 processed/taxi_zones_geometry.npz；没有ZIP或解析失败时返回None。
+        """
+        if self._zone_geometry is None:
+            zip_path = self.project_root / "data" / "raw" / "taxi_zones.zip"
+            if not zip_path.exists():
+                return None
+            try:
+                self._zone_geometry = load_zone_geometry(zip_path, self.data_dir / "taxi_zones_geometry.npz")
+            except Exception as e:
+                print(f"[DEBUG] 解析区域Shapefile失败: {e}")
+                return None
+        return self._zone_geometry
+    
+    def export_zone_table(self):
+        """把Shapefile解析出的区域表写到 taxi_zones_processed.csv（仪表板读取）
+        
+        只在显式调用时写文件（python src/location_utils.py），加载区域数据不会改写它。
+        没有Shapefile时返回None。
+        """
+        geometry = self.get_zone_geometry()
+        if geometry is None:
+            return None
+        processed_path = self.data_dir / "taxi_zones_processed.csv"
+        geometry.to_frame().to_csv(processed_path, index=False)
+        print(f"[DEBUG] 区域表已导出: {processed_path}, 包含 {len(geometry)} 个区域")
+        return processed_path
+    
     def load_taxi_zones(self):
-        """加载出租车区域数据 - 从processed目录加载"""
+        """加载出租车区域数据 - 优先使用Shapefile的真实质心，其次从processed目录加载"""
         print(f"[DEBUG] load_taxi_zones 开始，数据目录: {self.data_dir}")
         
+        geometry = self.get_zone_geometry()
+        if geometry is not None:
+            zones_df = geometry.to_frame()
+            print(f"[DEBUG] 区域数据来自Shapefile: {len(zones_df)} 个区域")
+            return zones_df
+        
         # 文件优先级：先检查processed目录中的文件
         processed_files = [
             self.data_dir / "taxi_zones_processed.csv",      # 首选：已处理的文件
@@ -235,7 +283,7 @@ class LocationDataManager:
             zones_data.append({
                 'location_id': i,
                 'borough': borough,
-                'zone_name': f'Zone_{i}',
+                'zone_name': SIMULATED_ZONE_NAME.format(i),
                 'latitude': lat,
                 'longitude': lon
             })
@@ -257,21 +305,46 @@ class LocationDataManager:
         print(f"[DEBUG] _create_simulated_zones 返回类型: {type(zones_df)}")
         return zones_df
     
+    def get_zone_lookup(self):
+        """真实的区域表（location_id, borough, zone_name），用于给行程标注行政区
+        
+        只来自Shapefile或 taxi_zones_processed.csv；模拟区域（名称为 Zone_N）的行政区是
+        编造的，不算真实数据。没有真实数据时返回None。
+        """
+        columns = ['location_id', 'borough', 'zone_name']
+        geometry = self.get_zone_geometry()
+        if geometry is not None:
+            return geometry.to_frame()[columns]
+        
+        processed_path = self.data_dir / "taxi_zones_processed.csv"
+        if not processed_path.exists():
+            return None
+        zones_df = pd.read_csv(processed_path)
+        zones_df.columns = zones_df.columns.str.lower()
+        if not set(columns).issubset(zones_df.columns):
+            return None
+        if zones_df['zone_name'].astype(str).str.fullmatch(SIMULATED_ZONE_PATTERN).all():
+            print(f"[DEBUG] {processed_path.name} 是模拟区域数据，不用于行政区标注")
+            return None
+        return zones_df[columns]
+    
+    def get_zone_index(self):
+        """区域查找索引（location_id -> 坐标/行政区/名称），只构建一次"""
+        if self._zone_index is None:
+            zones_df = self.load_taxi_zones()
+            if zones_df is None or 'latitude' not in zones_df.columns or 'longitude' not in zones_df.columns:
+                return None
+            self._zone_index = ZoneIndex(zones_df)
+        return self._zone_index
+    
     def get_zone_centroids(self):
         """获取区域中心点"""
-        zones_df = self.load_taxi_zones()
+        zone_index = self.get_zone_index()
         
-        if zones_df is not None and 'latitude' in zones_df.columns and 'longitude' in zones_df.columns:
-            centroids = {
-                row['location_id']: {
-                    'latitude': row['latitude'],
-                    'longitude': row['longitude'],
-                    'borough': row.get('borough', 'Unknown'),
-                    'zone_name': row.get('zone_name', f'Zone_{row["location_id"]}')
-                }
-                for _, row in zones_df.iterrows()
-            }
-            return centroids
+        if zone_index is not None:
+            zones = zone_index.to_frame()
+            return dict(zip(zones['location_id'].tolist(),
+                            zones[['latitude', 'longitude', 'borough', 'zone_name']].to_dict('records')))
         
         return None
     
@@ -303,20 +376,13 @@ class LocationDataManager:
         print(f"[DEBUG] create_location_mapping: zones_df 类型: {type(zones_df)}, 形状: {zones_df.shape}")
         print(f"[DEBUG] create_location_mapping: 列名: {list(zones_df.columns)}")
         
-        # 创建简化映射
-        mapping = {}
-        for _, row in zones_df.iterrows():
-            try:
-                location_id = int(row['location_id'])
-                mapping[location_id] = {
-                    'lat': float(row['latitude']),
-                    'lon': float(row['longitude']),
-                    'borough': str(row.get('borough', 'Unknown')),
-                    'zone': str(row.get('zone_name', f'Zone_{location_id}'))
-                }
-            except Exception as e:
-                print(f"[DEBUG] create_location_mapping: 处理行时出错: {e}")
-                continue
+        # 创建简化映射（ID无效的行被索引忽略）
+        self._zone_index = ZoneIndex(zones_df)
+        zones = self._zone_index.to_frame().rename(columns={
+            'latitude': 'lat', 'longitude': 'lon', 'zone_name': 'zone'
+        })
+        mapping = dict(zip(zones['location_id'].tolist(),
+                           zones[['lat', 'lon', 'borough', 'zone']].to_dict('records')))
         
         # 保存为JSON
         mapping_path = self.data_dir / "location_mapping.json"
@@ -380,7 +446,12 @@ def main():
     """测试位置数据管理器"""
     manager = LocationDataManager()
     
-    print("加载区域数据...")
+    print("从Shapefile导出区域表...")
+    processed_path = manager.export_zone_table()
+    if processed_path:
+        print(f"✓ 区域表: {processed_path}")
+    
+    print("\n加载区域数据...")
     zones_df = manager.load_taxi_zones()
     
     if zones_df is not None:
@@ -0,0 +1,137 @@
+"""
+稠密起终点(OD)矩阵 - 所有路线的可加统计量
+
+NYC出租车区域ID范围是 1–265，直接用 266×266 数组（下标即区域ID，0留空）
+保存每条路线的行程数、费用和、距离和、时长和，任意路线查询都是 O(1)，
+不再受 hot_routes 前100条截断的限制。
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+N_ZONES = 266
+
+# 矩阵中的可加统计量
+MEASURES = ("trip_count", "fare_sum", "distance_sum", "duration_sum")
+
+# 统计量 -> 平均值列名
+AVERAGES = {
+    "fare_sum": "avg_fare",
+    "distance_sum": "avg_distance",
+    "duration_sum": "avg_duration",
+}
+
+
+class ODMatrix:
+    def __init__(self, arrays=None):
+        """arrays: {统计量名: (N_ZONES, N_ZONES) 数组}，缺省为全零矩阵"""
+        arrays = arrays or {}
+        self.arrays = {
+            name: np.asarray(arrays[name], dtype="float64") if name in arrays
+            else np.zeros((N_ZONES, N_ZONES))
+            for name in MEASURES
+        }
+
+    @classmethod
+    def from_frame(cls, df):
+        """从已清洗的行程数据构建（区域ID超出范围的行被忽略）"""
+        pu = df["PULocationID"].to_numpy(dtype="float64")
+        do = df["DOLocationID"].to_numpy(dtype="float64")
+        valid = (pu >= 0) & (pu < N_ZONES) & (do >= 0) & (do < N_ZONES)
+        keys = pu[valid].astype("int64") * N_ZONES + do[valid].astype("int64")
+        size = N_ZONES * N_ZONES
+
+        def accumulate(values):
+            if values is None:
+                return np.full(size, np.nan)
+            return np.bincount(keys, weights=values[valid], minlength=size)
+
+        distance = df["trip_distance"].to_numpy(dtype="float64") if "trip_distance" in df.columns else None
+        duration = None
+        if "tpep_pickup_datetime" in df.columns and "tpep_dropoff_datetime" in df.columns:
+            delta = pd.to_datetime(df["tpep_dropoff_datetime"]) - pd.to_datetime(df["tpep_pickup_datetime"])
+            duration = delta.dt.total_seconds().to_numpy(dtype="float64") / 60
+
+        flat = {
+            "trip_count": np.bincount(keys, minlength=size).astype("float64"),
+            "fare_sum": accumulate(df["total_amount"].to_numpy(dtype="float64")),
+            "distance_sum": accumulate(distance),
+            "duration_sum": accumulate(duration),
+        }
+        return cls({name: values.reshape(N_ZONES, N_ZONES) for name, values in flat.items()})
+
+    @classmethod
+    def from_route_frame(cls, routes):
+        """从按 (PULocationID, DOLocationID) 聚合好的表构建（如Spark的路线聚合结果）"""
+        matrix = cls()
+        pu = routes["PULocationID"].to_numpy(dtype="int64")
+        do = routes["DOLocationID"].to_numpy(dtype="int64")
+        valid = (pu >= 0) & (pu < N_ZONES) & (do >= 0) & (do < N_ZONES)
+        for name in MEASURES:
+            if name in routes.columns:
+                np.add.at(matrix.arrays[name], (pu[valid], do[valid]),
+                          routes[name].to_numpy(dtype="float64")[valid])
+            else:
+                matrix.arrays[name][:] = np.nan
+        return matrix
+
+    def __add__(self, other):
+        """合并两个矩阵（统计量直接相加）"""
+        return ODMatrix({name: self.arrays[name] + other.arrays[name] for name in MEASURES})
+
+    def save(self, path):
+        """保存为压缩的 .npz 文件"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(path, **self.arrays)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """从 .npz 文件加载"""
+        with np.load(path) as data:
+            return cls({name: data[name] for name in MEASURES if name in data.files})
+
+    @property
+    def total_trips(self):
+        return int(self.arrays["trip_count"].sum())
+
+    def _summary(self, pu, do):
+        """把一组 (pu, do) 坐标整理成路线表"""
+        counts = self.arrays["trip_count"][pu, do]
+        routes = pd.DataFrame({
+            "PULocationID": pu,
+            "DOLocationID": do,
+            "trip_count": counts.astype("int64"),
+        })
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for name, avg_name in AVERAGES.items():
+                routes[avg_name] = np.where(counts > 0, self.arrays[name][pu, do] / counts, np.nan)
+        return routes
+
+    def pair(self, pu, do):
+        """查询单条路线"""
+        return self._summary(np.array([pu]), np.array([do])).to_dict(orient="records")[0]
+
+    def origin_row(self, pu):
+        """从某个上车区域出发的所有路线（按行程数降序）"""
+        do = np.flatnonzero(self.arrays["trip_count"][pu])
+        routes = self._summary(np.full(len(do), pu), do)
+        return routes.sort_values("trip_count", ascending=False).reset_index(drop=True)
+
+    def destination_column(self, do):
+        """到达某个下车区域的所有路线（按行程数降序）"""
+        pu = np.flatnonzero(self.arrays["trip_count"][:, do])
+        routes = self._summary(pu, np.full(len(pu), do))
+        return routes.sort_values("trip_count", ascending=False).reset_index(drop=True)
+
+    def top_k(self, k=100, min_trips=0):
+        """行程数最多的 k 条路线"""
+        counts = self.arrays["trip_count"].ravel()
+        candidates = np.flatnonzero(counts > min_trips)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-counts[candidates], k - 1)[:k]]
+        pu, do = np.divmod(candidates, N_ZONES)
+        routes = self._summary(pu, do)
+        return routes.sort_values("trip_count", ascending=False).reset_index(drop=True)
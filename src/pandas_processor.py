@@ -3,8 +3,15 @@
 """
 import pandas as pd
 import numpy as np
+import pyarrow.dataset as ds
+import pyarrow.compute as pc
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import os
 import sys
+import json
+import logging
 import time
 from datetime import datetime
 
@@ -14,106 +21,248 @@ project_root = current_file.parent.parent
 sys.path.append(str(project_root))
 
 from src.path_utils import get_project_root, get_data_path
+from src.trip_aggregates import (partial_aggregate, merge_partials, finalize_partials, finalize_cube,
+                                 save_partials, load_partials, PartialAccumulator)
+from src.fused_aggregator import fused_partial_aggregate
+from src.od_matrix import ODMatrix
+from src.result_store import write_results
+from src.synthetic_trips import generate_trips
+from src.ingest_state import IngestState
+from src.stage_metrics import StageMetrics
+
+# 可选聚合引擎：groupby（逐维度分组）或 fused（一次编码、bincount单次遍历）
+AGGREGATION_ENGINES = {
+    "groupby": partial_aggregate,
+    "fused": fused_partial_aggregate,
+}
+
+# 分块模式下每批读取的行数
+DEFAULT_BATCH_SIZE = 500_000
+
+# 分析用到的列 - 读取时只解码这些列
+REQUIRED_COLUMNS = [
+    'tpep_pickup_datetime', 'tpep_dropoff_datetime',
+    'PULocationID', 'DOLocationID',
+    'passenger_count', 'trip_distance', 'total_amount',
+]
+
+# 清洗阈值（开区间），clean_data 与读取时的谓词下推共用
+FARE_RANGE = (0, 1000)
+DISTANCE_RANGE = (0, 100)
+
+
+def _scan_columns(schema_names):
+    """文件中实际存在的分析列"""
+    return [c for c in REQUIRED_COLUMNS if c in schema_names]
+
+
+def _scan_filter(schema_names):
+    """把 clean_data 的过滤条件转换为 pyarrow 表达式，下推到数据集扫描
+    
+    Parquet 行组统计信息可据此整组跳过；null 比较结果视为不满足，
+    与 dropna 的语义一致。
+    """
+    expr = (
+        pc.field('PULocationID').is_valid() &
+        pc.field('DOLocationID').is_valid() &
+        (pc.field('total_amount') > FARE_RANGE[0]) &
+        (pc.field('total_amount') < FARE_RANGE[1])
+    )
+    if 'trip_distance' in schema_names:
+        expr = expr & (pc.field('trip_distance') > DISTANCE_RANGE[0]) & \
+                      (pc.field('trip_distance') < DISTANCE_RANGE[1])
+    return expr
 
 class PandasDataProcessor:
-    def __init__(self):
+    def __init__(self, engine="groupby", csv_export=False, log_stages=False):
         """初始化处理器"""
+        if engine not in AGGREGATION_ENGINES:
+            raise ValueError(f"不支持的聚合引擎: {engine}，可选: {', '.join(AGGREGATION_ENGINES)}")
+        
         self.start_time = time.time()
+        self.engine = engine
+        self.csv_export = csv_export
         self.project_root = get_project_root()
         self.output_dir = self.project_root / "output" / "pandas"
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        # 增量模式的导入记录和持久化部分聚合
+        self.state_dir = self.output_dir / "state"
         
         # ✅ 正确：保存数据文件列表，不在__init__中加载数据
         data_dir = self.project_root / "data" / "raw"
-        self.data_files = list(data_dir.glob("*.parquet")) + list(data_dir.glob("*.csv"))
+        self.data_files = self._discover_data_files(data_dir)
+        
+        # 完整的起终点矩阵，分析时生成
+        self.od_matrix = None
+        
+        # 最近一次加载的原始行数（含读取时下推过滤掉的行），作为清洗前行数
+        self.raw_row_count = None
         
-        print("✅ Pandas处理器已初始化")
+        # 各阶段的耗时/内存/行数，写入 analysis_report.json
+        self.stage_metrics = StageMetrics(log=log_stages)
+        
+        print(f"✅ Pandas处理器已初始化 (聚合引擎: {engine})")
         # 注意：没有return语句！
 
+    @staticmethod
+    def _discover_data_files(data_dir):
+        """查找数据文件 - 所有文件视为同一个逻辑数据集
+        
+        优先使用Parquet；只有没有Parquet时才使用CSV，
+        避免同一份数据的两种导出格式被重复统计。
+        """
+        parquet_files = sorted(data_dir.glob("*.parquet"))
+        if parquet_files:
+            return parquet_files
+        return sorted(data_dir.glob("*.csv"))
+
     def load_data(self):
         """加载数据 - 单独的方法"""
         if not self.data_files:
             print("⚠️  未找到数据文件，创建示例数据...")
-            return self._create_sample_data()
-        
-        # 使用第一个文件
-        file_path = self.data_files[0]
-        print(f"📄 加载文件: {file_path.name}")
+            df = self._create_sample_data()
+            self.raw_row_count = len(df)
+            return df
         
         try:
-            if file_path.suffix.lower() == '.parquet':
-                df = pd.read_parquet(file_path)
-            else:
-                df = pd.read_csv(file_path)
-            
-            print(f"✅ 数据加载完成: {len(df):,} 行, {len(df.columns)} 列")
-            return df  # ✅ 正确：在单独的方法中返回
+            return self.read_data_files()  # ✅ 正确：在单独的方法中返回
         except Exception as e:
             print(f"❌ 加载文件失败: {e}")
-            return self._create_sample_data()  # ✅ 正确：在单独的方法中返回
-    def _create_sample_data(self, n_rows=10000):
-        """创建示例数据"""
-        print("🎲 创建示例数据...")
+            df = self._create_sample_data()  # ✅ 正确：在单独的方法中返回
+            self.raw_row_count = len(df)
+            return df
+    
+    def read_data_files(self):
+        """读取 self.data_files（列裁剪 + 过滤下推），失败时直接抛出异常，不退回示例数据
         
-        np.random.seed(42)
-        
-        # 生成示例数据
-        data = {
-            'tpep_pickup_datetime': pd.date_range('2023-01-01', periods=n_rows, freq='T'),
-            'PULocationID': np.random.randint(1, 264, n_rows),
-            'DOLocationID': np.random.randint(1, 264, n_rows),
-            'trip_distance': np.random.exponential(3, n_rows),
-            'total_amount': np.random.uniform(5, 100, n_rows),
-            'tip_amount': np.random.uniform(0, 20, n_rows),
-            'passenger_count': np.random.randint(1, 6, n_rows)
-        }
+        下推过滤掉的行不会出现在返回的DataFrame里，原始行数（元数据行数）
+        记录在 self.raw_row_count，用作清洗前行数。
+        """
+        print(f"📄 加载 {len(self.data_files)} 个文件: {', '.join(f.name for f in self.data_files)}")
         
-        df = pd.DataFrame(data)
-        df['tpep_dropoff_datetime'] = df['tpep_pickup_datetime'] + pd.to_timedelta(df['trip_distance'] * 5, unit='m')
+        frames = []
+        raw_row_count = 0
+        for file_path in self.data_files:
+            if file_path.suffix.lower() == '.parquet':
+                dataset = self._open_dataset(file_path)
+                names = dataset.schema.names
+                table = dataset.to_table(columns=_scan_columns(names), filter=_scan_filter(names))
+                scanned = dataset.count_rows()
+                print(f"  {file_path.name}: 扫描 {scanned:,} 行, 下推过滤后读取 {table.num_rows:,} 行")
+                frames.append(table.to_pandas())
+            else:
+                frames.append(pd.read_csv(file_path, usecols=lambda c: c in REQUIRED_COLUMNS))
+                scanned = len(frames[-1])
+            raw_row_count += scanned
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        self.raw_row_count = raw_row_count
+        
+        print(f"✅ 数据加载完成: {len(df):,} 行, {len(df.columns)} 列")
+        return df
+
+    def iter_batches(self, batch_size=DEFAULT_BATCH_SIZE):
+        """按批次流式读取数据 - Parquet按行组、CSV按块，峰值内存只取决于batch_size"""
+        if not self.data_files:
+            print("⚠️  未找到数据文件，创建示例数据...")
+            df = self._create_sample_data()
+            for start in range(0, len(df), batch_size):
+                yield df.iloc[start:start + batch_size]
+            return
+        
+        for file_path in self.data_files:
+            print(f"📄 分块读取文件: {file_path.name} (每批 {batch_size:,} 行)")
+            yield from self._iter_file_batches(file_path, batch_size)
+
+    @staticmethod
+    def _open_dataset(file_path):
+        """打开Parquet数据集（单文件或目录）"""
+        return ds.dataset(str(file_path), format="parquet")
+
+    def _iter_file_batches(self, file_path, batch_size):
+        """逐批读取单个文件 - 只解码分析列，Parquet同时下推清洗条件"""
+        if file_path.suffix.lower() == '.parquet':
+            dataset = self._open_dataset(file_path)
+            names = dataset.schema.names
+            # 关闭预读，避免同时驻留多个批次
+            for batch in dataset.to_batches(columns=_scan_columns(names),
+                                            filter=_scan_filter(names),
+                                            batch_size=batch_size,
+                                            batch_readahead=0,
+                                            fragment_readahead=0):
+                if batch.num_rows:
+                    yield batch.to_pandas()
+        else:
+            yield from pd.read_csv(file_path, chunksize=batch_size,
+                                   usecols=lambda c: c in REQUIRED_COLUMNS)
+
+    def _create_sample_data(self, n_rows=10000, seed=42):
+        """创建示例数据（向量化的合成行程生成器）"""
+        print("🎲 创建示例数据...")
+        
+        df = generate_trips(n_rows, seed=seed).to_pandas()
         
         print(f"✅ 已创建 {n_rows:,} 行示例数据")
         return df
     
-    def clean_data(self, df):
-        """清洗数据"""
-        print("🧹 清洗数据...")
+    def clean_data(self, df, verbose=True, initial_count=None):
+        """清洗数据
         
-        initial_count = len(df)
+        initial_count: 清洗前行数，默认 len(df)；读取时已下推过滤时传入原始行数，
+        使统计包含下推过滤掉的行。
+        """
+        if verbose:
+            print("🧹 清洗数据...")
+        
+        if initial_count is None:
+            initial_count = len(df)
         
         # 基本清洗
         df_clean = df.dropna(subset=['PULocationID', 'DOLocationID', 'total_amount'])
         
         # 过滤异常值
-        df_clean = df_clean[(df_clean['total_amount'] > 0) & (df_clean['total_amount'] < 1000)]
+        df_clean = df_clean[(df_clean['total_amount'] > FARE_RANGE[0]) & (df_clean['total_amount'] < FARE_RANGE[1])]
         
         if 'trip_distance' in df_clean.columns:
-            df_clean = df_clean[(df_clean['trip_distance'] > 0) & (df_clean['trip_distance'] < 100)]
+            df_clean = df_clean[(df_clean['trip_distance'] > DISTANCE_RANGE[0]) &
+                                (df_clean['trip_distance'] < DISTANCE_RANGE[1])]
         
         cleaned_count = len(df_clean)
-        removed = initial_count - cleaned_count
         
-        print(f"  清洗前: {initial_count:,} 行")
-        print(f"  清洗后: {cleaned_count:,} 行")
-        print(f"  移除: {removed:,} 行 ({removed/initial_count*100:.1f}%)")
+        if verbose:
+            self._print_clean_summary(initial_count, cleaned_count)
         
         return df_clean
+
+    def _print_clean_summary(self, initial_count, cleaned_count):
+        """打印清洗统计"""
+        removed = initial_count - cleaned_count
+        removed_percent = removed / initial_count * 100 if initial_count > 0 else 0
+        print(f"  清洗前: {initial_count:,} 行")
+        print(f"  清洗后: {cleaned_count:,} 行")
+        print(f"  移除: {removed:,} 行 ({removed_percent:.1f}%)")
     
     def analyze_data(self, df):
         """分析数据"""
+        self.od_matrix = ODMatrix.from_frame(df)
+        
+        if self.engine == "fused":
+            return self.analyze_fused(df)
+        
         print("📊 分析数据...")
         
         # 1. 热门路线
         print("  计算热门路线...")
         hot_routes = df.groupby(['PULocationID', 'DOLocationID']).agg({
-            'total_amount': ['count', 'mean'],
+            'total_amount': ['count', 'mean', 'std'],
             'trip_distance': 'mean' if 'trip_distance' in df.columns else pd.NamedAgg(column='total_amount', aggfunc='count')
         }).reset_index()
         
         # 扁平化列名
-        hot_routes.columns = ['PULocationID', 'DOLocationID', 'trip_count', 'avg_fare', 'avg_distance']
+        hot_routes.columns = ['PULocationID', 'DOLocationID', 'trip_count', 'avg_fare', 'fare_std', 'avg_distance']
         hot_routes = hot_routes[hot_routes['trip_count'] > 5] \
             .sort_values('trip_count', ascending=False) \
             .head(100)
+        hot_routes = hot_routes[['PULocationID', 'DOLocationID', 'trip_count', 'avg_fare', 'avg_distance', 'fare_std']]
         
         # 2. 时间分析
         print("  分析时间模式...")
@@ -125,12 +274,7 @@ class PandasDataProcessor:
             hourly_traffic.columns = ['pickup_hour', 'trip_count', 'avg_fare']
             hourly_traffic = hourly_traffic.sort_values('pickup_hour')
         else:
-            # 创建模拟数据
-            hourly_traffic = pd.DataFrame({
-                'pickup_hour': range(24),
-                'trip_count': np.random.randint(100, 1000, 24),
-                'avg_fare': np.random.uniform(10, 30, 24)
-            })
+            hourly_traffic = self._simulated_hourly_traffic()
         
         # 3. 热门上车点
         print("  分析热门上车点...")
@@ -148,28 +292,187 @@ class PandasDataProcessor:
             }).reset_index()
             passenger_stats.columns = ['passenger_count', 'trip_count', 'avg_fare']
         else:
-            passenger_stats = pd.DataFrame({
-                'passenger_count': [1, 2, 3, 4, 5],
-                'trip_count': [5000, 3000, 1500, 400, 100],
-                'avg_fare': [15.5, 18.2, 20.1, 22.5, 25.0]
-            })
+            passenger_stats = self._simulated_passenger_stats()
         
-        return {
+        results = {
             "hot_routes": hot_routes,
             "hourly_traffic": hourly_traffic,
             "pickup_hotspots": pickup_hotspots,
             "passenger_stats": passenger_stats
         }
+        
+        # 5. 筛选立方体（PU × DO × 小时 × 星期）
+        cube = partial_aggregate(df, dimensions=["trip_cube"]).get("trip_cube")
+        if cube is not None:
+            print("  构建筛选立方体...")
+            results["trip_cube"] = finalize_cube(cube)
+        
+        return results
+
+    def _simulated_hourly_traffic(self):
+        """缺少上车时间列时的模拟小时数据"""
+        return pd.DataFrame({
+            'pickup_hour': range(24),
+            'trip_count': np.random.randint(100, 1000, 24),
+            'avg_fare': np.random.uniform(10, 30, 24)
+        })
+
+    def _simulated_passenger_stats(self):
+        """缺少乘客数列时的模拟乘客数据"""
+        return pd.DataFrame({
+            'passenger_count': [1, 2, 3, 4, 5],
+            'trip_count': [5000, 3000, 1500, 400, 100],
+            'avg_fare': [15.5, 18.2, 20.1, 22.5, 25.0]
+        })
+
+    def _aggregate_batches(self, batches):
+        """逐批清洗并合并部分聚合，返回 (部分聚合, OD矩阵, 清洗前行数, 清洗后行数)"""
+        accumulator = PartialAccumulator()
+        od_matrix = ODMatrix()
+        initial_count = 0
+        cleaned_count = 0
+        
+        for batch in batches:
+            batch_clean = self.clean_data(batch, verbose=False)
+            initial_count += len(batch)
+            cleaned_count += len(batch_clean)
+            accumulator.add(AGGREGATION_ENGINES[self.engine](batch_clean))
+            od_matrix = od_matrix + ODMatrix.from_frame(batch_clean)
+        
+        return accumulator.result(), od_matrix, initial_count, cleaned_count
+
+    def _aggregate_file(self, file_path, batch_size):
+        """聚合单个文件（可在子进程中运行）"""
+        merged, od_matrix, initial_count, cleaned_count = self._aggregate_batches(
+            self._iter_file_batches(file_path, batch_size))
+        if file_path.suffix.lower() == '.parquet':
+            # 下推过滤掉的行不会进入批次，用元数据行数作为清洗前行数
+            initial_count = self._open_dataset(file_path).count_rows()
+        print(f"  ✅ {file_path.name}: {initial_count:,} 行")
+        return merged, od_matrix, initial_count, cleaned_count
+
+    def analyze_chunked(self, batch_size=DEFAULT_BATCH_SIZE, workers=None):
+        """分块模式：逐批清洗并合并部分聚合，峰值内存与数据总量无关
+        
+        多个文件时按文件并行聚合（每个进程一个文件），最后合并。
+        """
+        print("📊 分块分析数据...")
+        
+        if not self.data_files:
+            outputs = [self._aggregate_batches(self.iter_batches(batch_size))]
+        else:
+            outputs = self._aggregate_files(self.data_files, batch_size, workers)
+        
+        merged = merge_partials([output[0] for output in outputs])
+        self.od_matrix = sum((output[1] for output in outputs), ODMatrix())
+        initial_count = sum(output[2] for output in outputs)
+        cleaned_count = sum(output[3] for output in outputs)
+        
+        print("🧹 清洗统计:")
+        self._print_clean_summary(initial_count, cleaned_count)
+        
+        return self._finalize_results(merged)
+
+    def _aggregate_files(self, data_files, batch_size, workers=None):
+        """按文件并行聚合（每个进程一个文件），返回每个文件的聚合输出"""
+        workers = min(workers or os.cpu_count() or 1, len(data_files))
+        print(f"  {len(data_files)} 个文件, {workers} 个进程, 每批 {batch_size:,} 行")
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(self._aggregate_file, data_files, repeat(batch_size)))
+        return [self._aggregate_file(f, batch_size) for f in data_files]
+
+    def analyze_incremental(self, batch_size=DEFAULT_BATCH_SIZE, workers=None):
+        """增量模式：只聚合上次运行之后新增的文件，并入持久化的部分聚合
+        
+        已导入的文件被修改或删除时整体重建。
+        """
+        print("📊 增量分析数据...")
+        
+        if not self.data_files:
+            print("⚠️  未找到数据文件，增量模式不适用，改用分块模式")
+            return self.analyze_chunked(batch_size, workers)
+        
+        state = IngestState(self.state_dir)
+        new_files, stale_files = state.plan(self.data_files)
+        
+        merged = {} if state.is_empty else load_partials(self.state_dir / "partials")
+        if stale_files:
+            print(f"⚠️  {len(stale_files)} 个已导入文件被修改或删除，重建全部聚合")
+        elif "hourly_traffic" in merged and "trip_cube" not in merged:
+            # 筛选立方体加入之前保存的状态：只并入新文件会得到不完整的立方体
+            print("⚠️  已保存的聚合缺少筛选立方体，重建全部聚合")
+            stale_files = True
+        if stale_files:
+            state.reset()
+            new_files = list(self.data_files)
+            merged = {}
+        
+        if state.is_empty:
+            self.od_matrix = ODMatrix()
+        else:
+            od_path = self.state_dir / "od_matrix.npz"
+            self.od_matrix = ODMatrix.load(od_path) if od_path.exists() else ODMatrix()
+        
+        print(f"  已导入 {len(state.files)} 个文件, 新文件 {len(new_files)} 个")
+        
+        if new_files:
+            outputs = self._aggregate_files(new_files, batch_size, workers)
+            merged = merge_partials([merged] + [output[0] for output in outputs])
+            self.od_matrix = sum((output[1] for output in outputs), self.od_matrix)
+            
+            def write_aggregates(directory):
+                save_partials(merged, directory / "partials")
+                self.od_matrix.save(directory / "od_matrix.npz")
+            
+            state.commit(new_files, write_aggregates, totals={
+                "initial_rows": int(sum(output[2] for output in outputs)),
+                "cleaned_rows": int(sum(output[3] for output in outputs)),
+            })
+        else:
+            print("  ✅ 没有新文件，直接使用已保存的聚合")
+        
+        print("🧹 清洗统计 (累计):")
+        self._print_clean_summary(state.totals.get("initial_rows", 0), state.totals.get("cleaned_rows", 0))
+        
+        return self._finalize_results(merged)
+
+    def analyze_fused(self, df):
+        """融合引擎：一次遍历计算所有维度表"""
+        print("📊 分析数据 (融合引擎)...")
+        return self._finalize_results(fused_partial_aggregate(df))
+
+    def _finalize_results(self, partials):
+        """把部分聚合转换为最终结果表，缺失的维度用模拟数据补齐"""
+        results = finalize_partials(partials)
+        if "hourly_traffic" not in results:
+            results["hourly_traffic"] = self._simulated_hourly_traffic()
+        if "passenger_stats" not in results:
+            results["passenger_stats"] = self._simulated_passenger_stats()
+        
+        final = {
+            "hot_routes": results["hot_routes"],
+            "hourly_traffic": results["hourly_traffic"],
+            "pickup_hotspots": results["pickup_hotspots"],
+            "passenger_stats": results["passenger_stats"]
+        }
+        if "trip_cube" in results:
+            final["trip_cube"] = results["trip_cube"]
+        return final
     
     def save_results(self, results):
         """保存结果"""
         print("💾 保存结果...")
         
+        # 保存为Arrow IPC + manifest（CSV为可选导出）
+        write_results(results, self.output_dir, csv_export=self.csv_export)
         for name, df in results.items():
-            # 保存为CSV
-            csv_path = self.output_dir / f"{name}.csv"
-            df.to_csv(csv_path, index=False)
-            print(f"  ✅ {name}: {len(df):,} 行 -> {csv_path}")
+            print(f"  ✅ {name}: {len(df):,} 行 -> {self.output_dir / name}.feather")
+        
+        # 保存完整OD矩阵（任意路线可查询，不受hot_routes截断影响）
+        if self.od_matrix is not None:
+            od_path = self.od_matrix.save(self.output_dir / "od_matrix.npz")
+            print(f"  ✅ od_matrix: {self.od_matrix.total_trips:,} 次行程 -> {od_path}")
         
         # 生成报告
         report_path = self.output_dir / "analysis_report.txt"
@@ -183,28 +486,60 @@ class PandasDataProcessor:
                 f.write(f"  {name}: {len(df)} 行\n")
         
         print(f"📝 报告已保存: {report_path}")
+        
+        # 结构化报告（阶段计量在 run 结束时写入 "stages"）
+        report = {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "engine": self.engine,
+            "processing_time_seconds": round(time.time() - self.start_time, 2),
+            "datasets": {name: {"row_count": len(df), "column_count": len(df.columns)}
+                         for name, df in results.items()},
+        }
+        with open(self.output_dir / "analysis_report.json", 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
     
-    def run(self):
+    def run(self, chunked=False, batch_size=DEFAULT_BATCH_SIZE, workers=None, incremental=False):
         """运行完整流程"""
         print("=" * 60)
         print("NYC Taxi 数据分析流程 (Pandas版)")
         print("=" * 60)
         
+        stages = self.stage_metrics
         try:
-            # 1. 加载数据
-            df = self.load_data()
-            
-            # 2. 清洗数据
-            df_clean = self.clean_data(df)
-            
-            # 3. 分析数据
-            results = self.analyze_data(df_clean)
+            if incremental:
+                # 1-3. 只处理新文件，并入已保存的部分聚合
+                with stages.stage("analyze_incremental"):
+                    results = self.analyze_incremental(batch_size, workers)
+            elif chunked:
+                # 1-3. 分块加载、清洗、分析
+                with stages.stage("analyze_chunked"):
+                    results = self.analyze_chunked(batch_size, workers)
+            else:
+                # 1. 加载数据（输出按原始行数计；下推过滤在读取时完成，实际读入行数另记）
+                with stages.stage("load") as stage:
+                    df = self.load_data()
+                    raw_rows = self.raw_row_count
+                    stage["rows_out"] = raw_rows
+                    stage["rows_read"] = len(df)
+                
+                # 2. 清洗数据（含读取时下推过滤掉的行）
+                with stages.stage("clean", rows_in=raw_rows) as stage:
+                    df_clean = self.clean_data(df, initial_count=raw_rows)
+                    stage["rows_out"] = len(df_clean)
+                
+                # 3. 分析数据
+                with stages.stage("analyze", rows_in=len(df_clean)):
+                    results = self.analyze_data(df_clean)
             
             # 4. 保存结果
-            self.save_results(results)
+            with stages.stage("save"):
+                self.save_results(results)
+            stages.write_to_report(self.output_dir / "analysis_report.json")
             
             # 5. 显示摘要
             total_time = time.time() - self.start_time
+            print("\n⏱️  阶段耗时:")
+            print(stages.summary())
             print(f"\n✅ 分析完成！总耗时: {total_time:.2f} 秒")
             print(f"📁 结果保存在: {self.output_dir}")
             
@@ -222,8 +557,24 @@ class PandasDataProcessor:
 
 def main():
     """主函数"""
-    processor = PandasDataProcessor()
-    processor.run()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="NYC Taxi 数据分析 (Pandas版)")
+    parser.add_argument("--engine", choices=sorted(AGGREGATION_ENGINES), default="groupby", help="聚合引擎")
+    parser.add_argument("--chunked", action="store_true", help="分块模式（适合超出内存的大文件）")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="分块模式每批行数")
+    parser.add_argument("--workers", type=int, default=None, help="分块模式并行进程数（默认CPU核数）")
+    parser.add_argument("--incremental", action="store_true", help="增量模式：只处理上次运行后新增的文件")
+    parser.add_argument("--csv", action="store_true", help="同时导出CSV")
+    parser.add_argument("--log-stages", action="store_true", help="每个阶段结束时输出一行JSON日志")
+    
+    args = parser.parse_args()
+    
+    if args.log_stages:
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+    processor = PandasDataProcessor(engine=args.engine, csv_export=args.csv, log_stages=args.log_stages)
+    processor.run(chunked=args.chunked, batch_size=args.batch_size, workers=args.workers,
+                  incremental=args.incremental)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
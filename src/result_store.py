@@ -0,0 +1,129 @@
+"""
+分析结果存储 - 处理器与 app.py 之间的交接格式
+
+结果表写成未压缩的 Arrow IPC (Feather v2) 文件，并附带 manifest.json 记录
+每个数据集的文件名、行数和列类型。读取时内存映射文件，不需要文本解析和类型推断；
+CSV 只作为可选导出保留，旧的只有 CSV 的目录仍可读取。
+"""
+import json
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+MANIFEST_NAME = "manifest.json"
+RESULT_SUFFIX = ".feather"
+
+
+def write_results(results, output_dir, csv_export=False):
+    """写出结果表和 manifest，返回 manifest 内容
+
+    results: {数据集名: pandas DataFrame}
+    manifest 每次重新生成，只含本次写出的数据集；上次写出而本次没有的
+    数据集连同文件一起删除，避免仪表板读到过期结果。
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    previous = read_manifest(output_dir) or {"datasets": {}}
+    for name, entry in previous["datasets"].items():
+        if name not in results:
+            for stale in (output_dir / entry["file"], output_dir / f"{name}.csv"):
+                stale.unlink(missing_ok=True)
+
+    manifest = {"generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "datasets": {}}
+
+    for name, df in results.items():
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        file_name = f"{name}{RESULT_SUFFIX}"
+        # 不压缩，读取端才能直接内存映射
+        feather.write_feather(table, output_dir / file_name, compression="uncompressed")
+
+        manifest["datasets"][name] = {
+            "file": file_name,
+            "rows": table.num_rows,
+            "schema": {field.name: str(field.type) for field in table.schema},
+        }
+
+        if csv_export:
+            df.to_csv(output_dir / f"{name}.csv", index=False)
+
+    with open(output_dir / MANIFEST_NAME, "w") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    return manifest
+
+
+def read_manifest(data_dir):
+    """读取 manifest，不存在时返回 None"""
+    manifest_path = Path(data_dir) / MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def read_result(path):
+    """内存映射读取一个 Arrow IPC 结果文件"""
+    # 不关闭映射：表中的缓冲区直接引用映射内存，随表一起释放
+    source = pa.memory_map(str(path), "r")
+    table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def list_results(data_dir):
+    """列出目录中的结果数据集（不读取数据）
+
+    返回 {数据集名: {"path": 文件路径, "rows": 行数}}；manifest 中的数据集
+    优先，其余 CSV 作为回退，行数未知时为 None。
+    """
+    data_dir = Path(data_dir)
+    entries = {}
+
+    manifest = read_manifest(data_dir) or {"datasets": {}}
+    for name, entry in manifest["datasets"].items():
+        entries[name] = {"path": data_dir / entry["file"], "rows": entry.get("rows")}
+
+    for csv_file in sorted(data_dir.glob("*.csv")):
+        if csv_file.stem not in entries:
+            entries[csv_file.stem] = {"path": csv_file, "rows": None}
+
+    return entries
+
+
+def read_dataset(path):
+    """按文件类型读取单个结果数据集"""
+    path = Path(path)
+    if path.suffix == RESULT_SUFFIX:
+        return read_result(path)
+    return pd.read_csv(path)
+
+
+def count_csv_rows(path):
+    """统计CSV数据行数（按块数换行符，不解析内容）"""
+    lines = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        lines += 1
+    return max(lines - 1, 0)
+
+
+def load_results(data_dir, on_error=None):
+    """加载目录中的所有结果表 - manifest中的数据集读Arrow文件，其余回退到CSV
+
+    on_error(file_name, exception) 在单个文件读取失败时调用。
+    """
+    results = {}
+    for name, entry in list_results(data_dir).items():
+        try:
+            results[name] = read_dataset(entry["path"])
+        except Exception as e:
+            if on_error:
+                on_error(entry["path"].name, e)
+    return results
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+"""
+统一入口 - 按输入规模自动选择 pandas 或 Spark 引擎
+
+不读取数据本身：Parquet行数来自文件footer元数据，CSV按文件大小和前几行的
+平均行长估算；再结合可用内存、CPU核数和Spark是否可用选择引擎：
+  - pandas:         数据能舒适地放进内存时，进程内融合(bincount)引擎最快
+  - pandas-chunked: 放不进内存时按批流式聚合，按文件多进程并行，内存只取决于批大小
+  - spark:          数据量达到 SPARK_MIN_ROWS 且机器核数足够时使用本地Spark
+阈值可以用 benchmark_pipeline.py 在目标机器上重新校准。
+
+无论选哪个引擎，结果都投影到 UNIFIED_SCHEMAS 中相同的数据集、列和类型，
+写到 output/unified（Arrow IPC + manifest，与处理器的输出格式一致）。
+"""
+import importlib.util
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+# 添加项目根目录到Python路径
+current_file = Path(__file__).resolve()
+project_root = current_file.parent.parent
+sys.path.append(str(project_root))
+
+from src.result_store import list_results, read_dataset, write_results
+from src.trip_aggregates import CUBE_COLUMNS, OTHER_DESTINATION
+from src.od_matrix import ODMatrix, N_ZONES
+
+ENGINES = ("pandas", "pandas-chunked", "spark")
+
+# 内存模式下每行的大致峰值内存（分析列解码 + 时间特征 + 聚合中间结果）
+BYTES_PER_ROW_IN_MEMORY = 200
+# 内存模式最多使用可用内存的比例
+IN_MEMORY_FRACTION = 0.3
+# 使用Spark的最小行数和最少CPU核数
+SPARK_MIN_ROWS = 100_000_000
+SPARK_MIN_CORES = 8
+# 无法检测可用内存时的假设值
+DEFAULT_AVAILABLE_MEMORY = 4 * 2 ** 30
+# CSV行数估算时采样的行数
+CSV_SAMPLE_LINES = 1000
+
+# 统一输出：数据集 -> {列名: 类型}
+UNIFIED_SCHEMAS = {
+    "hot_routes": {"PULocationID": "int64", "DOLocationID": "int64", "trip_count": "int64",
+                   "avg_fare": "float64", "avg_distance": "float64", "fare_std": "float64"},
+    "pickup_hotspots": {"PULocationID": "int64", "pickup_count": "int64", "avg_fare": "float64"},
+    "dropoff_hotspots": {"DOLocationID": "int64", "dropoff_count": "int64", "avg_fare": "float64"},
+    "hourly_traffic": {"pickup_hour": "int64", "trip_count": "int64", "avg_fare": "float64"},
+    "daily_traffic": {"pickup_dayofweek": "int64", "trip_count": "int64", "avg_fare": "float64"},
+    "passenger_stats": {"passenger_count": "int64", "trip_count": "int64", "avg_fare": "float64"},
+    "trip_cube": dict(zip(CUBE_COLUMNS, ["int16", "int16", "int8", "int8", "int64", "float64", "float64"])),
+}
+
+# 只有部分引擎输出的数据集（Spark预处理时广播标注了行政区），有就按相同方式投影
+OPTIONAL_SCHEMAS = {
+    "borough_stats": {"borough": "object", "pickup_count": "int64", "dropoff_count": "int64",
+                      "avg_fare": "float64", "avg_distance": "float64", "intra_borough_share": "float64"},
+    "borough_flows": {"pickup_borough": "object", "dropoff_borough": "object", "trip_count": "int64",
+                      "avg_fare": "float64", "avg_distance": "float64", "avg_duration": "float64"},
+}
+
+# 热点表保留的区域数（与处理器一致）
+HOTSPOT_LIMIT = 50
+
+
+def discover_data_files():
+    """与处理器相同的发现规则（data/raw 中优先Parquet，没有时才用CSV）"""
+    data_dir = project_root / "data" / "raw"
+    parquet_files = sorted(data_dir.glob("*.parquet"))
+    return parquet_files or sorted(data_dir.glob("*.csv"))
+
+
+def _estimate_csv_rows(path):
+    """按文件大小 / 前 CSV_SAMPLE_LINES 行的平均字节数估算CSV行数"""
+    with open(path, "rb") as f:
+        f.readline()  # 表头
+        lengths = [len(line) for _, line in zip(range(CSV_SAMPLE_LINES), f)]
+    if not lengths:
+        return 0
+    return int(os.path.getsize(path) / (sum(lengths) / len(lengths)))
+
+
+def count_input_rows(data_files):
+    """输入的总行数（Parquet为精确值，CSV为估算值）"""
+    total = 0
+    for path in data_files:
+        if path.suffix.lower() == ".parquet":
+            total += ds.dataset(str(path), format="parquet").count_rows()
+        else:
+            total += _estimate_csv_rows(path)
+    return total
+
+
+def available_memory():
+    """可用内存（字节）：Linux读 /proc/meminfo 的 MemAvailable，其他系统用 sysconf"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def spark_available():
+    """是否可以启动本地Spark（已安装pyspark且能找到Java）"""
+    if importlib.util.find_spec("pyspark") is None:
+        return False
+    java_home = os.environ.get("JAVA_HOME")
+    if java_home and (Path(java_home) / "bin" / "java").exists():
+        return True
+    return shutil.which("java") is not None
+
+
+def select_engine(data_files):
+    """根据输入规模和机器资源选择引擎，返回包含选择理由的字典"""
+    rows = count_input_rows(data_files) if data_files else 0
+    memory = available_memory()
+    cores = os.cpu_count() or 1
+    has_spark = spark_available()
+    parquet_only = bool(data_files) and all(f.suffix.lower() == ".parquet" for f in data_files)
+
+    budget = (memory or DEFAULT_AVAILABLE_MEMORY) * IN_MEMORY_FRACTION
+    needed = rows * BYTES_PER_ROW_IN_MEMORY
+
+    if needed <= budget:
+        engine = "pandas"
+        reason = f"预计内存 {needed / 2 ** 30:.2f} GB，不超过可用内存的 {IN_MEMORY_FRACTION:.0%}"
+    elif rows >= SPARK_MIN_ROWS and cores >= SPARK_MIN_CORES and has_spark and parquet_only:
+        engine = "spark"
+        reason = f"{rows:,} 行超过 {SPARK_MIN_ROWS:,} 行，{cores} 核可用"
+    else:
+        engine = "pandas-chunked"
+        reason = f"预计内存 {needed / 2 ** 30:.2f} GB 超过可用内存的 {IN_MEMORY_FRACTION:.0%}，按批流式处理"
+        if rows >= SPARK_MIN_ROWS and not has_spark:
+            reason += "（Spark不可用）"
+
+    return {
+        "engine": engine,
+        "reason": reason,
+        "rows": rows,
+        "available_memory": memory,
+        "cores": cores,
+        "spark_available": has_spark,
+    }
+
+
+def _run_engine(engine, workers=None):
+    """运行选中的引擎，返回其输出目录"""
+    if engine == "spark":
+        from src.spark_advanced_processor import AdvancedNYCDataProcessor
+
+        # 统一输出只需要基础指标：立方体模式一次扫描算完；聚类请直接运行Spark处理器
+        processor = AdvancedNYCDataProcessor()
+        basic_results, _ = processor.run(use_advanced=False, use_cube=True)
+        if basic_results is None:
+            raise RuntimeError("Spark处理失败")
+        return processor.output_dir
+
+    from src.pandas_processor import PandasDataProcessor
+
+    processor = PandasDataProcessor(engine="fused")
+    if processor.run(chunked=engine == "pandas-chunked", workers=workers) is None:
+        raise RuntimeError("pandas处理失败")
+    return processor.output_dir
+
+
+def _rollup_cube(cube, key, count_col, limit=None):
+    """从立方体按一个键汇总 trip_count 和 avg_fare（用于补齐pandas没有的维度表）"""
+    rolled = cube.groupby(key)[["trip_count", "fare_sum"]].sum().reset_index()
+    rolled["avg_fare"] = rolled["fare_sum"] / rolled["trip_count"]
+    rolled = rolled.rename(columns={"trip_count": count_col})
+    if limit is not None:
+        rolled = rolled.sort_values(count_col, ascending=False).head(limit)
+    return rolled
+
+
+def _dropoff_hotspots(source_dir, cube):
+    """下车热点：有完整OD矩阵时按列汇总；否则从立方体上卷（立方体只保留热门路线的下车区域）"""
+    od_path = Path(source_dir) / "od_matrix.npz"
+    if od_path.exists():
+        arrays = ODMatrix.load(od_path).arrays
+        cube = pd.DataFrame({
+            "DOLocationID": np.arange(N_ZONES),
+            "trip_count": arrays["trip_count"].sum(axis=0),
+            "fare_sum": arrays["fare_sum"].sum(axis=0),
+        })
+    cube = cube[(cube["DOLocationID"] != OTHER_DESTINATION) & (cube["trip_count"] > 0)]
+    return _rollup_cube(cube, "DOLocationID", "dropoff_count", HOTSPOT_LIMIT)
+
+
+def unify_results(source_dir):
+    """读取引擎的输出，投影为 UNIFIED_SCHEMAS（及引擎输出了的 OPTIONAL_SCHEMAS）的数据集、列和类型"""
+    entries = list_results(source_dir)
+    schemas = {**UNIFIED_SCHEMAS, **OPTIONAL_SCHEMAS}
+    results = {name: read_dataset(entries[name]["path"]) for name in schemas if name in entries}
+
+    # pandas引擎不单独输出下车热点和星期分布，由立方体上卷得到
+    if "trip_cube" in results:
+        cube = results["trip_cube"]
+        if "dropoff_hotspots" not in results:
+            results["dropoff_hotspots"] = _dropoff_hotspots(source_dir, cube)
+        if "daily_traffic" not in results:
+            results["daily_traffic"] = _rollup_cube(cube, "pickup_dayofweek", "trip_count")
+
+    unified = {}
+    for name, schema in schemas.items():
+        if name not in results:
+            if name in UNIFIED_SCHEMAS:
+                print(f"  ⚠️  {name}: 引擎没有输出，跳过")
+            continue
+        frame = results[name][list(schema)].dropna(subset=[c for c, t in schema.items() if t.startswith("int")])
+        unified[name] = frame.astype(schema).reset_index(drop=True)
+    return unified
+
+
+def run(engine="auto", output_dir=None, workers=None):
+    """统一入口：选择（或使用指定的）引擎运行，并把结果写成统一格式
+
+    返回 (选择信息, {数据集名: DataFrame})
+    """
+    output_dir = Path(output_dir) if output_dir else project_root / "output" / "unified"
+
+    choice = select_engine(discover_data_files())
+    if engine != "auto":
+        choice.update(engine=engine, reason="手动指定")
+
+    memory = choice["available_memory"]
+    print("🧭 引擎选择:")
+    print(f"  输入行数: {choice['rows']:,}")
+    print(f"  可用内存: {f'{memory / 2 ** 30:.1f} GB' if memory else '未知'}, CPU核数: {choice['cores']}, "
+          f"Spark: {'可用' if choice['spark_available'] else '不可用'}")
+    print(f"  ➜ {choice['engine']}: {choice['reason']}")
+
+    source_dir = _run_engine(choice["engine"], workers=workers)
+
+    print(f"📦 统一输出 -> {output_dir}")
+    results = unify_results(source_dir)
+    write_results(results, output_dir)
+    od_path = Path(source_dir) / "od_matrix.npz"
+    if od_path.exists():
+        shutil.copy2(od_path, output_dir / od_path.name)
+    for name, df in results.items():
+        print(f"  ✅ {name}: {len(df):,} 行")
+
+    return choice, results
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="NYC Taxi 数据分析（自动选择引擎）")
+    parser.add_argument("--engine", choices=("auto",) + ENGINES, default="auto", help="处理引擎（默认自动选择）")
+    parser.add_argument("--workers", type=int, default=None, help="分块模式并行进程数（默认CPU核数）")
+    parser.add_argument("--output", default=None, help="统一输出目录（默认 output/unified）")
+    parser.add_argument("--dry-run", action="store_true", help="只显示引擎选择，不运行")
+
+    args = parser.parse_args()
+
+    if args.dry_run:
+        choice = select_engine(discover_data_files())
+        for key, value in choice.items():
+            print(f"{key}: {value}")
+        return
+
+    run(engine=args.engine, output_dir=args.output, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,85 +2,147 @@
 高级Spark处理器 - 基于你NLP项目的经验
 """
 import sys
+import json
 import time
+import logging
 from pathlib import Path
 from datetime import datetime
 import pandas as pd
 import numpy as np
+import pyarrow.dataset as ds
 
 # 添加项目根目录到Python路径
 project_root = Path(__file__).parent.parent
 sys.path.append(str(project_root))
 
 from src.path_utils import get_data_path, get_project_root
+from src.od_matrix import ODMatrix
+from src.result_store import write_results
+from src.synthetic_trips import write_trips
+from src.ingest_state import IngestState, file_fingerprint
+from src.stage_metrics import StageMetrics
+from src.location_utils import LocationDataManager
+from src.trip_aggregates import CUBE_TOP_ROUTES, OTHER_DESTINATION
 import findspark
 findspark.init()
 
-from pyspark.sql import SparkSession
 from pyspark.sql.functions import *
 from pyspark.sql.types import *
 from pyspark.sql.window import Window
-from pyspark.ml.feature import VectorAssembler, StandardScaler
-from pyspark.ml.clustering import KMeans
+from pyspark import StorageLevel
+from pyspark.ml.feature import VectorAssembler, StandardScaler, StandardScalerModel
+from pyspark.ml.clustering import KMeans, KMeansModel
+
+from src.spark_session import get_spark_session
+
+# 费用聚类使用的特征列
+FARE_FEATURES = ["trip_distance", "trip_duration_minutes", "total_amount"]
+FARE_CLUSTERS = 3
+KMEANS_SEED = 42
+# 抽样训练时每个上车小时至少保留的行数（行程少的小时按更高比例抽样）
+KMEANS_MIN_SAMPLE_PER_HOUR = 2000
+# 与模型一起保存的训练参数和输入指纹，不一致时重新训练
+MODEL_PARAMS_NAME = "model_params.json"
+
+# 清洗后行程的分区列和每个文件的最大行数
+CLEANED_PARTITION_COLUMNS = ["pickup_year", "pickup_month"]
+CLEANED_MAX_RECORDS_PER_FILE = 5_000_000
+
+# 细粒度聚合立方体的维度 - 所有基础指标都可以从它上卷得到
+CUBE_DIMENSIONS = ["PULocationID", "DOLocationID", "pickup_hour", "pickup_dayofweek", "passenger_count"]
+
+# 发布给仪表板的筛选立方体（去掉乘客数维度，长尾路线折叠），列与 trip_aggregates.CUBE_COLUMNS 一致
+FILTER_CUBE_DIMENSIONS = CUBE_DIMENSIONS[:4]
+
+# 预处理时由广播的区域表标注的列（区域ID不在区域表中时为 "Unknown"）
+ZONE_COLUMNS = ["pickup_borough", "pickup_zone", "dropoff_borough", "dropoff_zone"]
+
+def check_sample_fraction(sample_fraction):
+    """校验聚类训练的抽样比例：None 表示全量，否则必须在 (0, 1] 内"""
+    if sample_fraction is not None and not 0 < sample_fraction <= 1:
+        raise ValueError(f"聚类训练抽样比例必须在 (0, 1] 内: {sample_fraction}")
+    return sample_fraction
 
 class AdvancedNYCDataProcessor:
-    def __init__(self, app_name="NYCTaxiAdvancedProcessor", master="local[*]"):
+    def __init__(self, app_name="NYCTaxiAdvancedProcessor", master=None, csv_export=False,
+                 log_stages=False):
         """初始化Spark会话 - 借鉴你NLP项目的配置"""
         self.start_time = time.time()
+        self.csv_export = csv_export
         self.project_root = get_project_root()
         self.output_dir = self.project_root / "output" / "spark_advanced"
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        # 已训练模型（标准化 + KMeans），后续运行直接复用
+        self.model_dir = self.output_dir / "models"
+        # 增量模式的导入记录和持久化聚合立方体
+        self.state_dir = self.output_dir / "state"
+        # 清洗后的行程（按上车年/月分区），可代替原始数据直接读取
+        self.cleaned_dir = self.project_root / "data" / "cleaned_trips"
+        # 本次运行输入数据的指纹（聚类模型据此判断是否过期）
+        self.input_fingerprint = {}
+        
+        # 流程中收集的行数等指标（避免重复count扫描）
+        self.metrics = {}
+        # 显式持久化的DataFrame，run结束时释放
+        self._persisted = []
+        # 区域表（location_id -> 行政区/区域名），首次使用时创建
+        self._zones = None
+        
+        # 创建Spark会话（共享工厂：按核数/内存/输入大小调优；master为None时沿用spark-submit的设置）
+        self.spark = get_spark_session(
+            app_name,
+            master=master,
+            input_paths=self._discover_data_files(),
+            extra_config={
+                "spark.sql.repl.eagerEval.enabled": "true",
+                "spark.ui.port": "4040",
+            },
+        )
         
-        # 创建Spark会话（使用你熟悉的配置方式）
-        self.spark = SparkSession.builder \
-            .appName(app_name) \
-            .master(master) \
-            .config("spark.executor.memory", "2g") \
-            .config("spark.driver.memory", "2g") \
-            .config("spark.sql.execution.arrow.pyspark.enabled", "true") \
-            .config("spark.sql.repl.eagerEval.enabled", "true") \
-            .config("spark.sql.adaptive.enabled", "true") \
-            .config("spark.sql.adaptive.coalescePartitions.enabled", "true") \
-            .config("spark.ui.port", "4040") \
-            .config("spark.logConf", "true") \
-            .getOrCreate()
-        
-        # 设置日志级别
-        self.spark.sparkContext.setLogLevel("WARN")
         print(f"✅ Spark会话已创建: {app_name}")
         
+        # 各阶段的耗时/内存/行数及触发的Spark作业，写入 analysis_report.json
+        self.stage_metrics = StageMetrics(spark=self.spark, log=log_stages)
+        
+    def _discover_data_files(self, file_pattern="*.parquet"):
+        """查找原始数据文件（排序后返回）"""
+        return sorted((self.project_root / "data" / "raw").glob(file_pattern))
+    
+    def _read_data_files(self, data_files):
+        """所有文件作为一个逻辑数据集，一次读取"""
+        suffixes = {f.suffix.lower() for f in data_files}
+        paths = [str(f) for f in data_files]
+        print(f"📄 加载 {len(data_files)} 个文件: {', '.join(f.name for f in data_files)}")
+        self.input_fingerprint = {f.name: file_fingerprint(f) for f in data_files}
+        
+        if suffixes == {'.parquet'}:
+            df = self.spark.read.option("mergeSchema", "true").parquet(*paths)
+            self.metrics["raw_rows"] = self._count_parquet_rows(data_files)
+        elif suffixes == {'.csv'}:
+            df = self.spark.read.csv(paths, header=True, inferSchema=True)
+        else:
+            raise ValueError(f"不支持的文件格式组合: {', '.join(sorted(suffixes))}")
+        return df
+    
     def load_and_validate_data(self, file_pattern="*.parquet"):
         """加载并验证数据"""
         print("📂 加载数据...")
         
-        data_dir = self.project_root / "data" / "raw"
-        
         # 查找所有数据文件
-        data_files = list(data_dir.glob(file_pattern))
+        data_files = self._discover_data_files(file_pattern)
         
         if not data_files:
             # 如果没有找到数据文件，创建示例数据
             print("⚠️  未找到数据文件，创建示例数据...")
-            df = self._create_sample_spark_data()
-            # 保存为Parquet
-            sample_path = data_dir / "yellow_tripdata_sample.parquet"
-            df.write.parquet(str(sample_path), mode="overwrite")
-            return df
-        else:
-            # 加载第一个文件（或多个文件）
-            file_path = data_files[0]
-            print(f"📄 加载文件: {file_path.name}")
-            
-            if file_path.suffix.lower() == '.parquet':
-                df = self.spark.read.parquet(str(file_path))
-            elif file_path.suffix.lower() == '.csv':
-                df = self.spark.read.csv(str(file_path), header=True, inferSchema=True)
-            else:
-                raise ValueError(f"不支持的文件格式: {file_path.suffix}")
+            data_dir = self.project_root / "data" / "raw"
+            return self._create_sample_spark_data(data_dir / "yellow_tripdata_sample.parquet")
+        
+        df = self._read_data_files(data_files)
         
         # 数据验证
         print("🔍 数据验证...")
-        print(f"  数据形状: {df.count():,} 行 × {len(df.columns)} 列")
+        raw_rows = self.metrics.get("raw_rows")
+        print(f"  数据形状: {f'{raw_rows:,}' if raw_rows is not None else '?'} 行 × {len(df.columns)} 列")
         print(f"  列名: {', '.join(df.columns[:10])}{'...' if len(df.columns) > 10 else ''}")
         df.printSchema()
         
@@ -90,87 +152,40 @@ class AdvancedNYCDataProcessor:
         
         return df
     
-    def _create_sample_spark_data(self, n_rows=10000):
-        """创建Spark示例数据（当没有真实数据时）"""
+    @staticmethod
+    def _count_parquet_rows(data_files):
+        """从Parquet footer元数据读取行数，不扫描数据"""
+        # 注意：本模块 import * 了 pyspark 函数，sum/max/round 等内置函数被覆盖，这里用numpy
+        return int(np.sum([ds.dataset(str(f), format="parquet").count_rows() for f in data_files]))
+    
+    def _persist(self, df, storage_level=StorageLevel.MEMORY_AND_DISK):
+        """持久化DataFrame并登记，run结束时统一unpersist"""
+        df = df.persist(storage_level)
+        self._persisted.append(df)
+        return df
+    
+    def _unpersist_all(self):
+        """释放所有持久化的DataFrame"""
+        for df in self._persisted:
+            df.unpersist()
+        self._persisted = []
+    
+    def _create_sample_spark_data(self, sample_path, n_rows=10000, seed=42):
+        """创建Spark示例数据（当没有真实数据时）- 向量化生成后写成Parquet再由Spark读取"""
         print("🎲 创建Spark示例数据...")
         
-        from pyspark.sql.types import StructType, StructField
-        from pyspark.sql.types import IntegerType, DoubleType, TimestampType, StringType
-        
-        schema = StructType([
-            StructField("VendorID", IntegerType(), True),
-            StructField("tpep_pickup_datetime", TimestampType(), True),
-            StructField("tpep_dropoff_datetime", TimestampType(), True),
-            StructField("passenger_count", IntegerType(), True),
-            StructField("trip_distance", DoubleType(), True),
-            StructField("PULocationID", IntegerType(), True),
-            StructField("DOLocationID", IntegerType(), True),
-            StructField("RatecodeID", IntegerType(), True),
-            StructField("store_and_fwd_flag", StringType(), True),
-            StructField("payment_type", IntegerType(), True),
-            StructField("fare_amount", DoubleType(), True),
-            StructField("extra", DoubleType(), True),
-            StructField("mta_tax", DoubleType(), True),
-            StructField("tip_amount", DoubleType(), True),
-            StructField("tolls_amount", DoubleType(), True),
-            StructField("improvement_surcharge", DoubleType(), True),
-            StructField("total_amount", DoubleType(), True),
-            StructField("congestion_surcharge", DoubleType(), True),
-        ])
-        
-        # 创建示例数据
-        np.random.seed(42)
-        
-        # 生成数据
-        data = []
-        base_time = datetime(2023, 1, 1)
-        
-        for i in range(n_rows):
-            pickup_time = base_time + pd.Timedelta(minutes=np.random.randint(0, 30*24*60))
-            dropoff_time = pickup_time + pd.Timedelta(minutes=np.random.randint(5, 60))
-            
-            trip_distance = np.random.exponential(3)  # 大多数行程较短
-            if trip_distance > 50:  # 限制异常值
-                trip_distance = 50
-                
-            fare_amount = 2.5 + trip_distance * 2.5 + np.random.randn() * 3
-            if fare_amount < 2.5:
-                fare_amount = 2.5
-                
-            tip_amount = fare_amount * np.random.choice([0, 0.1, 0.15, 0.2], p=[0.2, 0.3, 0.4, 0.1])
-            
-            row = (
-                1,  # VendorID
-                pickup_time,  # tpep_pickup_datetime
-                dropoff_time,  # tpep_dropoff_datetime
-                np.random.randint(1, 6),  # passenger_count
-                round(trip_distance, 2),  # trip_distance
-                np.random.randint(1, 264),  # PULocationID
-                np.random.randint(1, 264),  # DOLocationID
-                np.random.choice([1, 2, 3, 4, 5, 6]),  # RatecodeID
-                "N",  # store_and_fwd_flag
-                np.random.choice([1, 2, 3, 4, 5, 6]),  # payment_type
-                round(fare_amount, 2),  # fare_amount
-                round(np.random.choice([0, 0.5, 1.0]), 2),  # extra
-                0.5,  # mta_tax
-                round(tip_amount, 2),  # tip_amount
-                round(np.random.choice([0, 1.25, 4.5, 5.76]), 2),  # tolls_amount
-                0.3,  # improvement_surcharge
-                round(fare_amount + tip_amount + 0.5 + 0.3, 2),  # total_amount
-                round(np.random.choice([0, 2.5]), 2),  # congestion_surcharge
-            )
-            data.append(row)
+        write_trips(sample_path, n_rows, seed=seed)
+        self.metrics["raw_rows"] = n_rows
+        self.input_fingerprint = {sample_path.name: file_fingerprint(sample_path)}
         
-        df = self.spark.createDataFrame(data, schema=schema)
-        print(f"✅ 已创建 {n_rows:,} 行示例数据")
+        df = self.spark.read.parquet(str(sample_path))
+        print(f"✅ 已创建 {n_rows:,} 行示例数据 -> {sample_path}")
         return df
     
     def preprocess_data(self, df):
         """数据预处理"""
         print("🧹 数据预处理...")
         
-        initial_count = df.count()
-        
         # 1. 基本清洗
         df_clean = df.filter(
             (col("PULocationID").isNotNull()) &
@@ -190,6 +205,7 @@ class AdvancedNYCDataProcessor:
                           .withColumn("pickup_day", dayofmonth(col("tpep_pickup_datetime"))) \
                           .withColumn("pickup_dayofweek", dayofweek(col("tpep_pickup_datetime"))) \
                           .withColumn("pickup_month", month(col("tpep_pickup_datetime"))) \
+                          .withColumn("pickup_year", year(col("tpep_pickup_datetime"))) \
                           .withColumn("trip_duration_minutes", 
                                      (unix_timestamp(col("tpep_dropoff_datetime")) - 
                                       unix_timestamp(col("tpep_pickup_datetime"))) / 60)
@@ -213,7 +229,20 @@ class AdvancedNYCDataProcessor:
             (col("tip_percentage") < 100)  # 小费不超过车费
         )
         
+        # 5. 标注上下车的行政区和区域名（广播连接，不shuffle行程数据）
+        df_clean = self.enrich_with_zones(df_clean)
+        
+        # 持久化清洗结果：这里的count是唯一一次扫描源数据，后续分析全部复用缓存
+        df_clean = self._persist(df_clean)
         cleaned_count = df_clean.count()
+        
+        # Parquet的原始行数来自元数据；其他来源（CSV/示例数据）才需要单独count
+        initial_count = self.metrics.get("raw_rows")
+        if initial_count is None:
+            initial_count = df.count()
+            self.metrics["raw_rows"] = initial_count
+        self.metrics["cleaned_rows"] = cleaned_count
+        
         removed_percent = ((initial_count - cleaned_count) / initial_count * 100) if initial_count > 0 else 0
         
         print(f"  清洗前: {initial_count:,} 行")
@@ -222,6 +251,95 @@ class AdvancedNYCDataProcessor:
         
         return df_clean
     
+    def _zone_table(self):
+        """区域表的Spark DataFrame（263行），只来自真实区域数据（Shapefile或已处理的区域CSV）
+        
+        没有真实数据时返回None - 模拟区域的行政区是编造的，不能用来发布行政区统计。
+        """
+        if self._zones is None:
+            zones = LocationDataManager().get_zone_lookup()
+            if zones is None:
+                return None
+            self._zones = self.spark.createDataFrame(
+                zones.astype({"location_id": "int32", "borough": "object", "zone_name": "object"}))
+        return self._zones
+    
+    def enrich_with_zones(self, df):
+        """广播区域表，按 PULocationID/DOLocationID 加上 ZONE_COLUMNS
+        
+        区域表很小，广播到每个任务后在map端完成连接，行程数据不需要shuffle。
+        df 已有这些列时原样返回；没有真实区域数据时跳过标注（也就不输出行政区统计）。
+        """
+        if all(c in df.columns for c in ZONE_COLUMNS):
+            return df
+        zones = self._zone_table()
+        if zones is None:
+            print("  ⚠️  未找到真实区域数据（taxi_zones.zip 或 taxi_zones_processed.csv），"
+                  "跳过行政区标注和行政区统计")
+            return df
+        
+        for prefix, id_col in (("pickup", "PULocationID"), ("dropoff", "DOLocationID")):
+            side = zones.select(
+                col("location_id").alias(id_col),
+                col("borough").alias(f"{prefix}_borough"),
+                col("zone_name").alias(f"{prefix}_zone")
+            )
+            df = df.join(broadcast(side), on=id_col, how="left")
+        return df.fillna("Unknown", subset=ZONE_COLUMNS)
+    
+    def write_cleaned_trips(self, df_clean, hour_bucket=None):
+        """把清洗后的行程写成按上车年/月分区的Parquet
+        
+        按 (分区列, PULocationID) 做范围重分区：同一个月的数据按上车区域范围拆给多个
+        任务，每个月的文件数随数据量增长，而不是整月只由一个任务写出；每个文件覆盖
+        一段连续的区域，且文件内按PULocationID排序，Parquet统计信息可用于跳过无关
+        文件和行组。按时间过滤时直接裁剪分区。只覆盖本次数据涉及的分区，其他月份保留。
+        hour_bucket: 额外按 N 小时的时段分区（同一目录下应保持一致）。
+        """
+        print(f"💾 写出分区的清洗数据 -> {self.cleaned_dir}")
+        
+        partition_cols = list(CLEANED_PARTITION_COLUMNS)
+        if hour_bucket:
+            df_clean = df_clean.withColumn(
+                "pickup_hour_bucket",
+                (floor(col("pickup_hour") / hour_bucket) * hour_bucket).cast("int"))
+            partition_cols.append("pickup_hour_bucket")
+        
+        df_clean.repartitionByRange(*partition_cols, "PULocationID") \
+                .sortWithinPartitions("PULocationID") \
+                .write \
+                .partitionBy(*partition_cols) \
+                .option("partitionOverwriteMode", "dynamic") \
+                .option("maxRecordsPerFile", CLEANED_MAX_RECORDS_PER_FILE) \
+                .mode("overwrite") \
+                .parquet(str(self.cleaned_dir))
+        
+        print(f"  ✅ 分区列: {', '.join(partition_cols)}")
+    
+    def load_cleaned_trips(self, months=None):
+        """读取分区的清洗数据，跳过原始数据加载和预处理
+        
+        months: ["2023-01", ...]，只读取这些月份的分区。
+        """
+        print(f"📂 读取分区的清洗数据: {self.cleaned_dir}")
+        if not self.cleaned_dir.exists():
+            raise FileNotFoundError(f"未找到清洗数据，请先使用 --write-cleaned 运行: {self.cleaned_dir}")
+        
+        df_clean = self.spark.read.parquet(str(self.cleaned_dir))
+        self.input_fingerprint = {self.cleaned_dir.name: file_fingerprint(self.cleaned_dir), "months": months}
+        if months:
+            # 只引用分区列的过滤条件会在读取时裁剪分区
+            year_months = [int(m.replace("-", "")) for m in months]
+            df_clean = df_clean.filter((col("pickup_year") * 100 + col("pickup_month")).isin(year_months))
+            print(f"  月份: {', '.join(months)}")
+        
+        df_clean = self._persist(df_clean)
+        cleaned_count = df_clean.count()
+        self.metrics["cleaned_rows"] = cleaned_count
+        print(f"  清洗后: {cleaned_count:,} 行")
+        
+        return df_clean
+    
     def analyze_basic_metrics(self, df):
         """基础指标分析"""
         print("📊 基础指标分析...")
@@ -288,55 +406,444 @@ class AdvancedNYCDataProcessor:
                            .filter(col("passenger_count").isNotNull()) \
                            .orderBy("passenger_count")
         
+        # 6. 筛选立方体
+        trip_cube = self._filter_cube(df.groupBy(*FILTER_CUBE_DIMENSIONS).agg(
+            count("*").alias("trip_count"),
+            sum("total_amount").alias("fare_sum"),
+            sum("trip_distance").alias("distance_sum")
+        ))
+        
         return {
             "hot_routes": hot_routes,
             "pickup_hotspots": pickup_hotspots,
             "dropoff_hotspots": dropoff_hotspots,
             "hourly_traffic": hourly_traffic,
             "daily_traffic": daily_traffic,
-            "passenger_stats": passenger_stats
+            "passenger_stats": passenger_stats,
+            "trip_cube": trip_cube,
+            **self.analyze_borough_metrics(df)
+        }
+    
+    def analyze_borough_metrics(self, df, from_cube=False):
+        """行政区统计和行政区间流向
+        
+        明细模式直接按预处理时标注的行政区列聚合，与其他基础指标共用同一份缓存数据；
+        from_cube: df 是 build_trip_cube 的结果，先广播标注行政区再对和列求和。
+        没有真实区域数据时返回空字典。
+        """
+        df = self.enrich_with_zones(df)
+        if "pickup_borough" not in df.columns:
+            return {}
+        
+        if from_cube:
+            sums = [sum("trip_count").alias("trip_count"),
+                    sum("fare_sum").alias("fare_sum"),
+                    sum("distance_sum").alias("distance_sum"),
+                    sum("duration_sum").alias("duration_sum")]
+        else:
+            sums = [count("*").alias("trip_count"),
+                    sum("total_amount").alias("fare_sum"),
+                    sum("trip_distance").alias("distance_sum"),
+                    sum("trip_duration_minutes").alias("duration_sum")]
+        
+        # 行政区对的可加统计量（几十行），下面两个结果都从它上卷
+        pairs = self._persist(df.groupBy("pickup_borough", "dropoff_borough").agg(*sums))
+        
+        # 1. 行政区间流向
+        borough_flows = pairs.select(
+            "pickup_borough",
+            "dropoff_borough",
+            "trip_count",
+            (col("fare_sum") / col("trip_count")).alias("avg_fare"),
+            (col("distance_sum") / col("trip_count")).alias("avg_distance"),
+            (col("duration_sum") / col("trip_count")).alias("avg_duration")
+        ).orderBy(desc("trip_count"))
+        
+        # 2. 行政区统计 - 上车量、下车量和区内行程占比
+        pickups = pairs.groupBy(col("pickup_borough").alias("borough")).agg(
+            sum("trip_count").alias("pickup_count"),
+            (sum("fare_sum") / sum("trip_count")).alias("avg_fare"),
+            (sum("distance_sum") / sum("trip_count")).alias("avg_distance"),
+            (sum(when(col("pickup_borough") == col("dropoff_borough"), col("trip_count")).otherwise(0))
+             / sum("trip_count")).alias("intra_borough_share")
+        )
+        dropoffs = pairs.groupBy(col("dropoff_borough").alias("borough")).agg(
+            sum("trip_count").alias("dropoff_count")
+        )
+        borough_stats = pickups.join(dropoffs, on="borough", how="outer") \
+                               .fillna(0, subset=["pickup_count", "dropoff_count"]) \
+                               .orderBy(desc("pickup_count"))
+        
+        return {
+            "borough_stats": borough_stats,
+            "borough_flows": borough_flows
         }
     
-    def analyze_advanced_metrics(self, df):
-        """高级分析（聚类等）"""
+    @staticmethod
+    def _filter_cube(grouped):
+        """筛选立方体的输出形式 - 与 trip_aggregates.finalize_cube 相同
+        
+        行程数最多的 CUBE_TOP_ROUTES 条路线保留下车区域，其余路线折叠到
+        (上车区域, OTHER_DESTINATION)；键用最小整数类型并按键排序，仪表板按键切片。
+        """
+        top_routes = grouped.groupBy("PULocationID", "DOLocationID") \
+                            .agg(sum("trip_count").alias("route_trips")) \
+                            .orderBy(desc("route_trips"), "PULocationID", "DOLocationID") \
+                            .limit(CUBE_TOP_ROUTES) \
+                            .select("PULocationID", "DOLocationID", lit(True).alias("is_top_route"))
+        grouped = grouped.join(broadcast(top_routes), ["PULocationID", "DOLocationID"], "left") \
+                         .withColumn("DOLocationID", when(col("is_top_route"), col("DOLocationID"))
+                                     .otherwise(lit(OTHER_DESTINATION))) \
+                         .groupBy(*FILTER_CUBE_DIMENSIONS) \
+                         .agg(
+                             sum("trip_count").alias("trip_count"),
+                             sum("fare_sum").alias("fare_sum"),
+                             sum("distance_sum").alias("distance_sum")
+                         )
+        return grouped.select(
+            col("PULocationID").cast("short"),
+            col("DOLocationID").cast("short"),
+            col("pickup_hour").cast("byte"),
+            col("pickup_dayofweek").cast("byte"),
+            col("trip_count").cast("long"),
+            "fare_sum",
+            "distance_sum"
+        ).orderBy(*FILTER_CUBE_DIMENSIONS)
+    
+    def build_trip_cube(self, df):
+        """一次扫描清洗数据，按 (PU, DO, 小时, 星期, 乘客数) 计算可加统计量并持久化"""
+        print("🧊 构建细粒度聚合立方体...")
+        
+        cube = df.groupBy(*CUBE_DIMENSIONS) \
+                 .agg(
+                     count("*").alias("trip_count"),
+                     sum("total_amount").alias("fare_sum"),
+                     sum(col("total_amount") * col("total_amount")).alias("fare_sq_sum"),
+                     sum("trip_distance").alias("distance_sum"),
+                     sum("trip_duration_minutes").alias("duration_sum"),
+                     sum("tip_amount").alias("tip_sum"),
+                     sum("tip_percentage").alias("tip_percentage_sum")
+                 )
+        return self._persist(cube)
+    
+    def build_incremental_cube(self, file_pattern="*.parquet"):
+        """增量模式：只预处理新增文件，把它们的立方体并入已保存的立方体
+        
+        立方体只含可加统计量，合并就是按维度相加。已导入文件被修改或删除时整体重建。
+        """
+        print("📦 增量更新聚合立方体...")
+        
+        data_files = self._discover_data_files(file_pattern)
+        if not data_files:
+            raise FileNotFoundError("增量模式需要 data/raw 中的数据文件")
+        
+        state = IngestState(self.state_dir)
+        new_files, stale_files = state.plan(data_files)
+        if stale_files:
+            print(f"  ⚠️  {len(stale_files)} 个已导入文件被修改或删除，重建立方体")
+            state.reset()
+            new_files = list(data_files)
+        
+        cube_path = self.state_dir / "trip_cube.parquet"
+        print(f"  已导入 {len(state.files)} 个文件, 新文件 {len(new_files)} 个")
+        
+        if new_files:
+            new_cube = self.build_trip_cube(self.preprocess_data(self._read_data_files(new_files)))
+            if state.is_empty:
+                cube = new_cube
+            else:
+                measures = [c for c in new_cube.columns if c not in CUBE_DIMENSIONS]
+                cube = self.spark.read.parquet(str(cube_path)) \
+                           .unionByName(new_cube) \
+                           .groupBy(*CUBE_DIMENSIONS) \
+                           .agg(*[sum(c).alias(c) for c in measures])
+            
+            state.commit(new_files,
+                         lambda directory: cube.write.parquet(str(directory / cube_path.name)),
+                         totals={"raw_rows": self.metrics.get("raw_rows", 0),
+                                 "cleaned_rows": self.metrics["cleaned_rows"]})
+        else:
+            print("  ✅ 没有新文件，直接使用已保存的立方体")
+        
+        # 报告中的行数为所有已导入文件的累计值
+        self.metrics.update(state.totals)
+        
+        cube = self._persist(self.spark.read.parquet(str(cube_path)))
+        print(f"  立方体: {cube.count():,} 个分组")
+        return cube
+    
+    @staticmethod
+    def _rollup(cube, keys, averages, count_alias="trip_count"):
+        """从立方体上卷到指定维度
+        
+        averages: {输出列名: 立方体中的和列名}，均值 = 和 / 行程数
+        """
+        aggs = [sum("trip_count").alias(count_alias)]
+        aggs += [(sum(sum_col) / sum("trip_count")).alias(name) for name, sum_col in averages.items()]
+        return cube.groupBy(*keys).agg(*aggs)
+    
+    def analyze_basic_metrics_from_cube(self, cube):
+        """基础指标分析（立方体模式）- 与 analyze_basic_metrics 输出相同，
+        但昂贵的明细扫描只在构建立方体时发生一次，各维度只上卷小得多的立方体
+        """
+        print("📊 基础指标分析 (立方体模式)...")
+        
+        # 1. 热门路线（前100）- 样本标准差由平方和推出
+        n = sum("trip_count")
+        fare_sum = sum("fare_sum")
+        fare_std = sqrt(greatest(sum("fare_sq_sum") - fare_sum * fare_sum / n, lit(0.0)) / (n - 1))
+        hot_routes = cube.groupBy("PULocationID", "DOLocationID") \
+                         .agg(
+                             n.alias("trip_count"),
+                             (sum("distance_sum") / n).alias("avg_distance"),
+                             (fare_sum / n).alias("avg_fare"),
+                             (sum("duration_sum") / n).alias("avg_duration"),
+                             (sum("tip_sum") / n).alias("avg_tip"),
+                             when(n > 1, fare_std).alias("fare_std")
+                         ) \
+                         .filter(col("trip_count") > 5) \
+                         .orderBy(desc("trip_count")) \
+                         .limit(100)
+        
+        # 2. 区域热度分析
+        pickup_hotspots = self._rollup(cube, ["PULocationID"], {
+            "avg_fare": "fare_sum",
+            "avg_distance": "distance_sum",
+            "avg_duration": "duration_sum"
+        }, count_alias="pickup_count") \
+            .orderBy(desc("pickup_count")) \
+            .limit(50)
+        
+        dropoff_hotspots = self._rollup(cube, ["DOLocationID"], {
+            "avg_fare": "fare_sum"
+        }, count_alias="dropoff_count") \
+            .orderBy(desc("dropoff_count")) \
+            .limit(50)
+        
+        # 3. 时间分析
+        hourly_traffic = self._rollup(cube, ["pickup_hour"], {
+            "avg_fare": "fare_sum",
+            "avg_distance": "distance_sum",
+            "avg_tip_percentage": "tip_percentage_sum"
+        }).orderBy("pickup_hour")
+        
+        # 4. 星期分析
+        daily_traffic = self._rollup(cube, ["pickup_dayofweek"], {
+            "avg_fare": "fare_sum",
+            "avg_tip": "tip_sum"
+        }).orderBy("pickup_dayofweek")
+        
+        # 5. 乘客数量分析
+        passenger_stats = self._rollup(cube, ["passenger_count"], {
+            "avg_fare": "fare_sum",
+            "avg_distance": "distance_sum"
+        }) \
+            .filter(col("passenger_count").isNotNull()) \
+            .orderBy("passenger_count")
+        
+        # 6. 筛选立方体 - 上卷掉乘客数维度
+        trip_cube = self._filter_cube(cube.groupBy(*FILTER_CUBE_DIMENSIONS).agg(
+            sum("trip_count").alias("trip_count"),
+            sum("fare_sum").alias("fare_sum"),
+            sum("distance_sum").alias("distance_sum")
+        ))
+        
+        return {
+            "hot_routes": hot_routes,
+            "pickup_hotspots": pickup_hotspots,
+            "dropoff_hotspots": dropoff_hotspots,
+            "hourly_traffic": hourly_traffic,
+            "daily_traffic": daily_traffic,
+            "passenger_stats": passenger_stats,
+            "trip_cube": trip_cube,
+            **self.analyze_borough_metrics(cube, from_cube=True)
+        }
+    
+    def build_od_matrix(self, df, from_cube=False):
+        """构建完整的起终点矩阵 - 路线级可加统计量（最多 266×266 行）收集到driver
+        
+        from_cube: df 是 build_trip_cube 的结果，直接对和列再求和
+        """
+        print("🧭 构建OD矩阵...")
+        
+        if from_cube:
+            routes = df.groupBy("PULocationID", "DOLocationID") \
+                       .agg(
+                           sum("trip_count").alias("trip_count"),
+                           sum("fare_sum").alias("fare_sum"),
+                           sum("distance_sum").alias("distance_sum"),
+                           sum("duration_sum").alias("duration_sum")
+                       )
+        else:
+            routes = df.groupBy("PULocationID", "DOLocationID") \
+                       .agg(
+                           count("*").alias("trip_count"),
+                           sum("total_amount").alias("fare_sum"),
+                           sum("trip_distance").alias("distance_sum"),
+                           sum("trip_duration_minutes").alias("duration_sum")
+                       )
+        
+        od_matrix = ODMatrix.from_route_frame(routes.toPandas())
+        print(f"  ✅ OD矩阵: {od_matrix.total_trips:,} 次行程")
+        return od_matrix
+    
+    @staticmethod
+    def _hour_fractions(features_df, sample_fraction):
+        """每个上车小时的抽样比例：至少 sample_fraction，且尽量保留 KMEANS_MIN_SAMPLE_PER_HOUR 行"""
+        hour_counts = features_df.groupBy("pickup_hour").count().collect()
+        # 注意：本模块 import * 了 pyspark 函数，min/max 被覆盖，这里用numpy
+        return {row["pickup_hour"]: float(np.clip(KMEANS_MIN_SAMPLE_PER_HOUR / row["count"], sample_fraction, 1.0))
+                for row in hour_counts}
+    
+    def _fit_fare_clustering(self, features_df, sample_fraction=None):
+        """训练标准化和KMeans模型
+        
+        sample_fraction: 按上车小时分层抽样的比例，None表示使用全部数据。
+        行程少的小时按更高比例抽样，保证每个小时都有足够的行；KMeans按
+        1/抽样比例加权，聚类中心仍对应全量数据的分布。StandardScaler
+        不支持权重，改用同比例的均匀样本估计均值和标准差。
+        """
+        check_sample_fraction(sample_fraction)
+        train_df = features_df
+        scaler_df = features_df
+        weight_col = None
+        if sample_fraction:
+            scaler_df = features_df.sample(fraction=sample_fraction, seed=KMEANS_SEED)
+            fractions = self._hour_fractions(features_df, sample_fraction)
+            train_df = features_df.sampleBy("pickup_hour", fractions=fractions, seed=KMEANS_SEED)
+            weights = create_map([lit(x) for hour, fraction in fractions.items() for x in (hour, 1.0 / fraction)])
+            weight_col = "sample_weight"
+            train_df = train_df.withColumn(weight_col, weights[col("pickup_hour")])
+            boosted = [hour for hour, fraction in fractions.items() if fraction > sample_fraction]
+            print(f"  使用 {sample_fraction:.1%} 分层样本训练聚类模型"
+                  + (f"（{len(boosted)} 个小时提高了抽样比例）" if boosted else ""))
+        
+        # 标准化
+        scaler = StandardScaler(
+            inputCol="features",
+            outputCol="scaled_features",
+            withStd=True,
+            withMean=True
+        )
+        scaler_model = scaler.fit(scaler_df)
+        
+        # KMeans聚类
+        kmeans = KMeans(k=FARE_CLUSTERS, seed=KMEANS_SEED, featuresCol="scaled_features")
+        if weight_col:
+            kmeans = kmeans.setWeightCol(weight_col)
+        kmeans_model = kmeans.fit(scaler_model.transform(train_df))
+        
+        return scaler_model, kmeans_model
+    
+    def _model_params(self, sample_fraction):
+        """决定模型能否复用的训练参数和输入指纹（JSON可序列化）"""
+        return {
+            "features": FARE_FEATURES,
+            "k": FARE_CLUSTERS,
+            "seed": KMEANS_SEED,
+            "sample_fraction": sample_fraction,
+            "min_sample_per_hour": KMEANS_MIN_SAMPLE_PER_HOUR if sample_fraction else None,
+            # 抽样训练时标准化改用均匀样本，之前保存的模型不再复用
+            "scaler_sample": "uniform" if sample_fraction else None,
+            "inputs": self.input_fingerprint,
+        }
+    
+    def _load_fare_clustering(self, params):
+        """加载已保存的模型；不存在，或训练参数/输入数据与本次不一致时返回 (None, None)"""
+        scaler_path = self.model_dir / "fare_scaler"
+        kmeans_path = self.model_dir / "fare_kmeans"
+        params_path = self.model_dir / MODEL_PARAMS_NAME
+        if not (scaler_path.exists() and kmeans_path.exists()):
+            return None, None
+        
+        saved = None
+        if params_path.exists():
+            with open(params_path) as f:
+                saved = json.load(f)
+        if saved != json.loads(json.dumps(params)):
+            print("  ⚠️  已保存的聚类模型与本次的输入数据或训练参数不一致，重新训练")
+            return None, None
+        
+        print(f"  复用已保存的聚类模型: {self.model_dir}")
+        return StandardScalerModel.load(str(scaler_path)), KMeansModel.load(str(kmeans_path))
+    
+    def _save_fare_clustering(self, scaler_model, kmeans_model, params):
+        """保存模型及其训练参数，供后续运行复用"""
+        scaler_model.write().overwrite().save(str(self.model_dir / "fare_scaler"))
+        kmeans_model.write().overwrite().save(str(self.model_dir / "fare_kmeans"))
+        with open(self.model_dir / MODEL_PARAMS_NAME, "w") as f:
+            json.dump(params, f, indent=2)
+        print(f"  ✅ 聚类模型已保存: {self.model_dir}")
+    
+    @staticmethod
+    def _original_centers(scaler_model, kmeans_model):
+        """把聚类中心还原到原始特征单位，便于比较不同标准化下训练的模型"""
+        mean = scaler_model.mean.toArray()
+        std = scaler_model.std.toArray()
+        return np.array([center * std + mean for center in kmeans_model.clusterCenters()])
+    
+    @classmethod
+    def centroid_shift(cls, models, baseline_models):
+        """两组 (scaler, kmeans) 模型聚类中心的最大相对偏移
+        
+        每个中心匹配最近的基准中心，按基准中心范数计算相对偏移。
+        """
+        centers = cls._original_centers(*models)
+        baseline = cls._original_centers(*baseline_models)
+        shifts = []
+        for center in centers:
+            distances = np.linalg.norm(baseline - center, axis=1)
+            nearest = distances.argmin()
+            shifts.append(distances[nearest] / np.maximum(np.linalg.norm(baseline[nearest]), 1e-9))
+        return float(np.max(shifts))
+    
+    def _compare_with_full_fit(self, features_df, scaler_model, kmeans_model):
+        """质量检查：与全量训练的基准模型比较聚类中心"""
+        print("  与全量训练基准比较聚类中心...")
+        baseline_scaler, baseline_kmeans = self._fit_fare_clustering(features_df)
+        
+        max_shift = self.centroid_shift((scaler_model, kmeans_model), (baseline_scaler, baseline_kmeans))
+        self.metrics["kmeans_centroid_max_relative_shift"] = float(np.round(max_shift, 4))
+        print(f"  聚类中心最大相对偏移: {max_shift:.2%}")
+        return max_shift
+    
+    def analyze_advanced_metrics(self, df, sample_fraction=None, retrain=False, validate=False):
+        """高级分析（聚类等）
+        
+        sample_fraction: 只用分层样本训练聚类模型，再对全量数据打分
+        retrain: 忽略已保存的模型重新训练
+        validate: 抽样训练时与全量训练基准比较聚类中心（复用的抽样模型同样比较）
+        
+        已保存的模型只有在输入数据指纹和训练参数（含 sample_fraction）都一致时才复用。
+        """
         print("🔬 高级分析...")
+        check_sample_fraction(sample_fraction)
+        if validate and not sample_fraction:
+            print("  ⚠️  --validate-kmeans 只在 --kmeans-sample 抽样训练时生效，本次忽略")
         
         try:
             # 1. 费用聚类分析
-            fare_features = df.select("trip_distance", "trip_duration_minutes", "total_amount")
-            
-            # 创建特征向量
+            # 创建特征向量 - 在完整数据上追加列，保留原始列，
+            # 预测结果沿同一血缘传递，无需再按行号join回原始数据
             assembler = VectorAssembler(
-                inputCols=["trip_distance", "trip_duration_minutes", "total_amount"],
+                inputCols=FARE_FEATURES,
                 outputCol="features"
             )
             
-            fare_features_vector = assembler.transform(fare_features).select("features")
+            fare_features_vector = assembler.transform(df)
             
-            # 标准化
-            scaler = StandardScaler(
-                inputCol="features",
-                outputCol="scaled_features",
-                withStd=True,
-                withMean=True
-            )
+            params = self._model_params(sample_fraction)
+            scaler_model, kmeans_model = (None, None) if retrain else self._load_fare_clustering(params)
+            if kmeans_model is None:
+                scaler_model, kmeans_model = self._fit_fare_clustering(fare_features_vector, sample_fraction)
+                self._save_fare_clustering(scaler_model, kmeans_model, params)
+            if sample_fraction and validate:
+                self._compare_with_full_fit(fare_features_vector, scaler_model, kmeans_model)
             
-            scaler_model = scaler.fit(fare_features_vector)
             scaled_data = scaler_model.transform(fare_features_vector)
             
-            # KMeans聚类
-            kmeans = KMeans(k=3, seed=42, featuresCol="scaled_features")
-            kmeans_model = kmeans.fit(scaled_data)
-            
-            # 预测聚类
-            clustered = kmeans_model.transform(scaled_data)
-            
-            # 将聚类结果添加回原始数据
-            df_with_cluster = df.withColumn("row_idx", monotonically_increasing_id())
-            clustered_with_idx = clustered.withColumn("row_idx", monotonically_increasing_id())
-            
-            df_clustered = df_with_cluster.join(clustered_with_idx.select("row_idx", "prediction"), 
-                                               on="row_idx").drop("row_idx")
+            # 预测聚类（prediction直接追加在原始行上）
+            df_clustered = kmeans_model.transform(scaled_data).drop("features", "scaled_features")
             
             # 聚类统计
             cluster_stats = df_clustered.groupBy("prediction") \
@@ -371,22 +878,26 @@ class AdvancedNYCDataProcessor:
             print("  使用基础分析代替...")
             return {}
     
-    def save_results(self, basic_results, advanced_results=None):
+    def save_results(self, basic_results, advanced_results=None, od_matrix=None):
         """保存分析结果"""
         print("💾 保存结果...")
         
-        # 保存基础结果
+        # 保存完整OD矩阵
+        if od_matrix is not None:
+            od_path = od_matrix.save(self.output_dir / "od_matrix.npz")
+            print(f"  ✅ od_matrix -> {od_path}")
+        
+        # 交给Streamlit的结果（Arrow IPC + manifest，CSV为可选导出）
+        exports = {}
+        
+        # 保存基础结果 - 每个结果只计算一次：Spark写出Parquet后，
+        # 再用pyarrow读回这份很小的输出，而不是对同一个惰性DataFrame再toPandas()一次
         for name, df in basic_results.items():
-            # 保存为Parquet
             parquet_path = self.output_dir / f"{name}.parquet"
             df.write.parquet(str(parquet_path), mode="overwrite")
             
-            # 保存为CSV（用于Streamlit）
-            csv_path = self.output_dir / f"{name}.csv"
-            pandas_df = df.toPandas()
-            pandas_df.to_csv(csv_path, index=False)
-            
-            print(f"  ✅ {name}: {len(pandas_df):,} 行 -> {csv_path}")
+            exports[name] = self._read_parquet_output(parquet_path)
+            print(f"  ✅ {name}: {len(exports[name]):,} 行 -> {parquet_path}")
         
         # 保存高级分析结果
         if advanced_results:
@@ -394,39 +905,56 @@ class AdvancedNYCDataProcessor:
                 if name == "df_clustered":
                     # 保存聚类数据（抽样）
                     sample_df = df.sample(0.1)  # 10%样本
-                    csv_path = self.output_dir / f"{name}_sample.csv"
-                    sample_df.toPandas().to_csv(csv_path, index=False)
-                    print(f"  ✅ {name}_sample: {sample_df.count():,} 行")
+                    exports[f"{name}_sample"] = sample_df.toPandas()
+                    print(f"  ✅ {name}_sample: {len(exports[f'{name}_sample']):,} 行")
                 elif isinstance(df, pd.DataFrame):
-                    csv_path = self.output_dir / f"{name}.csv"
-                    df.to_csv(csv_path, index=False)
+                    exports[name] = df
                 else:
-                    csv_path = self.output_dir / f"{name}.csv"
-                    df.toPandas().to_csv(csv_path, index=False)
+                    exports[name] = df.toPandas()
+            
+            if "cluster_stats" in exports:
+                self._check_cluster_counts(exports["cluster_stats"])
+        
+        write_results(exports, self.output_dir, csv_export=self.csv_export)
+        
+        # 生成汇总报告（使用已收集到driver的结果，不再触发Spark作业；筛选立方体只供仪表板使用，不计入）
+        self._generate_summary_report({name: exports[name] for name in basic_results if name != "trip_cube"})
+    
+    @staticmethod
+    def _read_parquet_output(parquet_path):
+        """用pyarrow读取Spark写出的Parquet目录（忽略_SUCCESS和.crc文件）"""
+        return ds.dataset(str(parquet_path), format="parquet").to_table().to_pandas()
+    
+    def _check_cluster_counts(self, cluster_stats):
+        """校验聚类结果覆盖了所有清洗后的行程（每行恰好一个prediction）"""
+        clustered_rows = int(cluster_stats["trip_count"].sum())
+        self.metrics["clustered_rows"] = clustered_rows
         
-        # 生成汇总报告
-        self._generate_summary_report(basic_results)
+        cleaned_rows = self.metrics.get("cleaned_rows")
+        if cleaned_rows is not None and clustered_rows != cleaned_rows:
+            print(f"  ⚠️  聚类行数 {clustered_rows:,} 与清洗后行数 {cleaned_rows:,} 不一致")
+        else:
+            print(f"  ✅ 聚类行数校验通过: {clustered_rows:,} 行")
     
     def _generate_summary_report(self, results):
-        """生成汇总报告"""
+        """生成汇总报告 - results为已收集的pandas DataFrame"""
         print("📝 生成汇总报告...")
         
         report = {
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "processing_time_seconds": round(time.time() - self.start_time, 2),
+            "processing_time_seconds": float(np.round(time.time() - self.start_time, 2)),
+            "row_counts": self.metrics,
             "datasets": {}
         }
         
         for name, df in results.items():
-            count = df.count()
             report["datasets"][name] = {
-                "row_count": count,
+                "row_count": len(df),
                 "column_count": len(df.columns),
-                "sample_data": df.limit(3).toPandas().to_dict(orient="records") if count > 0 else []
+                "sample_data": df.head(3).to_dict(orient="records")
             }
         
         # 保存报告为JSON
-        import json
         report_path = self.output_dir / "analysis_report.json"
         with open(report_path, 'w') as f:
             json.dump(report, f, indent=2, default=str)
@@ -435,40 +963,96 @@ class AdvancedNYCDataProcessor:
         
         # 打印关键指标
         print("\n📈 关键指标:")
-        if "hot_routes" in results:
-            top_routes = results["hot_routes"].limit(3).toPandas()
+        if "hot_routes" in results and len(results["hot_routes"]) > 0:
+            top_routes = results["hot_routes"]
             print(f"  最热门路线: {top_routes.iloc[0]['PULocationID']} -> {top_routes.iloc[0]['DOLocationID']} "
                   f"({top_routes.iloc[0]['trip_count']} 次行程)")
         
-        if "hourly_traffic" in results:
-            peak_hour = results["hourly_traffic"].orderBy(desc("trip_count")).first()
-            if peak_hour:
-                print(f"  高峰时段: {int(peak_hour['pickup_hour'])}:00 "
-                      f"({peak_hour['trip_count']} 次行程)")
+        if "hourly_traffic" in results and len(results["hourly_traffic"]) > 0:
+            hourly = results["hourly_traffic"]
+            peak_hour = hourly.loc[hourly["trip_count"].idxmax()]
+            print(f"  高峰时段: {int(peak_hour['pickup_hour'])}:00 "
+                  f"({peak_hour['trip_count']} 次行程)")
+    
+    def _finish_stages(self):
+        """阶段计量写入报告并打印"""
+        self.stage_metrics.write_to_report(self.output_dir / "analysis_report.json")
+        print("\n⏱️  阶段耗时:")
+        print(self.stage_metrics.summary())
     
-    def run(self, use_advanced=True):
+    def run(self, use_advanced=True, use_cube=False,
+            kmeans_sample_fraction=None, retrain_models=False, validate_kmeans=False,
+            incremental=False, write_cleaned=False, from_cleaned=False, months=None, hour_bucket=None):
         """运行完整流程"""
         print("=" * 60)
         print("🚀 NYC Taxi 高级数据分析流程")
         print("=" * 60)
         
+        stages = self.stage_metrics
         try:
-            # 1. 加载数据
-            df_raw = self.load_and_validate_data()
+            if incremental:
+                # 增量模式只更新基础指标和OD矩阵（聚类需要逐行数据，沿用上次结果）
+                with stages.stage("build_incremental_cube"):
+                    cube = self.build_incremental_cube()
+                with stages.stage("basic_metrics"):
+                    basic_results = self.analyze_basic_metrics_from_cube(cube)
+                with stages.stage("od_matrix"):
+                    od_matrix = self.build_od_matrix(cube, from_cube=True)
+                with stages.stage("save"):
+                    self.save_results(basic_results, None, od_matrix)
+                self._finish_stages()
+                
+                total_time = time.time() - self.start_time
+                print(f"\n✅ 增量分析完成！总耗时: {total_time:.2f} 秒")
+                print(f"📁 结果保存在: {self.output_dir}")
+                return basic_results, None
             
-            # 2. 数据预处理
-            df_clean = self.preprocess_data(df_raw)
+            if from_cleaned:
+                # 1-2. 直接读取已分区的清洗数据
+                with stages.stage("load_cleaned"):
+                    df_clean = self.load_cleaned_trips(months)
+            else:
+                # 1. 加载数据
+                with stages.stage("load") as stage:
+                    df_raw = self.load_and_validate_data()
+                    stage["rows_out"] = self.metrics.get("raw_rows")
+                
+                # 2. 数据预处理
+                with stages.stage("preprocess") as stage:
+                    df_clean = self.preprocess_data(df_raw)
+                    stage.update(rows_in=self.metrics.get("raw_rows"), rows_out=self.metrics.get("cleaned_rows"))
+                if write_cleaned:
+                    with stages.stage("write_cleaned", rows_in=self.metrics.get("cleaned_rows")):
+                        self.write_cleaned_trips(df_clean, hour_bucket=hour_bucket)
             
             # 3. 基础分析
-            basic_results = self.analyze_basic_metrics(df_clean)
+            cleaned_rows = self.metrics.get("cleaned_rows")
+            if use_cube:
+                with stages.stage("build_cube", rows_in=cleaned_rows):
+                    cube = self.build_trip_cube(df_clean)
+                with stages.stage("basic_metrics"):
+                    basic_results = self.analyze_basic_metrics_from_cube(cube)
+                with stages.stage("od_matrix"):
+                    od_matrix = self.build_od_matrix(cube, from_cube=True)
+            else:
+                with stages.stage("basic_metrics", rows_in=cleaned_rows):
+                    basic_results = self.analyze_basic_metrics(df_clean)
+                with stages.stage("od_matrix", rows_in=cleaned_rows):
+                    od_matrix = self.build_od_matrix(df_clean)
             
             # 4. 高级分析（可选）
             advanced_results = None
             if use_advanced:
-                advanced_results = self.analyze_advanced_metrics(df_clean)
+                with stages.stage("clustering", rows_in=cleaned_rows):
+                    advanced_results = self.analyze_advanced_metrics(df_clean,
+                                                                     sample_fraction=kmeans_sample_fraction,
+                                                                     retrain=retrain_models,
+                                                                     validate=validate_kmeans)
             
-            # 5. 保存结果
-            self.save_results(basic_results, advanced_results)
+            # 5. 保存结果（惰性的基础指标在这里才真正计算）
+            with stages.stage("save"):
+                self.save_results(basic_results, advanced_results, od_matrix)
+            self._finish_stages()
             
             # 6. 显示执行时间
             total_time = time.time() - self.start_time
@@ -485,6 +1069,7 @@ class AdvancedNYCDataProcessor:
         
         finally:
             # 清理资源
+            self._unpersist_all()
             self.spark.stop()
             print("🔄 Spark会话已关闭")
 
@@ -492,21 +1077,53 @@ def main():
     """主函数"""
     import argparse
     
+    def sample_fraction_arg(value):
+        try:
+            return check_sample_fraction(float(value))
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+    
     parser = argparse.ArgumentParser(description="NYC Taxi 高级数据分析")
     parser.add_argument("--simple", action="store_true", help="使用简单模式（跳过高级分析）")
     parser.add_argument("--sample", action="store_true", help="使用样本数据")
+    parser.add_argument("--csv", action="store_true", help="同时导出CSV")
+    parser.add_argument("--cube", action="store_true", help="立方体模式：一次扫描计算所有基础指标")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量模式：只处理上次运行后新增的文件（只更新基础指标）")
+    parser.add_argument("--write-cleaned", action="store_true",
+                        help="把清洗后的行程写成按年/月分区的Parquet（data/cleaned_trips）")
+    parser.add_argument("--from-cleaned", action="store_true", help="直接读取分区的清洗数据，跳过预处理")
+    parser.add_argument("--months", nargs="+", default=None, help="配合 --from-cleaned 只读取这些月份（如 2023-01）")
+    parser.add_argument("--hour-bucket", type=int, default=None, help="写出清洗数据时额外按N小时时段分区")
+    parser.add_argument("--kmeans-sample", type=sample_fraction_arg, default=None,
+                        help="聚类模型训练的分层抽样比例（如0.05，行程少的小时自动提高），默认使用全部数据")
+    parser.add_argument("--retrain", action="store_true", help="忽略已保存的聚类模型重新训练")
+    parser.add_argument("--validate-kmeans", action="store_true", help="抽样训练时与全量训练比较聚类中心")
+    parser.add_argument("--log-stages", action="store_true", help="每个阶段结束时输出一行JSON日志")
     
     args = parser.parse_args()
     
+    if args.log_stages:
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+    
     # 运行处理器
-    processor = AdvancedNYCDataProcessor()
+    processor = AdvancedNYCDataProcessor(csv_export=args.csv, log_stages=args.log_stages)
     
     # 根据参数决定是否使用高级分析
     use_advanced = not args.simple
     
     print(f"使用{'高级' if use_advanced else '基础'}分析模式")
     
-    processor.run(use_advanced=use_advanced)
+    processor.run(use_advanced=use_advanced,
+                  use_cube=args.cube,
+                  kmeans_sample_fraction=args.kmeans_sample,
+                  retrain_models=args.retrain,
+                  validate_kmeans=args.validate_kmeans,
+                  incremental=args.incremental,
+                  write_cleaned=args.write_cleaned,
+                  from_cleaned=args.from_cleaned,
+                  months=args.months,
+                  hour_bucket=args.hour_bucket)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
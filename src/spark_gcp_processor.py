@@ -21,12 +21,16 @@ def process_on_gcp(input_path, output_path):
         # 由于这是要在集群上运行的，代码需要独立
         
         from pyspark.sql import SparkSession
-        from pyspark.sql.functions import *
+        from pyspark.sql.functions import avg, col, count, desc
         
-        # 创建Spark会话
-        spark = SparkSession.builder \
-            .appName("NYCTaxiGCPProcessor") \
-            .getOrCreate()
+        # 创建Spark会话 - 作业只上传了本文件时共享工厂不可用，退回集群默认配置
+        try:
+            from src.spark_session import get_spark_session
+            spark = get_spark_session("NYCTaxiGCPProcessor", master=None)
+        except ImportError:
+            spark = SparkSession.builder \
+                .appName("NYCTaxiGCPProcessor") \
+                .getOrCreate()
         
         # 从GCS读取数据
         print(f"从GCS读取数据: {input_path}")
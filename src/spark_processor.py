@@ -1,17 +1,17 @@
-from pyspark.sql import SparkSession
 from pyspark.sql.functions import *
 from pyspark.sql.types import *
 import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from src.spark_session import get_spark_session
+import pyarrow.parquet as pq
 
 def create_spark_session(app_name="NYCTaxiProcessor"):
-    """创建Spark会话 - 类似你NLP项目中的setup"""
-    spark = SparkSession.builder \
-        .appName(app_name) \
-        .config("spark.sql.parquet.compression.codec", "snappy") \
-        .config("spark.executor.memory", "4g") \
-        .config("spark.driver.memory", "2g") \
-        .getOrCreate()
-    return spark
+    """创建Spark会话 - 使用共享的会话工厂"""
+    return get_spark_session(app_name)
 
 def load_data(spark, file_path, file_type="parquet"):
     """加载数据"""
@@ -74,19 +74,24 @@ def analyze_hot_routes(df):
     return hot_routes, pickup_hotspots, dropoff_hotspots, hourly_traffic
 
 def save_results(df_list, output_dir="./output"):
-    """保存结果"""
+    """保存结果 - 每个结果只计算一次，返回 {名称: pandas DataFrame}"""
     import os
     os.makedirs(output_dir, exist_ok=True)
     
     names = ["hot_routes", "pickup_hotspots", "dropoff_hotspots", "hourly_traffic"]
+    saved = {}
     
     for df, name in zip(df_list, names):
         # 保存为Parquet（Spark原生格式）
-        df.write.parquet(f"{output_dir}/{name}.parquet", mode="overwrite")
+        parquet_path = f"{output_dir}/{name}.parquet"
+        df.write.parquet(parquet_path, mode="overwrite")
         
-        # 同时保存为CSV用于Streamlit预览
-        df.toPandas().to_csv(f"{output_dir}/{name}.csv", index=False)
+        # CSV由写好的Parquet导出，不再对同一个惰性DataFrame重新计算
+        saved[name] = pq.read_table(parquet_path).to_pandas()
+        saved[name].to_csv(f"{output_dir}/{name}.csv", index=False)
         print(f"已保存: {name}.parquet 和 {name}.csv")
+    
+    return saved
 
 def main():
     spark = create_spark_session()
@@ -103,14 +108,14 @@ def main():
     results = analyze_hot_routes(df_clean)
     
     print("保存结果...")
-    save_results(results)
+    saved = save_results(results)
     
-    # 预览结果
+    # 预览结果（使用已保存的结果）
     print("\n=== 热门路线Top 10 ===")
-    results[0].show(10)
+    print(saved["hot_routes"].head(10).to_string(index=False))
     
     print("\n=== 热门上车点Top 10 ===")
-    results[1].show(10)
+    print(saved["pickup_hotspots"].head(10).to_string(index=False))
     
     spark.stop()
     print("处理完成！")
@@ -1,17 +1,16 @@
-from pyspark.sql import SparkSession
 from pyspark.sql.functions import *
 from pyspark.sql.types import *
 import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from src.spark_session import get_spark_session
 
 def create_spark_session(app_name="NYCTaxiProcessor"):
-    """创建Spark会话 - 类似你NLP项目中的setup"""
-    spark = SparkSession.builder \
-        .appName(app_name) \
-        .config("spark.sql.parquet.compression.codec", "snappy") \
-        .config("spark.executor.memory", "4g") \
-        .config("spark.driver.memory", "2g") \
-        .getOrCreate()
-    return spark
+    """创建Spark会话 - 使用共享的会话工厂"""
+    return get_spark_session(app_name)
 
 def load_data(spark, file_path, file_type="parquet"):
     """加载数据"""
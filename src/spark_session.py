@@ -0,0 +1,171 @@
+"""
+共享的Spark会话工厂 - 所有处理器使用同一套按机器和输入规模调优的配置
+
+本地模式下只有driver一个JVM，所有任务都在其中执行：driver内存按物理内存
+（容器中取cgroup内存上限与物理内存的较小值）设定（spark.executor.memory
+在本地模式无效，不再设置）；shuffle分区数按
+输入大小和核数设定，而不是默认的200个——聚合结果只有几百行时，200个小任务
+的调度开销远大于计算本身。同时开启 Kryo 序列化、Arrow 传输和 AQE（合并小分区、
+处理倾斜）。
+
+不显式传入master时，沿用 spark-submit --master / PYSPARK_SUBMIT_ARGS 中的设置
+（在代码里设置master会覆盖命令行参数），都没有时才使用本地模式。
+集群模式（如Dataproc上的yarn）只设置与资源无关的配置，内存和并行度交给集群管理器。
+
+进程中已有活动会话时直接复用，只更新运行时可修改的 spark.sql.* 配置。
+"""
+import math
+import os
+import shlex
+from pathlib import Path
+
+from pyspark.sql import SparkSession
+
+# driver 使用物理内存的比例及上下限（GB）
+DRIVER_MEMORY_FRACTION = 0.5
+DRIVER_MEMORY_MIN_GB = 1
+DRIVER_MEMORY_MAX_GB = 32
+# 物理内存无法检测时的假设值（GB）
+DEFAULT_SYSTEM_MEMORY_GB = 4
+# cgroup v2 / v1 的内存上限文件（v1未设上限时为接近 2^63 的值）
+CGROUP_MEMORY_LIMIT_FILES = ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes")
+
+# 没有任何master设置时使用的本地模式
+DEFAULT_MASTER = "local[*]"
+
+# 每个shuffle分区的目标输入量，以及分区数相对核数的上下限
+TARGET_PARTITION_BYTES = 128 * 2 ** 20
+MIN_PARTITIONS_PER_CORE = 1
+MAX_PARTITIONS_PER_CORE = 8
+
+# 与机器无关的配置
+COMMON_CONFIG = {
+    "spark.serializer": "org.apache.spark.serializer.KryoSerializer",
+    "spark.kryoserializer.buffer.max": "256m",
+    "spark.sql.execution.arrow.pyspark.enabled": "true",
+    "spark.sql.execution.arrow.pyspark.fallback.enabled": "true",
+    "spark.sql.adaptive.enabled": "true",
+    "spark.sql.adaptive.coalescePartitions.enabled": "true",
+    "spark.sql.adaptive.skewJoin.enabled": "true",
+    "spark.sql.adaptive.advisoryPartitionSizeInBytes": "64m",
+    "spark.sql.parquet.compression.codec": "snappy",
+}
+
+
+def _cgroup_memory_limit():
+    """容器的cgroup内存上限（字节），没有上限或无法读取时返回None"""
+    for path in CGROUP_MEMORY_LIMIT_FILES:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 2 ** 60:
+            return int(value)
+    return None
+
+
+def system_memory_gb():
+    """可用于本进程的内存（GB）：物理内存与cgroup上限的较小值，无法检测时返回 DEFAULT_SYSTEM_MEMORY_GB"""
+    try:
+        memory = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        memory = None
+    limit = _cgroup_memory_limit()
+    if limit is not None:
+        memory = limit if memory is None else min(memory, limit)
+    return memory / 2 ** 30 if memory else DEFAULT_SYSTEM_MEMORY_GB
+
+
+def configured_master():
+    """spark-submit --master 或 PYSPARK_SUBMIT_ARGS 中设置的master，没有时返回None"""
+    if os.environ.get("PYSPARK_GATEWAY_PORT"):
+        # 由 spark-submit 启动：JVM已存在，连接后读取它的配置（不会再启动新的JVM）
+        from pyspark import SparkConf, SparkContext
+        SparkContext._ensure_initialized()
+        return SparkConf().get("spark.master", None)
+    args = shlex.split(os.environ.get("PYSPARK_SUBMIT_ARGS", ""))
+    if "--master" in args[:-1]:
+        return args[args.index("--master") + 1]
+    return None
+
+
+def input_size_bytes(paths):
+    """输入文件（或目录下所有文件）的总字节数"""
+    total = 0
+    for path in map(Path, paths):
+        if path.is_dir():
+            total += sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+        elif path.exists():
+            total += path.stat().st_size
+    return total
+
+
+def _local_cores(master):
+    """local / local[N] / local[*] 中的核数"""
+    if master in ("local", "local[1]"):
+        return 1
+    inner = master[master.find("[") + 1:master.find("]")] if "[" in master else "*"
+    if inner == "*" or not inner.isdigit():
+        return os.cpu_count() or 1
+    return int(inner)
+
+
+def spark_config(master=DEFAULT_MASTER, input_bytes=None):
+    """会话配置字典；master 非本地时只返回与资源无关的配置"""
+    config = dict(COMMON_CONFIG)
+    if not master.startswith("local"):
+        return config
+
+    cores = _local_cores(master)
+    memory_gb = system_memory_gb()
+    driver_gb = int(min(max(memory_gb * DRIVER_MEMORY_FRACTION, DRIVER_MEMORY_MIN_GB), DRIVER_MEMORY_MAX_GB))
+
+    # 输入未知时按每核2个分区
+    if input_bytes is None:
+        partitions = 2 * cores
+    else:
+        partitions = math.ceil(input_bytes / TARGET_PARTITION_BYTES)
+        partitions = min(max(partitions, MIN_PARTITIONS_PER_CORE * cores), MAX_PARTITIONS_PER_CORE * cores)
+
+    config.update({
+        "spark.driver.memory": f"{driver_gb}g",
+        "spark.driver.maxResultSize": f"{max(1, driver_gb // 2)}g",
+        "spark.sql.shuffle.partitions": str(partitions),
+        "spark.default.parallelism": str(partitions),
+        # 内存充足时用更大的Arrow批，减少 toPandas 的批次数
+        "spark.sql.execution.arrow.maxRecordsPerBatch": "50000" if driver_gb >= 4 else "10000",
+    })
+    return config
+
+
+def get_spark_session(app_name, master=None, input_paths=None, extra_config=None, log_level="WARN"):
+    """创建或复用Spark会话
+
+    master: 显式指定的master；None 时沿用 spark-submit 的设置，没有设置才用本地模式
+    input_paths: 输入文件/目录，用于按数据量设定shuffle分区数
+    extra_config: 处理器特有的配置，覆盖默认值
+    """
+    configured = None if master else configured_master()
+    input_bytes = input_size_bytes(input_paths) if input_paths else None
+    config = spark_config(master or configured or DEFAULT_MASTER, input_bytes)
+    config.update(extra_config or {})
+
+    active = SparkSession.getActiveSession()
+    if active is not None:
+        # JVM已启动：内存等静态配置无法再改，只更新运行时SQL配置
+        for key, value in config.items():
+            if key.startswith("spark.sql."):
+                active.conf.set(key, value)
+        return active
+
+    builder = SparkSession.builder.appName(app_name)
+    if configured is None:
+        # 只在命令行没有设置时指定master，不覆盖 spark-submit --master
+        builder = builder.master(master or DEFAULT_MASTER)
+    for key, value in config.items():
+        builder = builder.config(key, value)
+
+    spark = builder.getOrCreate()
+    spark.sparkContext.setLogLevel(log_level)
+    return spark
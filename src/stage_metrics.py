@@ -0,0 +1,158 @@
+"""
+流程阶段计量 - 每个阶段的耗时、CPU时间、峰值内存、行数和Spark作业
+
+用法：
+    metrics = StageMetrics(spark=spark)
+    with metrics.stage("clean", rows_in=n) as stage:
+        df = clean(df)
+        stage["rows_out"] = len(df)
+
+每个阶段记录墙钟时间、本进程CPU时间、峰值RSS（含Spark JVM等子进程，后台线程
+从 /proc 采样）、输入/输出行数；传入 spark 时，阶段内触发的作业通过作业组
+归集，记录作业ID和stage ID。记录写入 analysis_report.json 的 "stages" 字段，
+log=True 时每个阶段结束再输出一行JSON日志。
+"""
+import contextlib
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# 峰值RSS采样间隔（秒）
+RSS_SAMPLE_INTERVAL = 0.01
+
+
+def _tree_rss_bytes(pid):
+    """进程及其所有子进程的RSS之和（Linux /proc），读取失败时返回None"""
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            if current == pid:
+                return None
+    return total
+
+
+class PeakRSS:
+    """后台线程周期采样进程树RSS，记录区间内的峰值（字节）
+
+    没有 /proc 时退回 ru_maxrss（进程启动以来的峰值，只含本进程）。
+    """
+
+    def __init__(self):
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        pid = os.getpid()
+        while True:
+            rss = _tree_rss_bytes(pid)
+            if rss is None:
+                # Linux为KB，macOS为字节
+                scale = 1 if sys.platform == "darwin" else 1024
+                rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+            self.peak = max(self.peak, rss)
+            if self._stop.wait(RSS_SAMPLE_INTERVAL):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class StageMetrics:
+    def __init__(self, spark=None, log=False):
+        """spark: 可选 SparkSession，用于归集每个阶段触发的作业；log: 每个阶段输出一行JSON日志"""
+        self.spark = spark
+        self.log = log
+        self.records = []
+
+    @contextlib.contextmanager
+    def stage(self, name, rows_in=None):
+        """计量一个阶段；yield 的字典可在阶段内设置 rows_out（以及其他附加字段）"""
+        record = {"stage": name, "rows_in": rows_in, "rows_out": None}
+        job_group = self._start_job_group(name)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        status = "ok"
+        # PeakRSS 启动失败时保持None，避免在finally里掩盖原来的异常
+        rss = None
+        try:
+            with PeakRSS() as rss:
+                yield record
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            record.update(
+                status=status,
+                wall_seconds=round(time.perf_counter() - wall_start, 4),
+                cpu_seconds=round(time.process_time() - cpu_start, 4),
+                peak_rss_mb=round(rss.peak / 2 ** 20, 1) if rss is not None else None,
+            )
+            if job_group is not None:
+                record.update(self._end_job_group(job_group))
+            self.records.append(record)
+            if self.log:
+                logger.info(json.dumps(record, default=str, ensure_ascii=False))
+
+    def _start_job_group(self, name):
+        if self.spark is None:
+            return None
+        group = f"stage-{name}-{uuid.uuid4().hex[:8]}"
+        self.spark.sparkContext.setJobGroup(group, name)
+        return group
+
+    def _end_job_group(self, group):
+        """阶段内触发的作业ID和stage ID，并清除作业组"""
+        context = self.spark.sparkContext
+        context.setLocalProperty("spark.jobGroup.id", None)
+        context.setLocalProperty("spark.job.description", None)
+        tracker = context.statusTracker()
+        job_ids = sorted(tracker.getJobIdsForGroup(group))
+        stage_ids = set()
+        for job_id in job_ids:
+            info = tracker.getJobInfo(job_id)
+            if info is not None:
+                stage_ids.update(info.stageIds)
+        return {"spark_job_ids": job_ids, "spark_stage_ids": sorted(stage_ids)}
+
+    def write_to_report(self, report_path):
+        """把阶段记录写入 analysis_report.json 的 "stages" 字段（保留其余内容）"""
+        report_path = Path(report_path)
+        report = {}
+        if report_path.exists():
+            with open(report_path) as f:
+                report = json.load(f)
+        report["stages"] = self.records
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2, default=str, ensure_ascii=False)
+        return report_path
+
+    def summary(self):
+        """各阶段耗时的简表（用于打印）"""
+        return "\n".join(
+            f"  {r['stage']:<20} {r['wall_seconds']:>9.3f}s  CPU {r['cpu_seconds']:>8.3f}s  "
+            + (f"峰值RSS {r['peak_rss_mb']:>8.1f} MB" if r["peak_rss_mb"] is not None else f"峰值RSS {'-':>8}   ")
+            + (f"  行 {r['rows_in'] if r['rows_in'] is not None else '-'} -> {r['rows_out']}"
+               if r["rows_out"] is not None else "")
+            for r in self.records
+        )
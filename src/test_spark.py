@@ -70,13 +70,10 @@ def test_spark():
         import findspark
         findspark.init()
         
-        from pyspark.sql import SparkSession
+        from src.spark_session import get_spark_session
         
-        # 创建Spark会话
-        spark = SparkSession.builder \
-            .appName("SparkTest") \
-            .master("local[*]") \
-            .getOrCreate()
+        # 创建Spark会话（与处理器相同的配置）
+        spark = get_spark_session("SparkTest")
         
         print("✅ Spark会话创建成功")
         
@@ -163,6 +160,7 @@ def main():
         print("🎉 所有测试通过！环境配置正确。")
     else:
         print("⚠️  部分测试失败，但项目仍可运行（使用Pandas模式）。")
+        print("   python src/run_pipeline.py 会根据数据规模和Spark是否可用自动选择引擎")
     
     print("\n下一步:")
     print("1. 运行分析: python run_analysis.py")
@@ -0,0 +1,223 @@
+"""
+可合并的部分聚合 - 分块/多文件处理共用
+
+每个批次先聚合成只含可加统计量（计数、和、平方和）的小表，
+批次之间直接相加合并，最后再统一换算成均值/标准差并排序截断，
+因此内存占用只与批次大小和分组键数量有关，与数据总量无关。
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# 各维度表的分组键
+DIMENSIONS = {
+    "hot_routes": ["PULocationID", "DOLocationID"],
+    "hourly_traffic": ["pickup_hour"],
+    "pickup_hotspots": ["PULocationID"],
+    "passenger_stats": ["passenger_count"],
+    # 多维立方体：仪表板侧栏筛选（小时/星期/行政区/费用）在其上切片，无需重新处理明细。
+    # 部分聚合保留全部路线，发布时由 finalize_cube 把长尾路线折叠（见 CUBE_TOP_ROUTES）
+    "trip_cube": ["PULocationID", "DOLocationID", "pickup_hour", "pickup_dayofweek"],
+}
+
+# 立方体发布的列：分组键 + 可加度量（不含平方和，筛选结果只需均值）
+CUBE_COLUMNS = DIMENSIONS["trip_cube"] + ["trip_count", "fare_sum", "distance_sum"]
+
+# 发布的立方体只对行程数最多的这些路线保留下车区域；其余路线的行程折叠到
+# (上车区域, OTHER_DESTINATION) 行。路线分散时完整立方体的行数接近行程数
+# （合成数据 80万行程约 56万行），折叠后上限为 (1000 + 266) × 24 × 7 ≈ 21万行，
+# 与数据量无关。行程总数、上车区域、小时和星期的汇总仍然精确，
+# 只有下车区域和路线维度限于热门路线
+CUBE_TOP_ROUTES = 1000
+# 折叠行的下车区域ID（TLC区域ID从1开始，0不会出现在真实数据里）
+OTHER_DESTINATION = 0
+
+# 可加统计量（trip_count 之外）
+MEASURES = ["fare_sum", "fare_sq_sum", "distance_sum"]
+
+
+def spark_dayofweek(pickup):
+    """星期几，采用Spark dayofweek 的约定（1=周日 … 7=周六），与Spark处理器输出一致
+
+    pandas dayofweek 为 0=周一 … 6=周日，转换为 (dow + 1) % 7 + 1
+    """
+    return (pickup.dt.dayofweek + 1) % 7 + 1
+
+
+def partial_aggregate(df, dimensions=None):
+    """对一个已清洗的批次计算部分聚合，返回 {维度名: 以分组键为索引的DataFrame}
+
+    dimensions: 只计算这些维度（默认全部）
+    """
+    fare = df["total_amount"].astype("float64")
+    work = pd.DataFrame({
+        "PULocationID": df["PULocationID"],
+        "DOLocationID": df["DOLocationID"],
+        "fare_sum": fare,
+        "fare_sq_sum": fare * fare,
+        "distance_sum": df["trip_distance"].astype("float64") if "trip_distance" in df.columns else np.nan,
+    })
+
+    if "tpep_pickup_datetime" in df.columns:
+        pickup = pd.to_datetime(df["tpep_pickup_datetime"])
+        work["pickup_hour"] = pickup.dt.hour
+        work["pickup_dayofweek"] = spark_dayofweek(pickup)
+    if "passenger_count" in df.columns:
+        work["passenger_count"] = df["passenger_count"]
+
+    partials = {}
+    for name, keys in DIMENSIONS.items():
+        if dimensions is not None and name not in dimensions:
+            continue
+        if not all(key in work.columns for key in keys):
+            continue
+        grouped = work.groupby(keys)
+        part = grouped[MEASURES].sum(min_count=1)
+        part.insert(0, "trip_count", grouped.size())
+        partials[name] = part
+
+    return partials
+
+
+def _merge_frames(frames):
+    """按分组键相加同一维度的多个部分聚合"""
+    if len(frames) == 1:
+        return frames[0]
+    combined = pd.concat(frames)
+    return combined.groupby(level=list(range(combined.index.nlevels))).sum(min_count=1)
+
+
+def merge_partials(partials_list):
+    """合并多个部分聚合结果（按分组键相加）"""
+    merged = {}
+    for name in DIMENSIONS:
+        frames = [p[name] for p in partials_list if p and name in p]
+        if frames:
+            merged[name] = _merge_frames(frames)
+    return merged
+
+
+class PartialAccumulator:
+    """逐批累加部分聚合
+    
+    每批都和已合并的结果重新分组的话，立方体这类大维度每批都要扫描一遍
+    已累计的全部行，总耗时随批次数线性增长。这里新批次先暂存，暂存的行数
+    达到已合并的行数时才合并一次：每次合并的代价不超过暂存行数的两倍，
+    总耗时与批次大小无关，内存不超过最终结果的两倍左右。
+    """
+    
+    def __init__(self):
+        self.merged = {}
+        self.pending = {}
+    
+    def add(self, partials):
+        for name, part in partials.items():
+            pending = self.pending.setdefault(name, [])
+            pending.append(part)
+            merged = self.merged.get(name)
+            if merged is None or sum(len(p) for p in pending) >= len(merged):
+                self._flush(name)
+    
+    def _flush(self, name):
+        pending = self.pending.pop(name, [])
+        if name in self.merged:
+            pending.insert(0, self.merged[name])
+        if pending:
+            self.merged[name] = _merge_frames(pending)
+    
+    def result(self):
+        """合并所有暂存批次，返回 {维度名: 部分聚合}"""
+        for name in list(self.pending):
+            self._flush(name)
+        return self.merged
+
+
+def save_partials(partials, directory):
+    """把部分聚合写成Parquet（每个维度一个文件），用于增量导入"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for name, part in partials.items():
+        part.reset_index().to_parquet(directory / f"{name}.parquet", index=False)
+
+
+def load_partials(directory):
+    """读取 save_partials 写出的部分聚合（目录不存在时返回空字典）"""
+    directory = Path(directory)
+    partials = {}
+    for name, keys in DIMENSIONS.items():
+        path = directory / f"{name}.parquet"
+        if path.exists():
+            partials[name] = pd.read_parquet(path).set_index(keys)
+    return partials
+
+
+def _finalize_stats(part):
+    """把可加统计量换算成均值和标准差"""
+    out = part.reset_index()
+    n = out["trip_count"].astype("float64")
+    out["avg_fare"] = out["fare_sum"] / n
+    out["avg_distance"] = out["distance_sum"] / n
+    # 样本标准差（与 pandas std / Spark stddev 一致，ddof=1）
+    variance = (out["fare_sq_sum"] - out["fare_sum"] ** 2 / n).clip(lower=0) / (n - 1)
+    out["fare_std"] = np.sqrt(variance.where(n > 1))
+    return out
+
+
+def finalize_partials(partials):
+    """把合并后的部分聚合转换成与 PandasDataProcessor.analyze_data 相同的输出表"""
+    results = {}
+
+    if "hot_routes" in partials:
+        hot_routes = _finalize_stats(partials["hot_routes"])
+        hot_routes = hot_routes[hot_routes["trip_count"] > 5] \
+            .sort_values("trip_count", ascending=False) \
+            .head(100)
+        results["hot_routes"] = hot_routes[
+            ["PULocationID", "DOLocationID", "trip_count", "avg_fare", "avg_distance", "fare_std"]
+        ].reset_index(drop=True)
+
+    if "hourly_traffic" in partials:
+        hourly_traffic = _finalize_stats(partials["hourly_traffic"]).sort_values("pickup_hour")
+        results["hourly_traffic"] = hourly_traffic[
+            ["pickup_hour", "trip_count", "avg_fare"]
+        ].reset_index(drop=True)
+
+    if "pickup_hotspots" in partials:
+        pickup_hotspots = _finalize_stats(partials["pickup_hotspots"]) \
+            .rename(columns={"trip_count": "pickup_count"}) \
+            .sort_values("pickup_count", ascending=False) \
+            .head(50)
+        results["pickup_hotspots"] = pickup_hotspots[
+            ["PULocationID", "pickup_count", "avg_fare"]
+        ].reset_index(drop=True)
+
+    if "passenger_stats" in partials:
+        passenger_stats = _finalize_stats(partials["passenger_stats"]).sort_values("passenger_count")
+        results["passenger_stats"] = passenger_stats[
+            ["passenger_count", "trip_count", "avg_fare"]
+        ].reset_index(drop=True)
+
+    if "trip_cube" in partials:
+        results["trip_cube"] = finalize_cube(partials["trip_cube"])
+
+    return results
+
+
+def finalize_cube(part):
+    """立方体输出表 - 折叠长尾路线，键用最小整数类型并按键排序，保持文件紧凑、切片连续"""
+    keys = DIMENSIONS["trip_cube"]
+    cube = part.reset_index()[CUBE_COLUMNS]
+    # 路线按行程数排名，相同时取键较小的（与Spark处理器的排序一致）
+    route_counts = cube.groupby(keys[:2])["trip_count"].sum()
+    top_routes = route_counts.nlargest(CUBE_TOP_ROUTES, keep="first").index
+    is_top = pd.MultiIndex.from_frame(cube[keys[:2]]).isin(top_routes)
+    if not is_top.all():
+        cube.loc[~is_top, "DOLocationID"] = OTHER_DESTINATION
+        cube = cube.groupby(keys)[CUBE_COLUMNS[len(keys):]].sum(min_count=1).reset_index()
+    cube = cube.astype({
+        "PULocationID": "int16", "DOLocationID": "int16",
+        "pickup_hour": "int8", "pickup_dayofweek": "int8",
+        "trip_count": "int64",
+    })
+    return cube.sort_values(DIMENSIONS["trip_cube"]).reset_index(drop=True)
@@ -0,0 +1,136 @@
+"""
+筛选立方体查询 - 仪表板侧栏筛选的向量化切片
+
+处理器发布的 trip_cube 表按 (PULocationID, DOLocationID, pickup_hour, pickup_dayofweek)
+保存可加统计量（行程数、费用和、距离和）。这里把它载入为NumPy列数组：
+每个筛选条件是一次查表得到的布尔掩码，条件之间按位与，再用 np.bincount
+把选中的行累加到路线/小时/星期等维度上。任意筛选组合都只是对立方体
+做一次线性扫描，不需要重新处理明细数据。
+
+只有热门路线保留下车区域，其余行程折叠在 DOLocationID == OTHER_DESTINATION 的行里
+（见 trip_aggregates.CUBE_TOP_ROUTES），所以立方体行数有与数据量无关的上限。
+行程总数和按上车区域/小时/星期的汇总包含折叠行；OD矩阵、路线和下车区域只含热门路线。
+"""
+import numpy as np
+import pandas as pd
+
+from src.od_matrix import ODMatrix, N_ZONES
+from src.trip_aggregates import OTHER_DESTINATION
+
+KEYS = ("PULocationID", "DOLocationID", "pickup_hour", "pickup_dayofweek")
+MEASURES = ("trip_count", "fare_sum", "distance_sum")
+
+# 各键的取值范围上界（查表和 bincount 的长度）；星期为 1–7（1=周日）
+KEY_SIZES = {
+    "PULocationID": N_ZONES,
+    "DOLocationID": N_ZONES,
+    "pickup_hour": 24,
+    "pickup_dayofweek": 8,
+}
+
+
+class TripCube:
+    def __init__(self, frame):
+        """frame: trip_cube 数据集（区域ID超出范围的行被忽略）"""
+        valid = np.ones(len(frame), dtype=bool)
+        for key, size in KEY_SIZES.items():
+            values = frame[key].to_numpy()
+            valid &= (values >= 0) & (values < size)
+
+        self.keys = {key: frame[key].to_numpy()[valid] for key in KEYS}
+        self.measures = {name: frame[name].to_numpy(dtype="float64")[valid] for name in MEASURES}
+        # 路线键 PU * N_ZONES + DO（先转成intp，避免int16相乘溢出）
+        self.route = self.keys["PULocationID"].astype(np.intp) * N_ZONES + self.keys["DOLocationID"]
+
+    def __len__(self):
+        return len(self.route)
+
+    @property
+    def total_trips(self):
+        return int(self.measures["trip_count"].sum())
+
+    def trip_count(self, mask):
+        """选中部分的行程数（含折叠行）"""
+        return int(self.measures["trip_count"][mask].sum())
+
+    @staticmethod
+    def _lookup(size, values):
+        """允许取值的查表数组：table[v] 为 True 表示取值 v 被选中"""
+        table = np.zeros(size, dtype=bool)
+        values = np.asarray(list(values), dtype=np.intp)
+        table[values[(values >= 0) & (values < size)]] = True
+        return table
+
+    def _route_sums(self, mask):
+        """选中行按路线累加，返回 {统计量: 长度为 N_ZONES² 的数组}"""
+        route = self.route[mask]
+        return {
+            name: np.bincount(route, weights=values[mask], minlength=N_ZONES * N_ZONES)
+            for name, values in self.measures.items()
+        }
+
+    def max_route_fare(self):
+        """所有路线中最高的平均费用（用作费用筛选的上界）"""
+        sums = self._route_sums(np.ones(len(self), dtype=bool))
+        counts = sums["trip_count"]
+        if not counts.any():
+            return 0.0
+        return float((sums["fare_sum"][counts > 0] / counts[counts > 0]).max())
+
+    def select(self, hours=None, weekdays=None, pickup_zones=None, dropoff_zones=None, fare_range=None):
+        """按筛选条件返回立方体行的布尔掩码
+
+        hours/weekdays/pickup_zones/dropoff_zones: 允许的取值集合，None 表示不限。
+        fare_range: (最低, 最高) 路线平均费用区间 - 先在其他条件下计算每条路线的
+        平均费用，再只保留平均费用落在区间内（含端点）的路线。
+        """
+        mask = np.ones(len(self), dtype=bool)
+        conditions = {
+            "pickup_hour": hours,
+            "pickup_dayofweek": weekdays,
+            "PULocationID": pickup_zones,
+            "DOLocationID": dropoff_zones,
+        }
+        for key, values in conditions.items():
+            if values is not None:
+                mask &= self._lookup(KEY_SIZES[key], values)[self.keys[key]]
+
+        if fare_range is not None:
+            sums = self._route_sums(mask)
+            counts = sums["trip_count"]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                avg_fare = sums["fare_sum"] / counts
+            low, high = fare_range
+            route_ok = (counts > 0) & (avg_fare >= low) & (avg_fare <= high)
+            mask &= route_ok[self.route]
+
+        return mask
+
+    def od_matrix(self, mask):
+        """选中部分的OD矩阵（只含热门路线；立方体不含时长，avg_duration 为NaN）"""
+        arrays = {name: values.reshape(N_ZONES, N_ZONES) for name, values in self._route_sums(mask).items()}
+        for values in arrays.values():
+            values[:, OTHER_DESTINATION] = 0
+        arrays["duration_sum"] = np.full((N_ZONES, N_ZONES), np.nan)
+        return ODMatrix(arrays)
+
+    def rollup(self, key, mask):
+        """选中部分按一个键汇总：key, trip_count, avg_fare, avg_distance（只含有行程的取值）
+
+        按 DOLocationID 汇总时不含折叠行。
+        """
+        values = self.keys[key][mask]
+        sums = {
+            name: np.bincount(values, weights=measure[mask], minlength=KEY_SIZES[key])
+            for name, measure in self.measures.items()
+        }
+        if key == "DOLocationID":
+            sums["trip_count"][OTHER_DESTINATION] = 0
+        present = np.flatnonzero(sums["trip_count"])
+        counts = sums["trip_count"][present]
+        return pd.DataFrame({
+            key: present,
+            "trip_count": counts.astype("int64"),
+            "avg_fare": sums["fare_sum"][present] / counts,
+            "avg_distance": sums["distance_sum"][present] / counts,
+        })
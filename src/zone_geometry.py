@@ -0,0 +1,335 @@
+"""
+出租车区域几何 - 直接解析 taxi_zones.zip 中的 Shapefile
+
+不依赖 geopandas/pyproj：DBF 属性表和 SHP 多边形用 struct/NumPy 读取，
+坐标从 NAD83 纽约长岛州平面坐标（EPSG:2263，美国英尺）逆投影为经纬度。
+多边形质心（按面积加权，正确处理内环和一条记录中的多个多边形）和外包框
+只计算一次，连同顶点一起缓存为未压缩的 .npz；源文件指纹不变时直接读取缓存。
+locate() 先查预先栅格化的网格：不被任何区域边界穿过的格子直接查表得到区域ID，
+只有落在边界格子里的点才用外包框筛选候选区域并做向量化的射线法判断。
+"""
+import struct
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SHAPE_NAME = "taxi_zones"
+POLYGON = 5
+# TLC 区域ID 1..263，与 DBF 的 OBJECTID 一一对应
+# （LocationID 字段有重复：OBJECTID 57 记为 56，104/105 记为 103）
+N_TLC_ZONES = 263
+
+# EPSG:2263 - 兰伯特等角圆锥投影（双标准纬线），GRS80 椭球
+GRS80_A = 6378137.0
+GRS80_F = 1 / 298.257222101
+US_FOOT = 0.3048006096012192
+LCC_PARAMS = {
+    "lat_1": 40.66666666666666,
+    "lat_2": 41.03333333333333,
+    "lat_0": 40.16666666666666,
+    "lon_0": -74.0,
+    "false_easting": 984250.0,
+    "false_northing": 0.0,
+}
+
+# locate() 中一次判断的 边数 × 点数 上限，控制临时数组大小
+LOCATE_BLOCK = 1 << 22
+
+# 查找网格每边的格子数（约 50m 一格）
+GRID_SIZE = 1024
+BOUNDARY_CELL = -1
+
+
+def read_dbf(data):
+    """解析 dBASE 属性表，返回 DataFrame（N 类型转为数值，其余为去空格的字符串）"""
+    n_records, header_len, record_len = struct.unpack("<IHH", data[4:12])
+    fields = []
+    offset = 32
+    while data[offset] != 0x0D:
+        name = data[offset:offset + 11].split(b"\0")[0].decode("ascii")
+        fields.append((name, chr(data[offset + 11]), data[offset + 16]))
+        offset += 32
+
+    columns = {name: [] for name, _, _ in fields}
+    for i in range(n_records):
+        record = data[header_len + i * record_len:header_len + (i + 1) * record_len]
+        if record[:1] == b"*":  # 已删除的记录
+            continue
+        position = 1
+        for name, _, length in fields:
+            columns[name].append(record[position:position + length].decode("utf-8", "replace").strip())
+            position += length
+
+    frame = pd.DataFrame(columns)
+    for name, kind, _ in fields:
+        if kind in "NF":
+            frame[name] = pd.to_numeric(frame[name], errors="coerce")
+    return frame
+
+
+def read_shp_polygons(data):
+    """解析 SHP 多边形，返回 (x, y, ring_offsets, ring_record)
+
+    所有顶点连续存放；第 k 个环的顶点为 [ring_offsets[k], ring_offsets[k+1])，
+    属于第 ring_record[k] 条记录。空形状的记录没有环。
+    """
+    xs, ys, ring_offsets, ring_record = [], [], [0], []
+    offset, record = 100, 0
+    while offset < len(data):
+        content_len = struct.unpack(">i", data[offset + 4:offset + 8])[0] * 2
+        content = data[offset + 8:offset + 8 + content_len]
+        offset += 8 + content_len
+        shape_type = struct.unpack("<i", content[:4])[0]
+        if shape_type == POLYGON:
+            n_parts, n_points = struct.unpack("<ii", content[36:44])
+            parts = np.frombuffer(content, dtype="<i4", count=n_parts, offset=44)
+            points = np.frombuffer(content, dtype="<f8", count=2 * n_points,
+                                   offset=44 + 4 * n_parts).reshape(-1, 2)
+            xs.append(points[:, 0])
+            ys.append(points[:, 1])
+            ring_offsets.extend(ring_offsets[-1] + np.append(parts[1:], n_points))
+            ring_record.extend([record] * n_parts)
+        elif shape_type != 0:
+            raise ValueError(f"不支持的形状类型: {shape_type}")
+        record += 1
+
+    return (np.concatenate(xs), np.concatenate(ys),
+            np.asarray(ring_offsets, dtype=np.int64), np.asarray(ring_record, dtype=np.int64))
+
+
+def state_plane_to_lonlat(x, y):
+    """EPSG:2263 平面坐标（美国英尺）逆投影为 (经度, 纬度)，单位为度"""
+    e = np.sqrt(2 * GRS80_F - GRS80_F ** 2)
+    lat_1, lat_2, lat_0 = (np.radians(LCC_PARAMS[k]) for k in ("lat_1", "lat_2", "lat_0"))
+
+    def m(phi):
+        return np.cos(phi) / np.sqrt(1 - (e * np.sin(phi)) ** 2)
+
+    def t(phi):
+        return np.tan(np.pi / 4 - phi / 2) / ((1 - e * np.sin(phi)) / (1 + e * np.sin(phi))) ** (e / 2)
+
+    n = (np.log(m(lat_1)) - np.log(m(lat_2))) / (np.log(t(lat_1)) - np.log(t(lat_2)))
+    big_f = m(lat_1) / (n * t(lat_1) ** n)
+    r_0 = GRS80_A * big_f * t(lat_0) ** n
+
+    easting = (np.asarray(x, dtype="float64") - LCC_PARAMS["false_easting"]) * US_FOOT
+    northing = r_0 - (np.asarray(y, dtype="float64") - LCC_PARAMS["false_northing"]) * US_FOOT
+    r = np.sign(n) * np.hypot(easting, northing)
+    t_prime = (r / (GRS80_A * big_f)) ** (1 / n)
+
+    lon = np.degrees(np.arctan2(easting, northing) / n) + LCC_PARAMS["lon_0"]
+    phi = np.pi / 2 - 2 * np.arctan(t_prime)
+    for _ in range(6):  # 不动点迭代，6次后误差远小于毫米
+        esin = e * np.sin(phi)
+        phi = np.pi / 2 - 2 * np.arctan(t_prime * ((1 - esin) / (1 + esin)) ** (e / 2))
+    return lon, np.degrees(phi)
+
+
+def _source_fingerprint(path):
+    stat = Path(path).stat()
+    return np.array([stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+
+
+class ZoneGeometry:
+    # 保存到 .npz 的数组
+    FIELDS = ("location_id", "borough", "zone_name", "latitude", "longitude", "bbox",
+              "vertex_lon", "vertex_lat", "ring_offsets", "ring_zone",
+              "grid_zone", "grid_extent", "source")
+
+    def __init__(self, **arrays):
+        for name in self.FIELDS:
+            setattr(self, name, arrays.get(name))
+        self._build_edges()
+
+    @classmethod
+    def from_shapefile(cls, zip_path):
+        """从 taxi_zones.zip 计算区域质心、外包框和顶点"""
+        with zipfile.ZipFile(zip_path) as archive:
+            members = {Path(name).name.lower(): name for name in archive.namelist()}
+            attributes = read_dbf(archive.read(members[f"{SHAPE_NAME}.dbf"]))
+            x, y, ring_offsets, ring_record = read_shp_polygons(archive.read(members[f"{SHAPE_NAME}.shp"]))
+
+        attributes.columns = attributes.columns.str.lower()
+        record_ids = attributes["objectid"].to_numpy(dtype=np.int64)
+        if len(np.unique(record_ids)) != N_TLC_ZONES:
+            raise ValueError(f"{SHAPE_NAME}.dbf 应有 {N_TLC_ZONES} 个不同的 OBJECTID，"
+                             f"实际为 {len(np.unique(record_ids))}")
+        ring_zone = record_ids[ring_record]
+
+        # 环内相邻顶点构成的边（环首尾相同，跨环的点对不算）
+        point_ring = np.repeat(np.arange(len(ring_zone)), np.diff(ring_offsets))
+        edge_start = np.flatnonzero(point_ring[:-1] == point_ring[1:])
+        edge_zone = ring_zone[point_ring[edge_start]]
+
+        # 按面积加权的质心 - 在平面坐标上用鞋带公式；带符号面积使内环自动扣除，
+        # 一条记录的多个多边形也直接合并
+        x0, y0 = x[edge_start], y[edge_start]
+        x1, y1 = x[edge_start + 1], y[edge_start + 1]
+        cross = x0 * y1 - x1 * y0
+        size = int(record_ids.max()) + 1
+        area = np.bincount(edge_zone, weights=cross, minlength=size) / 2
+        cx = np.bincount(edge_zone, weights=(x0 + x1) * cross, minlength=size)
+        cy = np.bincount(edge_zone, weights=(y0 + y1) * cross, minlength=size)
+
+        location_id = np.unique(record_ids)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            centroid_x = cx[location_id] / (6 * area[location_id])
+            centroid_y = cy[location_id] / (6 * area[location_id])
+        longitude, latitude = state_plane_to_lonlat(centroid_x, centroid_y)
+
+        vertex_lon, vertex_lat = state_plane_to_lonlat(x, y)
+        bbox = np.empty((size, 4))
+        bbox[:, :2] = np.inf
+        bbox[:, 2:] = -np.inf
+        point_zone = ring_zone[point_ring]
+        np.minimum.at(bbox[:, 0], point_zone, vertex_lon)
+        np.minimum.at(bbox[:, 1], point_zone, vertex_lat)
+        np.maximum.at(bbox[:, 2], point_zone, vertex_lon)
+        np.maximum.at(bbox[:, 3], point_zone, vertex_lat)
+
+        # 每个区域ID恰好一条记录，按ID排序即与 location_id 对齐
+        first = np.argsort(record_ids)
+        geometry = cls(
+            location_id=location_id.astype(np.int16),
+            borough=attributes["borough"].to_numpy(dtype=str)[first],
+            zone_name=attributes["zone"].to_numpy(dtype=str)[first],
+            latitude=latitude,
+            longitude=longitude,
+            bbox=bbox[location_id],
+            vertex_lon=vertex_lon,
+            vertex_lat=vertex_lat,
+            ring_offsets=ring_offsets,
+            ring_zone=ring_zone.astype(np.int16),
+            source=_source_fingerprint(zip_path),
+        )
+        geometry.grid_zone, geometry.grid_extent = geometry._rasterize()
+        return geometry
+
+    def save(self, path):
+        """保存为未压缩的 .npz（只含数值和定长字符串数组，读取无需 pickle）"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(f, **{name: getattr(self, name) for name in self.FIELDS})
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(**{name: data[name] for name in cls.FIELDS})
+
+    def __len__(self):
+        return len(self.location_id)
+
+    def to_frame(self):
+        """区域表：location_id, borough, zone_name, latitude, longitude（质心）"""
+        return pd.DataFrame({
+            "location_id": self.location_id.astype(np.int64),
+            "borough": self.borough,
+            "zone_name": self.zone_name,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+        })
+
+    def _build_edges(self):
+        """按区域分组的边数组，供 locate() 使用"""
+        point_ring = np.repeat(np.arange(len(self.ring_zone)), np.diff(self.ring_offsets))
+        edge_start = np.flatnonzero(point_ring[:-1] == point_ring[1:])
+        edge_zone = self.ring_zone[point_ring[edge_start]]
+        order = np.argsort(edge_zone, kind="stable")
+        edge_start, edge_zone = edge_start[order], edge_zone[order]
+        self._edges = (self.vertex_lon[edge_start], self.vertex_lat[edge_start],
+                       self.vertex_lon[edge_start + 1], self.vertex_lat[edge_start + 1])
+        self._edge_bounds = np.searchsorted(edge_zone, np.stack([self.location_id, self.location_id + 1]))
+
+    @staticmethod
+    def _cells(extent, lat, lon):
+        """点所在的网格行、列，以及是否落在网格范围内"""
+        min_lon, min_lat, max_lon, max_lat = extent
+        col = np.floor((lon - min_lon) / (max_lon - min_lon) * GRID_SIZE)
+        row = np.floor((lat - min_lat) / (max_lat - min_lat) * GRID_SIZE)
+        inside = (col >= 0) & (col < GRID_SIZE) & (row >= 0) & (row < GRID_SIZE)
+        return np.where(inside, row, 0).astype(np.intp), np.where(inside, col, 0).astype(np.intp), inside
+
+    def _rasterize(self):
+        """查找网格：被边界穿过的格子记为 BOUNDARY_CELL，其余格子整格属于同一区域（或不属于任何区域）"""
+        extent = np.array([self.vertex_lon.min(), self.vertex_lat.min(),
+                           self.vertex_lon.max(), self.vertex_lat.max()])
+        cell_lon = (extent[2] - extent[0]) / GRID_SIZE
+        cell_lat = (extent[3] - extent[1]) / GRID_SIZE
+
+        # 沿每条边按不超过半个格子的步长采样，标记经过的格子
+        x0, y0, x1, y1 = self._edges
+        steps = np.ceil(np.maximum(np.abs(x1 - x0) / cell_lon, np.abs(y1 - y0) / cell_lat) * 2).astype(np.intp) + 1
+        edge = np.repeat(np.arange(len(x0)), steps)
+        fraction = (np.arange(len(edge)) - np.repeat(np.cumsum(steps) - steps, steps)) / np.repeat(steps - 1, steps).clip(1)
+        row, col, _ = self._cells(extent, y0[edge] + (y1 - y0)[edge] * fraction,
+                                  x0[edge] + (x1 - x0)[edge] * fraction)
+        boundary = np.zeros((GRID_SIZE, GRID_SIZE), dtype=bool)
+        boundary[row, col] = True
+        # 采样可能漏掉边只擦过一角的格子，它们都与已标记的格子相邻：向外扩一格
+        padded = np.pad(boundary, 1)
+        boundary = np.logical_or.reduce([padded[1 + dr:GRID_SIZE + 1 + dr, 1 + dc:GRID_SIZE + 1 + dc]
+                                         for dr in (-1, 0, 1) for dc in (-1, 0, 1)])
+        # 范围上界的点落在最后一格之外，它们所在的边缘格子同样视为边界
+        boundary[-1, :] = boundary[:, -1] = True
+
+        grid = np.full((GRID_SIZE, GRID_SIZE), BOUNDARY_CELL, dtype=np.int16)
+        rows, cols = np.nonzero(~boundary)
+        grid[rows, cols] = self._locate_exact(extent[1] + (rows + 0.5) * cell_lat,
+                                              extent[0] + (cols + 0.5) * cell_lon)
+        return grid, extent
+
+    def locate(self, latitude, longitude):
+        """点所在的区域ID数组（不在任何区域内时为0）"""
+        lat = np.asarray(latitude, dtype="float64")
+        lon = np.asarray(longitude, dtype="float64")
+        row, col, in_grid = self._cells(self.grid_extent, lat, lon)
+        result = np.where(in_grid, self.grid_zone[row, col], 0).astype(np.int64)
+
+        exact = result == BOUNDARY_CELL
+        result[exact] = self._locate_exact(lat[exact], lon[exact])
+        return result
+
+    def _locate_exact(self, lat, lon):
+        """逐区域的射线法判断（外包框预筛选）"""
+        result = np.zeros(lat.shape, dtype=np.int64)
+        x0, y0, x1, y1 = self._edges
+
+        for i, zone in enumerate(self.location_id):
+            min_lon, min_lat, max_lon, max_lat = self.bbox[i]
+            candidates = np.flatnonzero((result == 0) & (lon >= min_lon) & (lon <= max_lon) &
+                                        (lat >= min_lat) & (lat <= max_lat))
+            if len(candidates) == 0:
+                continue
+            start, stop = self._edge_bounds[:, i]
+            ex0, ey0, ex1, ey1 = (a[start:stop, None] for a in (x0, y0, x1, y1))
+            block = max(1, LOCATE_BLOCK // max(stop - start, 1))
+            for j in range(0, len(candidates), block):
+                points = candidates[j:j + block]
+                px, py = lon[points], lat[points]
+                # 射线法：向 +经度方向的射线与边相交次数为奇数则在区域内
+                straddles = (ey0 > py) != (ey1 > py)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    crossing_x = ex0 + (py - ey0) * (ex1 - ex0) / (ey1 - ey0)
+                inside = (np.count_nonzero(straddles & (px < crossing_x), axis=0) % 2) == 1
+                result[points[inside]] = zone
+        return result
+
+
+def load_zone_geometry(zip_path, cache_path):
+    """读取区域几何 - 缓存存在且源文件指纹一致时直接加载，否则解析 Shapefile 并写缓存"""
+    cache_path = Path(cache_path)
+    if cache_path.exists():
+        try:
+            geometry = ZoneGeometry.load(cache_path)
+            if np.array_equal(geometry.source, _source_fingerprint(zip_path)):
+                return geometry
+        except (OSError, KeyError, ValueError):
+            pass
+
+    geometry = ZoneGeometry.from_shapefile(zip_path)
+    geometry.save(cache_path)
+    return geometry
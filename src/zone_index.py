@@ -0,0 +1,82 @@
+"""
+区域查找索引 - 以区域ID为下标的列数组
+
+taxi_zones_processed 表转换成按 location_id 直接下标的数组（纬度、经度、
+行政区编码、区域名称）。按一组区域ID查询只是一次数组取值，不需要逐行构建
+Python 字典，也不需要每次都和热点表做 merge；管道和仪表板共用同一份索引。
+"""
+import numpy as np
+import pandas as pd
+
+
+class ZoneIndex:
+    def __init__(self, zones_df):
+        """zones_df: 至少包含 location_id, latitude, longitude（borough, zone_name 可选）"""
+        ids = pd.to_numeric(zones_df["location_id"], errors="coerce").to_numpy(dtype="float64")
+        valid = ~np.isnan(ids) & (ids >= 0)
+        ids = ids[valid].astype(np.intp)
+        size = int(ids.max()) + 1 if len(ids) else 0
+
+        self.present = np.zeros(size, dtype=bool)
+        self.present[ids] = True
+        self.latitude = np.full(size, np.nan)
+        self.latitude[ids] = zones_df["latitude"].to_numpy(dtype="float64")[valid]
+        self.longitude = np.full(size, np.nan)
+        self.longitude[ids] = zones_df["longitude"].to_numpy(dtype="float64")[valid]
+
+        # 行政区用小整数编码（-1 表示未知），名称只存一份
+        if "borough" in zones_df.columns:
+            codes, boroughs = pd.factorize(zones_df["borough"].to_numpy()[valid])
+        else:
+            codes, boroughs = np.full(len(ids), -1), []
+        self.boroughs = tuple(str(b) for b in boroughs)
+        self.borough_code = np.full(size, -1, dtype=np.int8)
+        self.borough_code[ids] = codes
+
+        self.zone_name = np.array([f"Zone_{i}" for i in range(size)], dtype=object)
+        if "zone_name" in zones_df.columns:
+            names = zones_df["zone_name"].to_numpy(dtype=object)[valid]
+            known = pd.notna(names)
+            self.zone_name[ids[known]] = names[known]
+
+    def __len__(self):
+        return int(self.present.sum())
+
+    @property
+    def location_ids(self):
+        return np.flatnonzero(self.present)
+
+    def _positions(self, location_ids):
+        """区域ID数组 -> (下标数组, 是否已知)，超出范围或缺失的ID视为未知"""
+        ids = np.asarray(location_ids, dtype="float64")
+        known = ~np.isnan(ids) & (ids >= 0) & (ids < len(self.present))
+        positions = np.where(known, ids, 0).astype(np.intp)
+        known &= self.present[positions]
+        return positions, known
+
+    def lookup(self, location_ids):
+        """按区域ID数组查询，返回同长度的 latitude, longitude, borough, zone_name 表
+
+        未知区域的坐标为NaN，行政区为 "Unknown"。
+        """
+        positions, known = self._positions(location_ids)
+        codes = np.where(known, self.borough_code[positions], -1)
+        borough_names = np.array(self.boroughs + ("Unknown",), dtype=object)
+        return pd.DataFrame({
+            "latitude": np.where(known, self.latitude[positions], np.nan),
+            "longitude": np.where(known, self.longitude[positions], np.nan),
+            "borough": borough_names[codes],
+            "zone_name": np.where(known, self.zone_name[positions], None),
+        })
+
+    def ids_in_boroughs(self, boroughs):
+        """属于给定行政区的所有区域ID（升序）"""
+        codes = [self.boroughs.index(b) for b in boroughs if b in self.boroughs]
+        return np.flatnonzero(self.present & np.isin(self.borough_code, codes))
+
+    def to_frame(self):
+        """所有已知区域：location_id, latitude, longitude, borough, zone_name"""
+        ids = self.location_ids
+        frame = self.lookup(ids)
+        frame.insert(0, "location_id", ids)
+        return frame
@@ -0,0 +1,54 @@
+"""
+Spark 聚类阶段测试 - 预测结果沿同一血缘追加在原始行上，每个清洗后的行程恰好一个聚类
+
+需要 pyspark 和 Java，缺少时跳过。
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.append(str(project_root))
+
+from src.run_pipeline import spark_available
+from src.synthetic_trips import write_trips
+
+pytestmark = pytest.mark.skipif(not spark_available(), reason="需要 pyspark 和 Java")
+
+N_ROWS = 20_000
+
+
+@pytest.fixture(scope="module")
+def processor(tmp_path_factory):
+    from src.spark_advanced_processor import AdvancedNYCDataProcessor
+
+    processor = AdvancedNYCDataProcessor(app_name="NYCTaxiClusteringTest", master="local[2]")
+    # 模型写到临时目录，不复用也不覆盖项目里已保存的模型
+    processor.model_dir = tmp_path_factory.mktemp("models")
+    yield processor
+    processor._unpersist_all()
+    processor.spark.stop()
+
+
+@pytest.fixture(scope="module")
+def cleaned(processor, tmp_path_factory):
+    data_path = write_trips(tmp_path_factory.mktemp("data") / "trips.parquet", N_ROWS, seed=7)
+    return processor.preprocess_data(processor._read_data_files([data_path]))
+
+
+@pytest.mark.parametrize("sample_fraction", [None, 0.2])
+def test_cluster_counts_cover_every_cleaned_trip(processor, cleaned, sample_fraction):
+    results = processor.analyze_advanced_metrics(cleaned, sample_fraction=sample_fraction, retrain=True)
+
+    cluster_stats = results["cluster_stats"].toPandas()
+    assert int(cluster_stats["trip_count"].sum()) == processor.metrics["cleaned_rows"]
+    assert results["df_clustered"].count() == processor.metrics["cleaned_rows"]
+    # 原始列保留，预测直接追加（没有按行号join）
+    assert set(cleaned.columns) < set(results["df_clustered"].columns)
+
+
+@pytest.mark.parametrize("sample_fraction", [0, -0.1, 1.5])
+def test_sample_fraction_outside_unit_interval_is_rejected(processor, cleaned, sample_fraction):
+    with pytest.raises(ValueError):
+        processor.analyze_advanced_metrics(cleaned, sample_fraction=sample_fraction, retrain=True)